@@ -42,6 +42,19 @@ class PackageGetA(Pulse2Api):
             self.logger.error("getAllPackages %s"%(str(e)))
             return [{'label':'A', 'version':'0', 'ERR':'PULSE2ERROR_GETALLPACKAGE', 'mirror':self.server_addr.replace(self.credentials, '')}]
 
+    def getAllPackagesSince(self, version):
+        """
+        Get the packages if they changed since the catalog version
+        returned by a previous call, version being -1 the first time.
+        """
+        try:
+            d = self.callRemote("getAllPackagesSince", version)
+            d.addErrback(self.onError, "getAllPackagesSince", version, {'version': -1, 'changed': False, 'ERR': 'PULSE2ERROR_GETALLPACKAGE'})
+            return d
+        except Exception, e:
+            self.logger.error("getAllPackagesSince %s"%(str(e)))
+            return {'version': -1, 'changed': False, 'ERR': 'PULSE2ERROR_GETALLPACKAGE'}
+
     def getAllPendingPackages(self, mirror = None):
         try:
             d = self.callRemote("getAllPendingPackages", mirror)
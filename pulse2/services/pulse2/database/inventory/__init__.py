@@ -33,6 +33,7 @@ from mmc.database.utilities import unique, handle_deconnect
 from mmc.database.utilities import DbObject # pyflakes.ignore
 from mmc.database.database_helper import DatabaseHelper, DBObj # pyflakes.ignore
 from pulse2.database.inventory.mapping import OcsMapping
+from pulse2.database.inventory.rows import RowCache, rowKey
 from pulse2.utils import same_network, Singleton, isUUID
 
 from sqlalchemy import and_, create_engine, MetaData, Table, Column, \
@@ -41,8 +42,10 @@ from sqlalchemy.orm import create_session, mapper
 import sqlalchemy.databases
 
 import datetime
+import hashlib
 import re
 import logging
+from threading import Lock
 
 MAX_REQ_NUM = 100
 
@@ -2475,6 +2478,15 @@ class InventoryCreator(Inventory):
             self.ctx = InventoryContext()
             self.ctx.userid = 'root'
 
+    def activate(self, config):
+        # ids of the rows of the inventory parts tables
+        self.rows = RowCache(config.inventory_rows_cache)
+        # {machine id: (last inventory id, digests of its parts)},
+        # shared by the inventory treating threads
+        self.digests = {}
+        self.digests_lock = Lock()
+        return Inventory.activate(self, config)
+
     def createNewInventory(self, hostname, inventory, date, setLastFlag = True):
         """
         Add a new inventory for a computer
@@ -2518,30 +2530,14 @@ class InventoryCreator(Inventory):
                 session.add(m)
 
 
-            if machine_exists :
-                if setLastFlag:
-                    result = session.query(InventoryTable).\
-                            select_from(self.inventory.join(self.table['hasEntity']).join(self.machine)).\
-                            filter(self.machine.c.id == fromUUID(machine_uuid))
-
-                    for inv in result:
-                        inv.Last = 0
-                        session.add(inv)
-
-            # Create a new empty inventory, and flag it as the last
-            i = InventoryTable()
-            i.Date, i.Time = date
-            i.Last = setLastFlag and 1 or 0
-            session.add(i)
-            session.flush()
-
             inventory = InventoryNetworkComplete(inventory).get()
 
-            # Loop on all inventory parts
+            # Look up the rows of all inventory parts
+            links = {}
+            failed = []
             for table, entries_list in inventory.items():
                 # table: bios, controller, etc.
                 # content: list of entries
-                tname = table.lower()
 
                 # This part of inventory is empty, so skip it
                 if len(entries_list) == 0:
@@ -2550,102 +2546,68 @@ class InventoryCreator(Inventory):
                 if "has" + table not in self.klass or table not in self.table :
                     continue
 
-                klass = self.klass[table]
-                hasKlass = self.klass['has'+table]
-                hasTable = self.table['has'+table]
-
-                hasTable.insert()
-                # keep track of already inserted datas for this table
-                already_inserted = []
-                # loop on all inventory part columns
-                for entry in entries_list:
-                    # skip if empty
-                    if len(entry) == 0:
-                        continue
-                    try:
-                        trunc_entry = {}
-                        # Check if the length of fields is big enough to put the data
-                        for field in entry:
-                            trunc_entry[field] = entry[field]
-
-                            if isinstance(field,str) and  hasattr(klass, field):
-                                attr = getattr(klass, field)
-
-                                if isinstance(attr, sqlalchemy.types.Integer):
-                                    try:
-                                        int(entry[field])
-                                    except ValueError:
-                                        logging.getLogger().warning("The field %s of the table %s is going to be set to ZERO, please report to us." % (field, table))
-                                        logging.getLogger().debug("The value |%s| become |0|" % (entry[field]))
-                                        trunc_entry[field] = '0'
-                                if hasattr(attr, 'length'):
-                                    length = attr.length
-                                    if len(entry[field]) >= length:
-                                        logging.getLogger().warning("The field %s of the table %s is going to be truncated at %s chars, please report to us."%(field, table, length))
-                                        logging.getLogger().debug("The value |%s| become |%s|"%(entry[field], entry[field][0:length]))
-                                        trunc_entry[field] = entry[field][0:length]
-
-                        # Look up these columns in the inventory table
-                        id = self.getIdInTable(table, trunc_entry, session)
-                        # Create them if none found
-                        if id == None:
-                            k = klass()
-                            for field in trunc_entry:
-                                if type(field) == str or type(field) == unicode:
-                                    setattr(k, field, trunc_entry[field])
-                            session.add(k)
-                            # Immediately flush this new row, because we need an
-                            # id
-                            session.flush([k])
-                            id = k.id
-
-                        nids = {}
-                        if OcsMapping().nomenclatures.has_key(table):
-                            for nom in OcsMapping().nomenclatures[table]:
-                                nomName = 'nom%s%s' % (table, nom)
-                                nomKlass = self.klass[nomName]
-
-                                new_entry = {}
-                                for field in entry:
-                                    if type(field) == tuple and field[0] == nomName:
-                                        new_entry[field[1]] = entry[field]
-
-                                nid = self.getIdInTable(nomName, new_entry, session)
-                                if nid == None:
-                                    n = nomKlass()
-                                    for field in new_entry:
-                                        setattr(n, field, new_entry[field])
-                                    session.add(n)
-                                    # Immediately flush this new row, because
-                                    # we need an id
-                                    session.flush([n])
-                                    nid = n.id
-                                nids[nom] = nid
-                        # closes if block
-
-                        params = {'machine':m.id, 'inventory':i.id, tname:id}
-                        if len(nids.keys()) > 0:
-                            for nom in nids:
-                                params[nom.lower()] = nids[nom]
-                        if params not in already_inserted:
-                            # Prepare insertion in the 'has' table
-                            hk = hasKlass()
-                            for attr, value in params.items():
-                                setattr(hk, attr, value)
-                            # We will flush the new rows for the 'has' tables
-                            # at the end, because it's faster to do it in one
-                            # shot
-                            session.add(hk)
-                            already_inserted.append(params)
-                    except UnicodeDecodeError, e: # just for test
-                        pass
-                    except Exception, e:
-                        logging.getLogger().exception(e)
-                        pass
-                # closes for block
+                try:
+                    links[table] = self._getPartLinks(table, entries_list, session)
+                except UnicodeDecodeError, e: # just for test
+                    failed.append(table)
+                except Exception, e:
+                    logging.getLogger().exception(e)
+                    failed.append(table)
             # closes for block on inventory parts
+            digests = self._digestLinks(links)
+
+            last = None
+            if failed:
+                # a failed part has no digest and could look unchanged
+                logging.getLogger().warn("Inventory of %s: parts %s failed, stored in full" % (hostname, ', '.join(failed)))
+            elif machine_exists and setLastFlag and self.config.inventory_diff_storage:
+                last = self._getLastInventory(m.id, session)
+            if last is not None and self._getInventoryDigests(m.id, last.id, session) == digests:
+                # Nothing changed since the last inventory, only its date
+                # is updated
+                last.Date, last.Time = date
+                session.add(last)
+                i = last
+                logging.getLogger().info("Inventory of %s unchanged since inventory %d, date updated" % (hostname, last.id))
+            else:
+                if machine_exists :
+                    if setLastFlag:
+                        result = session.query(InventoryTable).\
+                                select_from(self.inventory.join(self.table['hasEntity']).join(self.machine)).\
+                                filter(self.machine.c.id == fromUUID(machine_uuid))
+
+                        for inv in result:
+                            inv.Last = 0
+                            session.add(inv)
+
+                # Create a new empty inventory, and flag it as the last
+                i = InventoryTable()
+                i.Date, i.Time = date
+                i.Last = setLastFlag and 1 or 0
+                session.add(i)
+                session.flush()
+
+                # Insert the rows of the 'has' tables, in one shot by part
+                for table, part_links in links.items():
+                    if len(part_links) == 0:
+                        continue
+                    rows = []
+                    for params in part_links:
+                        row = {'machine':m.id, 'inventory':i.id}
+                        row.update(params)
+                        rows.append(row)
+                    session.execute(self.table['has'+table].insert(), rows)
             session.flush()
             session.commit()
+            if setLastFlag:
+                self.digests_lock.acquire()
+                try:
+                    # keep the digests of the newest inventory
+                    cached = self.digests.get(m.id)
+                    if cached is None or cached[0] <= i.id:
+                        self.digests[m.id] = (i.id, digests)
+                finally:
+                    self.digests_lock.release()
         except Exception, e:
             session.rollback()
             session.close()
@@ -2658,6 +2620,268 @@ class InventoryCreator(Inventory):
 
         return True
 
+    def _getPartLinks(self, table, entries_list, session):
+        """
+        Get the rows of the 'has' table of an inventory part, creating the
+        rows of the part and of its nomenclatures if missing.
+
+        @param table: name of inventory part
+        @type table: str
+
+        @param entries_list: entries of inventory part
+        @type entries_list: list
+
+        @return: {column: id} of each row, without the machine and the
+                 inventory
+        @rtype: list
+        """
+        tname = table.lower()
+        klass = self.klass[table]
+        entries = []
+        for entry in entries_list:
+            # skip if empty
+            if len(entry) == 0:
+                continue
+            entries.append((entry, self._truncEntry(table, klass, entry)))
+
+        # Look up the rows of this part in one shot, creating
+        # the missing ones
+        ids = self.getIdsInTable(table, [e[1] for e in entries], session)
+        nids = {}
+        if OcsMapping().nomenclatures.has_key(table):
+            for nom in OcsMapping().nomenclatures[table]:
+                nomName = 'nom%s%s' % (table, nom)
+                new_entries = []
+                for entry, trunc_entry in entries:
+                    new_entry = {nom: None}
+                    for field in entry:
+                        if type(field) == tuple and field[0] == nomName:
+                            new_entry[field[1]] = entry[field]
+                    new_entries.append(new_entry)
+                nids[nom] = self.getIdsInTable(nomName, new_entries, session)
+
+        # keep track of already inserted datas for this table
+        already_inserted = set()
+        links = []
+        for n in range(len(entries)):
+            if ids[n] is None:
+                continue
+            params = {tname:ids[n]}
+            for nom in nids:
+                params[nom.lower()] = nids[nom][n]
+            if None in params.values():
+                continue
+            key = tuple(sorted(params.items()))
+            if key not in already_inserted:
+                links.append(params)
+                already_inserted.add(key)
+        return links
+
+    def _digestLinks(self, links):
+        """
+        @param links: rows of the 'has' tables by part, without the machine
+                      and the inventory
+        @type links: dict
+
+        @return: digest of the rows of each non empty part
+        @rtype: dict
+        """
+        digests = {}
+        for table, part_links in links.items():
+            if len(part_links) == 0:
+                continue
+            rows = [tuple(sorted([(str(column), int(id)) for column, id in params.items()])) for params in part_links]
+            rows = list(set(rows))
+            rows.sort()
+            digests[str(table)] = hashlib.md5(repr(rows)).hexdigest()
+        return digests
+
+    def _getLastInventory(self, machine_id, session):
+        """
+        @return: last inventory of machine, None if none
+        @rtype: InventoryTable
+        """
+        return session.query(InventoryTable).\
+                select_from(self.inventory.join(self.table['hasEntity']).join(self.machine)).\
+                filter(self.machine.c.id == machine_id).\
+                filter(self.inventory.c.Last == 1).\
+                order_by(desc(self.inventory.c.id)).first()
+
+    def _getInventoryDigests(self, machine_id, inventory_id, session):
+        """
+        Get the digests of the parts of an inventory, from the ones kept
+        when it was stored or from its 'has' tables rows.
+
+        @return: digest of the rows of each non empty part
+        @rtype: dict
+        """
+        self.digests_lock.acquire()
+        try:
+            cached = self.digests.get(machine_id)
+        finally:
+            self.digests_lock.release()
+        if cached is not None and cached[0] == inventory_id:
+            return cached[1]
+        links = {}
+        for table in self.config.getInventoryParts():
+            if not "has" + table in self.table:
+                continue
+            hasTable = self.table['has'+table]
+            query = hasTable.select(and_(hasTable.c.machine == machine_id,
+                                         hasTable.c.inventory == inventory_id))
+            links[table] = []
+            for row in session.execute(query):
+                params = dict(zip(row.keys(), row))
+                del params['machine']
+                del params['inventory']
+                links[table].append(params)
+        return self._digestLinks(links)
+
+    def _truncEntry(self, table, klass, entry):
+        """
+        Check if the length of fields is big enough to put the data
+
+        @return: entry with its values fitting in their columns
+        @rtype: dict
+        """
+        trunc_entry = {}
+        for field in entry:
+            trunc_entry[field] = entry[field]
+
+            if isinstance(field,str) and  hasattr(klass, field):
+                attr = getattr(klass, field)
+
+                if isinstance(attr, sqlalchemy.types.Integer):
+                    try:
+                        int(entry[field])
+                    except ValueError:
+                        logging.getLogger().warning("The field %s of the table %s is going to be set to ZERO, please report to us." % (field, table))
+                        logging.getLogger().debug("The value |%s| become |0|" % (entry[field]))
+                        trunc_entry[field] = '0'
+                if hasattr(attr, 'length'):
+                    length = attr.length
+                    if len(entry[field]) >= length:
+                        logging.getLogger().warning("The field %s of the table %s is going to be truncated at %s chars, please report to us."%(field, table, length))
+                        logging.getLogger().debug("The value |%s| become |%s|"%(entry[field], entry[field][0:length]))
+                        trunc_entry[field] = entry[field][0:length]
+        return trunc_entry
+
+    def getIdsInTable(self, tableName, rows, session):
+        """
+        Get the ids of rows, as getIdInTable does for one row, creating the
+        missing rows.
+
+        The rows are looked up in the cache of known rows, then in the
+        database by chunks of MAX_REQ_NUM rows. The missing rows are
+        inserted in one shot.
+
+        @param tableName: name of inventory part or nomenclature table
+        @type tableName: str
+
+        @param rows: column values of each row
+        @type rows: list
+
+        @return: id of each row, None if it has no value to look for
+        @rtype: list
+        """
+        table = self.table[tableName]
+        ids = [None] * len(rows)
+        # {row key: values} of the rows to look for, and their indexes
+        conditions = {}
+        indexes = {}
+        for n in range(len(rows)):
+            values = {}
+            for field, value in rows[n].items():
+                if (type(field) == str or type(field) == unicode) and hasattr(table.c, field):
+                    values[field] = value
+            if len(values) == 0:
+                continue
+            key = rowKey(values)
+            ids[n] = self.rows.get(tableName, key)
+            if ids[n] is None:
+                conditions[key] = values
+                indexes.setdefault(key, []).append(n)
+        if len(conditions) == 0:
+            return ids
+
+        found, uncertain = self._lookupRows(table, conditions, session)
+        missing = [k for k in conditions if k not in found]
+        for key in missing:
+            if key in uncertain:
+                # the database may match it in its own way
+                id = self._getIdByValues(table, conditions[key], session)
+                if id is not None:
+                    found[key] = id
+        missing = [k for k in missing if k not in found]
+        if len(missing) > 0:
+            # rows with the same columns are inserted in one statement
+            by_columns = {}
+            for key in missing:
+                by_columns.setdefault(tuple(sorted(conditions[key].keys())), []).append(conditions[key])
+            for values in by_columns.values():
+                session.execute(table.insert(), values)
+            inserted = dict([(key, conditions[key]) for key in missing])
+            found.update(self._lookupRows(table, inserted, session)[0])
+            for key in missing:
+                if key not in found:
+                    # the database has changed the values of the row
+                    found[key] = self._getIdByValues(table, conditions[key], session)
+
+        for key, id in found.items():
+            if id is None:
+                continue
+            self.rows.set(tableName, key, id)
+            for n in indexes[key]:
+                ids[n] = id
+        return ids
+
+    def _lookupRows(self, table, conditions, session):
+        """
+        Look up rows in the database, by chunks of MAX_REQ_NUM rows.
+
+        @param conditions: {row key: values} of the rows
+        @type conditions: dict
+
+        @return: {row key: id} of found rows, and the keys of the rows
+                 whose chunk returned rows matching no key
+        @rtype: tuple
+        """
+        found = {}
+        uncertain = set()
+        keys = conditions.keys()
+        for start in range(0, len(keys), MAX_REQ_NUM):
+            chunk = keys[start:start + MAX_REQ_NUM]
+            columns = set([tuple(conditions[key].keys()) for key in chunk])
+            clauses = []
+            for key in chunk:
+                clauses.append(and_(*[getattr(table.c, field) == value for field, value in conditions[key].items()]))
+            unmatched = False
+            for row in session.execute(table.select(or_(*clauses)).order_by(table.c.id)):
+                row = dict(zip(row.keys(), row))
+                matched = False
+                for fields in columns:
+                    key = rowKey(row, fields)
+                    if key in conditions:
+                        matched = True
+                        if key not in found:
+                            found[key] = row['id']
+                if not matched:
+                    unmatched = True
+            if unmatched:
+                uncertain.update(chunk)
+        return (found, uncertain)
+
+    def _getIdByValues(self, table, values, session):
+        """
+        @return: id of the first row having these values, None if not found
+        @rtype: int
+        """
+        query = table.select(and_(*[getattr(table.c, field) == value for field, value in values.items()]))
+        row = session.execute(query.order_by(table.c.id).limit(1)).fetchone()
+        if row is None:
+            return None
+        return row['id']
+
 
 # TODO - Get this info on the PXE client side !
 class InventoryNetworkComplete :
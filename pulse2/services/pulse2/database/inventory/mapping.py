@@ -25,33 +25,130 @@
 """
 Contains main method to parse OCS Inventory XML string, and to map all XML
 data to a Python dict.
+
+The inventory is read in one pass by expat, the mapped fields being
+collected while the XML is read: no DOM tree of the inventory is built.
 """
 
 import logging
 
-from xml.dom.minidom import parse, parseString
+from xml.dom.minidom import parse
 from xml.parsers import expat
-from xml.dom.expatbuilder import ExpatBuilderNS
 
 from pulse2.utils import Singleton
 
+# encodings enforced when the inventory does not match its declared one
+FALLBACK_ENCODINGS = ['ISO-8859-1', 'UTF-8']
+
 
-class EncodingSafeParser(ExpatBuilderNS):
+class InventoryHandler:
 
     """
-    Class that returns an Expat parser which parsing encoding option can be
-    enforced.
+    Expat callbacks building the inventory dict.
+
+    As with the DOM, the value of a field is the first text of the first
+    element of this name in the table element, and the tables are searched
+    at any depth.
     """
 
-    def setEncoding(self, encoding):
+    def __init__(self, tables, scope = None):
+        """
+        @param tables: mapped tables, as OcsMapping.tables
+        @type tables: dict
+
+        @param scope: name of the element holding the tables, None to search
+                      them in the whole document
+        @type scope: str
         """
-        Allow to force parser encoding
+        self.tables = tables
+        self.in_scope = scope is None
+        self.scope = scope
+        self.scope_found = False
+        self.depth = 0
+        self.inventory = {}
+        for tablename in tables:
+            self.inventory[tables[tablename][0]] = []
+        # first texts of LOGDATE and TAG elements
+        self.metadata = {}
+        self.metadata_seen = set()
+        # open table elements: [table name, depth, {field: text}, seen fields]
+        self.entries = []
+        # elements whose first text is read: [values, name, depth, chunks]
+        self.captures = []
+
+    def _capture(self, values, seen, name):
+        if not name in seen:
+            seen.add(name)
+            self.captures.append([values, name, self.depth, []])
+
+    def _closeCaptures(self, ended):
         """
-        self.encoding = encoding
+        Stores the text read for the open captures.
 
-    def createParser(self):
-        """Create a new parser object."""
-        return expat.ParserCreate(self.encoding)
+        @param ended: True if the captured element ends, False if one of its
+                      children starts
+        """
+        remaining = []
+        for capture in self.captures:
+            values, name, depth, chunks = capture
+            if ended and depth != self.depth:
+                remaining.append(capture)
+                continue
+            if chunks:
+                values[name] = ''.join(chunks)
+            elif not ended:
+                # the first child is an element, like childNodes[0].nodeValue
+                values[name] = None
+        self.captures = remaining
+
+    def start(self, name, attrs):
+        if self.captures:
+            self._closeCaptures(False)
+        self.depth += 1
+        if name == self.scope and not self.scope_found:
+            self.scope_found = True
+            self.in_scope = True
+            self.scope_depth = self.depth
+        if name in ('LOGDATE', 'TAG'):
+            self._capture(self.metadata, self.metadata_seen, name)
+        for entry in self.entries:
+            if name in entry[3]:
+                continue
+            if name in self.tables[entry[0]][1] or \
+               (entry[0] == u'NETWORKS' and name in ('DESCRIPTION', 'IPADDRESS')):
+                self._capture(entry[2], entry[3], name)
+        if self.in_scope and name in self.tables:
+            self.entries.append([name, self.depth, {}, set()])
+
+    def data(self, text):
+        for capture in self.captures:
+            capture[3].append(text)
+
+    def end(self, name):
+        if self.captures:
+            self._closeCaptures(True)
+        if self.entries and self.entries[-1][1] == self.depth:
+            self._endEntry(*self.entries.pop()[:3])
+        if self.scope is not None and self.in_scope and name == self.scope \
+           and self.depth == self.scope_depth:
+            self.in_scope = False
+        self.depth -= 1
+
+    def _endEntry(self, tablename, depth, values):
+        if tablename == u'NETWORKS':
+            # Skip lo interface and network device with a 127.x.x.x
+            # address.
+            netif = values.get('DESCRIPTION') or ''
+            ip = values.get('IPADDRESS') or ''
+            if netif == 'lo' or ip.startswith('127.'):
+                logging.getLogger().debug('Skipping computer local interface from inventory')
+                return
+        dbtablename, fields = self.tables[tablename]
+        entry = {}
+        for fieldname, dbfieldname in fields.items():
+            if fieldname in values:
+                entry[dbfieldname] = values[fieldname]
+        self.inventory[dbtablename].append(entry)
 
 
 class OcsMapping(Singleton):
@@ -77,85 +174,56 @@ class OcsMapping(Singleton):
                         self.nomenclatures[xmlclass] = {}
                     self.nomenclatures[xmlclass][xmlto] = True
 
-    def parseSafe(self, xmlstring):
+    def _parse(self, xmltext, scope = None):
         """
-        Try to parse the file with other encodings
+        Reads the XML string, trying other encodings if the declared one
+        does not match its content.
+
+        @return: handler holding the inventory
+        @rtype: InventoryHandler
         """
-        xml = None
-        for encoding in ['ISO-8859-1', 'UTF-8']:
-            self.logger.info('Trying to parse with enforced %s encoding'
-                             % encoding)
+        self.logger = logging.getLogger()
+        for encoding in [None] + FALLBACK_ENCODINGS:
+            if encoding is not None:
+                self.logger.info('Trying to parse with enforced %s encoding'
+                                 % encoding)
+            handler = InventoryHandler(self.tables, scope)
+            parser = expat.ParserCreate(encoding)
+            parser.buffer_text = True
+            parser.StartElementHandler = handler.start
+            parser.EndElementHandler = handler.end
+            parser.CharacterDataHandler = handler.data
             try:
-                builder = EncodingSafeParser()
-                builder.setEncoding(encoding)
-                xml = builder.parseString(xmlstring)
-                self.logger.info('String successfully parsed')
-                # Exit for loop if success
-                break
+                parser.Parse(xmltext, True)
+                if encoding is not None:
+                    self.logger.info('String successfully parsed')
+                return handler
             except expat.ExpatError, e:
-                self.logger.error('Parsing failed')
+                self.logger.error("Can't parse inventory XML string")
                 if expat.errors.XML_ERROR_INVALID_TOKEN in str(e):
-                    pass
+                    self.logger.error('The XML string may use a wrong encoding')
                 else:
                     # Unhandled error, just re-raise it
                     raise e
-        if xml:
-            return xml
-        else:
-            raise Exception("Can't parse inventory XML string")
+        raise Exception("Can't parse inventory XML string")
 
     def parse(self, xmltext):
         """
         Parse the given XML string which is the content of a OCS inventory.
         """
-        self.logger = logging.getLogger()
-        xml = None
-        try:
-            xml = parseString(xmltext)
-        except expat.ExpatError, e:
-            self.logger.error("Can't parse inventory XML string")
-            if expat.errors.XML_ERROR_INVALID_TOKEN in str(e):
-                self.logger.error('The XML string may use a wrong encoding')
-            else:
-                # Unhandled error, just re-raise it
-                raise e
-
-        if not xml:
-            # Let's try another encoding
-            xml = self.parseSafe(xmltext)
-
-        inventory = {}
-        for tablename in self.tables:
-            in_network = tablename == u'NETWORKS'
-            try:
-                dbtablename = self.tables[tablename][0]
-                inventory[dbtablename] = []
-                for tag in xml.getElementsByTagName(tablename):
-                    entry = {}
-                    if in_network:
-                        # Skip lo interface and network device with a 127.x.x.x
-                        # address.
-                        try:
-                            netif = tag.getElementsByTagName('DESCRIPTION')[0].childNodes[0].nodeValue
-                        except:
-                            netif = ''
-                        try:
-                            ip = tag.getElementsByTagName('IPADDRESS')[0].childNodes[0].nodeValue
-                        except:
-                            ip = ''
-                        if netif == 'lo' or ip.startswith('127.'):
-                            self.logger.debug('Skipping computer local interface from inventory')
-                            continue
-                    for fieldname in self.tables[tablename][1]:
-                        try:
-                            field = tag.getElementsByTagName(fieldname)[0]
-                            dbfieldname = self.tables[tablename][1][fieldname]
-                            entry[dbfieldname] = field.childNodes[0].nodeValue
-                        except IndexError:
-                            pass
-                    inventory[dbtablename].append(entry)
-            except IndexError:
-                pass
-
-        return inventory
+        return self._parse(xmltext).inventory
 
+    def parseRequest(self, xmltext):
+        """
+        Parse the XML string of an inventory request, as sent by the agent,
+        in one pass.
+
+        @return: inventory of CONTENT section (None if missing), LOGDATE and
+                 TAG (None if missing)
+        @rtype: tuple
+        """
+        handler = self._parse(xmltext, 'CONTENT')
+        inventory = None
+        if handler.scope_found:
+            inventory = handler.inventory
+        return (inventory, handler.metadata.get('LOGDATE'), handler.metadata.get('TAG'))
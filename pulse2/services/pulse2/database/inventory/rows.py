@@ -0,0 +1,129 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Pulse 2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+"""
+Keys and cache of the rows of the inventory parts tables.
+
+The rows of the parts tables (Bios, Software, ...) are shared by all the
+inventories and never removed, so the id of a row found once can be
+reused without querying the database again.
+"""
+
+from threading import Lock
+from collections import OrderedDict
+
+
+def normalizeValue(value):
+    """
+    Normalizes a column value as compared by the database: case and
+    trailing spaces are not significant.
+
+    @return: normalized value, None for NULL
+    @rtype: unicode
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.decode('utf-8', 'replace')
+    elif not isinstance(value, unicode):
+        value = unicode(value)
+    return value.rstrip(u' ').lower()
+
+def rowKey(values, columns = None):
+    """
+    @param values: column values of a row
+    @type values: dict
+
+    @param columns: columns making the key, all columns of values if None
+    @type columns: iterable
+
+    @return: key of the row, comparable with the key of the same row read
+             from the database
+    @rtype: tuple
+    """
+    if columns is None:
+        columns = values.keys()
+    return tuple(sorted([(column, normalizeValue(values.get(column))) for column in columns]))
+
+
+class RowCache:
+    """
+    Least recently used ids of rows, keyed by table and row key.
+    """
+
+    def __init__(self, size):
+        """
+        @param size: max number of ids kept, 0 to disable the cache
+        @type size: int
+        """
+        self.size = size
+        self.lock = Lock()
+        self.ids = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, table, key):
+        """
+        @return: id of row, None if not in cache
+        @rtype: int
+        """
+        self.lock.acquire()
+        try:
+            id = self.ids.pop((table, key), None)
+            if id is None:
+                self.misses += 1
+                return None
+            # most recently used last
+            self.ids[(table, key)] = id
+            self.hits += 1
+            return id
+        finally:
+            self.lock.release()
+
+    def set(self, table, key, id):
+        if self.size <= 0:
+            return
+        self.lock.acquire()
+        try:
+            self.ids.pop((table, key), None)
+            self.ids[(table, key)] = id
+            while len(self.ids) > self.size:
+                self.ids.popitem(last = False)
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.ids.clear()
+        finally:
+            self.lock.release()
+
+    def getStatistics(self):
+        """
+        @return: number of ids kept, hits and misses
+        @rtype: dict
+        """
+        self.lock.acquire()
+        try:
+            return {'size': len(self.ids), 'hits': self.hits, 'misses': self.misses}
+        finally:
+            self.lock.release()
@@ -326,18 +326,14 @@ class MscDatabase(DatabaseHelper):
         @param end_date: new end date of command_on_host
         @type end_date: str
         """
-        query = session.query(CommandsOnHost)
-        query = query.select_from(self.commands_on_host)
-        query = query.filter(self.commands_on_host.c.fk_commands == cmd_id)
-        query = query.filter(self.commands_on_host.c.current_state != "done")
-        for coh in query.all():
-            coh.start_date = start_date
-            coh.end_date = end_date
-            coh.next_launch_date = start_date
-            coh.attempts_failed = 0
-            coh.current_state = "scheduled"
-            session.add(coh)
-            session.flush()
+        session.execute(self.commands_on_host.update(
+            and_(self.commands_on_host.c.fk_commands == cmd_id,
+                 self.commands_on_host.c.current_state != "done"),
+            values={"start_date": start_date,
+                    "end_date": end_date,
+                    "next_launch_date": start_date,
+                    "attempts_failed": 0,
+                    "current_state": "scheduled"}))
 
 
 
@@ -28,6 +28,7 @@
 import logging
 import time
 import datetime
+import sqlalchemy
 import sqlalchemy.orm
 
 class CommandsOnHost(object):
@@ -312,6 +313,8 @@ def togglePauseCommandOnHost(coh_id):
 
 class CoHManager :
     """ Manager class to encapsulate the methods bellow. """
+    # number of ids updated by one statement
+    BULK_SIZE = 1000
 
     @classmethod
     def setBalances (cls, coh_balances):
@@ -331,21 +334,64 @@ class CoHManager :
         session.close()
 
     @classmethod
-    def setCoHsStates(cls, ids, state):
+    def _bulkUpdate(cls, ids, values, excluded_states=(), progress=None):
         """
-        Multiple setting the current state to <state>.
+        Set-based update of commands_on_host, by batches of BULK_SIZE ids.
 
         @param ids: list of ids to update
         @type ids: list
+
+        @param values: updated columns and their values
+        @type values: dict
+
+        @param excluded_states: commands_on_host in these states are skipped
+        @type excluded_states: tuple
+
+        @param progress: called after each batch with processed and total ids
+        @type progress: callable
+
+        @return: list of tuples (id, fk_commands) of updated rows
+        @rtype: list
         """
+        table = sqlalchemy.orm.class_mapper(CommandsOnHost).mapped_table
+        ids = list(ids)
+        updated = []
+
         session = sqlalchemy.orm.create_session()
-        for id in ids :
-            myCommandOnHost = session.query(CommandsOnHost).get(id)
-            if myCommandOnHost :
-                myCommandOnHost.current_state = state
-                session.add(myCommandOnHost)
-                session.flush()
+        for start in range(0, len(ids), cls.BULK_SIZE) :
+            batch = ids[start:start + cls.BULK_SIZE]
+            where = table.c.id.in_(batch)
+            if len(excluded_states) > 0 :
+                excluded = sqlalchemy.not_(table.c.current_state.in_(excluded_states))
+                where = sqlalchemy.and_(where, excluded)
+            rows = session.execute(sqlalchemy.select([table.c.id,
+                                                      table.c.fk_commands],
+                                                     where)).fetchall()
+            if len(rows) > 0 :
+                # rows switched meanwhile to an excluded state are skipped
+                update_where = table.c.id.in_([row[0] for row in rows])
+                if len(excluded_states) > 0 :
+                    update_where = sqlalchemy.and_(update_where, excluded)
+                session.execute(table.update(update_where, values=values))
+            updated.extend([(row[0], row[1]) for row in rows])
+            if progress :
+                progress(start + len(batch), len(ids))
         session.close()
+        return updated
+
+    @classmethod
+    def setCoHsStates(cls, ids, state, progress=None):
+        """
+        Multiple setting the current state to <state>.
+
+        @param ids: list of ids to update
+        @type ids: list
+
+        @return: list of updated ids
+        @rtype: list
+        """
+        updated = cls._bulkUpdate(ids, {"current_state": state}, (), progress)
+        return [id for (id, cmd_id) in updated]
 
     @classmethod
     def setCoHsStateOverTimed(cls, ids):
@@ -358,28 +404,37 @@ class CoHManager :
         CoHManager.setCoHsStates(ids, "over_timed")
 
     @classmethod
-    def setCoHsStateScheduled(cls, ids):
+    def setCoHsStateScheduled(cls, ids, progress=None):
         """
         Multiple setting the current state to 'scheduled'.
 
         @param ids: list of ids to update
         @type ids: list
+
+        @return: list of updated ids
+        @rtype: list
         """
-        session = sqlalchemy.orm.create_session()
-        for id in ids :
-            myCommandOnHost = session.query(CommandsOnHost).get(id)
-            if myCommandOnHost :
-                if myCommandOnHost.current_state in ('done', 'failed', 'over_timed'):
-                    continue
-                myCommandOnHost.current_state = 'scheduled'
-                session.add(myCommandOnHost)
-                session.flush()
-        session.close()
+        updated = cls._bulkUpdate(ids,
+                                  {"current_state": "scheduled"},
+                                  ('done', 'failed', 'over_timed'),
+                                  progress)
+        return [id for (id, cmd_id) in updated]
 
+    @classmethod
+    def setCoHsNextLaunchDate(cls, ids, launch_date):
+        """
+        Multiple setting of next launch date.
 
+        @param ids: list of ids to update
+        @type ids: list
+
+        @param launch_date: next launch date
+        @type launch_date: datetime
+        """
+        cls._bulkUpdate(ids, {"next_launch_date": launch_date})
 
     @classmethod
-    def setCoHsStateStopped(cls, ids):
+    def setCoHsStateStopped(cls, ids, progress=None):
         """
         Multiple setting the current state to 'stopped'.
 
@@ -389,23 +444,15 @@ class CoHManager :
         @return: number of stopped cohs per command
         @rtype: dict
         """
+        table = sqlalchemy.orm.class_mapper(CommandsOnHost).mapped_table
+        updated = cls._bulkUpdate(ids,
+                                  {"current_state": "stopped",
+                                   "next_launch_date": table.c.end_date},
+                                  ('done', 'failed', 'over_timed'),
+                                  progress)
         cmd_groups = {}
-        session = sqlalchemy.orm.create_session()
-        for id in ids :
-            coh = session.query(CommandsOnHost).get(id)
-            if coh :
-                if coh.isStateDone() or coh.isStateFailed() or coh.isStateOverTimed():
-                    continue
-                coh.current_state = "stopped"
-                coh.next_launch_date = coh.end_date
-                session.add(coh)
-                session.flush()
-                if coh.fk_commands in cmd_groups :
-                    cmd_groups[coh.fk_commands] += 1
-                else :
-                    cmd_groups[coh.fk_commands] = 0
-
-        session.close()
+        for id, cmd_id in updated :
+            cmd_groups[cmd_id] = cmd_groups.get(cmd_id, 0) + 1
         return cmd_groups
 
 
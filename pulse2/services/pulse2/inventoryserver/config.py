@@ -43,6 +43,13 @@ class Pulse2OcsserverConfigParser(InventoryDatabaseConfig):
     port = 9999
     ocsmapping = mmcconfdir + '/pulse2/inventory-server/OcsNGMap.xml'
     xmlfixplugindir = mmcconfdir + '/pulse2/inventory-server/xml-fix'
+    xmlfix_check_interval = 10
+    xmlfix_stats_interval = 3600
+    inventory_spool_dir = '/var/lib/pulse2/inventory-server/spool'
+    inventory_workers = 1
+    inventory_queue_max = 0
+    inventory_rows_cache = 20000
+    inventory_diff_storage = False
     xmldumpdir = '/tmp/'
     xmldumpactive = 0
     enablessl = False
@@ -95,6 +102,20 @@ class Pulse2OcsserverConfigParser(InventoryDatabaseConfig):
             self.xmldumpactive = self.cp.get("main", 'xmldumpactive')
         if self.cp.has_option('main', 'xmlfixplugindir'):
             self.xmlfixplugindir = self.cp.get("main", 'xmlfixplugindir')
+        if self.cp.has_option('main', 'xmlfix_check_interval'):
+            self.xmlfix_check_interval = self.cp.getint("main", 'xmlfix_check_interval')
+        if self.cp.has_option('main', 'xmlfix_stats_interval'):
+            self.xmlfix_stats_interval = self.cp.getint("main", 'xmlfix_stats_interval')
+        if self.cp.has_option('main', 'inventory_spool_dir'):
+            self.inventory_spool_dir = self.cp.get("main", 'inventory_spool_dir')
+        if self.cp.has_option('main', 'inventory_workers'):
+            self.inventory_workers = self.cp.getint("main", 'inventory_workers')
+        if self.cp.has_option('main', 'inventory_queue_max'):
+            self.inventory_queue_max = self.cp.getint("main", 'inventory_queue_max')
+        if self.cp.has_option('main', 'inventory_rows_cache'):
+            self.inventory_rows_cache = self.cp.getint("main", 'inventory_rows_cache')
+        if self.cp.has_option('main', 'inventory_diff_storage'):
+            self.inventory_diff_storage = self.cp.getboolean("main", 'inventory_diff_storage')
         if self.cp.has_option('main', 'pidfile'):
             self.pidfile = self.cp.get("main", 'pidfile')
 
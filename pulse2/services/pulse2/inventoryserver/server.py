@@ -34,11 +34,9 @@ import re
 import signal
 import os
 import sys
-import imp
-import traceback
 from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
 from SocketServer import ThreadingMixIn
-from threading import Thread, Semaphore
+from threading import Thread
 import threading
 
 from pulse2.database.inventory import InventoryCreator, Inventory
@@ -51,6 +49,8 @@ from pulse2.inventoryserver.ssl import SecureHTTPRequestHandler, SecureThreadedH
 from pulse2.inventoryserver.utils import InventoryUtils
 from pulse2.inventoryserver.scheduler import AttemptToScheduler
 from pulse2.inventoryserver.glpiproxy import GlpiProxy, resolveGlpiMachineUUIDByMAC, hasKnownOS
+from pulse2.inventoryserver.xmlfix import XmlFixRegistry
+from pulse2.inventoryserver.spool import InventorySpool
 
 
 class InventoryServer:
@@ -125,7 +125,12 @@ class InventoryServer:
         elif query == 'INVENTORY':
             self.logger.info("INVENTORY received from %s (DEVICEID: %s)" % (from_ip, deviceid))
             resp = '<?xml version="1.0" encoding="utf-8" ?><REPLY><RESPONSE>no_account_update</RESPONSE></REPLY>'
-            Common().addInventory(deviceid, from_ip, cont)
+            if not InventorySpool().put(deviceid, from_ip, cont):
+                # the agent will send its inventory again later
+                self.logger.warn("Inventory queue is full, inventory from %s (DEVICEID: %s) refused" % (from_ip, deviceid))
+                self.send_response(503)
+                self.end_headers()
+                return
 
         # Forwarding the inventories to GLPI (if enabled)
         if self.config.enable_forward :
@@ -239,41 +244,8 @@ class InventoryFix :
         self.logger = logging.getLogger()
         self.logger.debug("Initialize the inventory fixer")
 
-        self.fixers = []
-        self._check_in()
         self._update()
 
-    def _check_in (self):
-       """
-       Find and pre-check all .py from xmlfixplugindir.
-       Checked module must have a calable function named 'xml_fix'.
-       """
-       for (path, dirs, files) in os.walk(self.config.xmlfixplugindir):
-          for filename in sorted(files):
-              pathname = os.path.join(path, filename)
-              if re.match('^.*\.py$',pathname):
-                  mod_name = filename
-                  py_mod = fnc = None
-                  try:
-                      py_mod = imp.load_source(mod_name, pathname)
-
-                  except ImportError :
-                      self.logger.warn("Cannot load fixing script '%s'" % filename)
-                      continue
-                  except Exception, e :
-                      self.logger.warn("Unable to run %s script: %s" % (filename, e))
-                      continue
-
-                  if hasattr(py_mod, 'xml_fix'):
-                      fnc = getattr(py_mod, 'xml_fix')
-                      if hasattr(fnc, "__call__") :
-                          self.fixers.append(fnc)
-                      else :
-                          self.logger.warn("module %s : attribute xml_fix is not a function or method" %  filename)
-                  else :
-                      self.logger.warn("Unable to run %s script: missing xml_fix() function" % filename)
-
-
     def _update (self):
         """Aply the script on inventory"""
         # Logging pre-modified xml to temp file
@@ -284,17 +256,8 @@ class InventoryFix :
             f = open(dumpdir + '/inventorylog-pre-' + timestamp + '.xml', 'w')
             f.write(self._inventory)
             f.close()
-        #
-        for fnc in self.fixers :
-            try :
-                self._inventory = fnc(self._inventory)
-                self.logger.debug("Inventory fixed by '%s' script" % fnc.__module__)
-            except :
-                info = sys.exc_info()
-                for fname, linenumber, fnc_name, text in traceback.extract_tb(info[2]):
-                    args = (fname, linenumber, fnc_name)
-                    self.logger.error("module: %s line: %d in function: %s" % args)
-                    self.logger.error("Failed on: %s" % text)
+        # the fixing scripts are loaded once by the registry
+        self._inventory = XmlFixRegistry().apply(self._inventory)
 
         # Logging the post modified xml file
         if int(self.config.xmldumpactive) == 1:
@@ -341,14 +304,20 @@ class TreatInv(Thread):
         self.logger.debug(format % args)
 
     def run(self):
+        spool = InventorySpool()
         while 1:
-            while Common().countInventories() > 0:
-                self.logger.debug("TreatInv :: there are %d inventories"%Common().countInventories())
-                deviceid, from_ip, content = Common().popInventory()
-                if not self.treatinv(deviceid, from_ip, content):
-                    self.logger.debug("TreatInv :: failed to create inventory for device %s"%(deviceid))
-            self.logger.debug("TreatInv :: there are no new inventories")
-            time.sleep(15) # TODO put in the conf file
+            # wait for the next inventory
+            filename, deviceid, from_ip, content, received = spool.take()
+            self.logger.debug("TreatInv :: inventory of %s waited %.1f seconds" % (deviceid, time.time() - received))
+            success = False
+            try:
+                success = self.treatinv(deviceid, from_ip, content)
+            except Exception, e:
+                self.logger.exception(e)
+            if not success:
+                self.logger.debug("TreatInv :: failed to create inventory for device %s"%(deviceid))
+            spool.done(filename, deviceid, success)
+            self.logger.debug("TreatInv :: queue state: %s" % str(spool.getStatistics()))
 
     def treatinv(self, deviceid, from_ip, cont):
         content = cont[0]
@@ -393,44 +362,15 @@ class TreatInv(Thread):
         try:
             start_date = time.time()
             threadname = threading.currentThread().getName().split("-")[1]
-            inv_data, encoding, date = '', '', strftime("%Y-%m-%d %H:%M:%S")
-            current_entity = ''
-
             self.logger.debug("Thread %s : starting process : %s " % (threadname, time.time()))
-            try:
-                inv_data = re.compile(r'<CONTENT>(.+)</CONTENT>', re.DOTALL).search(content).group(1)
-            except AttributeError, e:
-                # we can not work without it!
-                self.logger.warn("Could not get any CONTENT section in inventory from %s"%(from_ip))
+            if len(XmlFixRegistry().getFixers()) > 0 or int(self.config.xmldumpactive) == 1:
+                parsed = self._fixAndParse(content, from_ip)
+            else:
+                # nothing to fix, the request is parsed in one pass
+                parsed = self._parse(content, from_ip)
+            if parsed is None:
                 return False
-
-            try:
-                encoding = re.search(r' encoding=["\']([^"\']+)["\']', content).group(1)
-            except AttributeError, e:
-                self.logger.warn("Could not get any encoding in inventory from %s"%(from_ip))
-
-            try:
-                date = re.compile(r'<LOGDATE>(.+)</LOGDATE>', re.DOTALL).search(inv_data).group(1)
-            except AttributeError, e:
-                # we can work without it
-                self.logger.warn("Could not get any LOGDATE section in inventory from %s"%(from_ip))
-
-            try:
-                current_entity = re.compile(r'<TAG>(.+)</TAG>', re.DOTALL).search(content).group(1)
-            except AttributeError, e:
-                # we can work without it
-                self.logger.debug("Could not get any TAG section in inventory from %s" % from_ip)
-
-            self.logger.debug("Thread %s : regex : %s " % (threadname, time.time()))
-            inventory = '<?xml version="1.0" encoding="%s" ?><Inventory>%s</Inventory>' % (encoding, inv_data)
-            inventory = re.sub(r'</?HISTORY>', '', inventory)
-            inventory = re.sub(r'</?DOWNLOAD>', '', inventory)
-
-            # Let's fix the XML using py config scripts
-            invfix = InventoryFix(self.config, inventory)
-            inventory = invfix.get()
-            # Store data on the server
-            inventory = OcsMapping().parse(inventory)
+            inventory, date, current_entity = parsed
             self.logger.debug("Thread %s : parsed : %s " % (threadname, time.time()))
             hostname = '-'.join(deviceid.split('-')[0:-6])
             self.logger.debug("Thread %s : Original hostname : %s" % (threadname, hostname))
@@ -502,27 +442,74 @@ class TreatInv(Thread):
 
         return True
 
-class Common(Singleton):
-    inventories = []
-    sem = Semaphore()
-    shutdownRequest = False
+    def _parse(self, content, from_ip):
+        """
+        Parses the inventory request as sent by the agent.
 
-    def addInventory(self, deviceId, from_ip, content):
-        self.sem.acquire()
-        self.inventories.append([deviceId, from_ip, content])
-        self.sem.release()
+        @return: inventory, LOGDATE and TAG, None if the inventory can't
+                 be used
+        @rtype: tuple
+        """
+        inventory, date, current_entity = OcsMapping().parseRequest(content)
+        if inventory is None:
+            # we can not work without it!
+            self.logger.warn("Could not get any CONTENT section in inventory from %s"%(from_ip))
+            return None
+        if date is None:
+            # we can work without it
+            self.logger.warn("Could not get any LOGDATE section in inventory from %s"%(from_ip))
+            date = strftime("%Y-%m-%d %H:%M:%S")
+        if current_entity is None:
+            # we can work without it
+            self.logger.debug("Could not get any TAG section in inventory from %s" % from_ip)
+            current_entity = ''
+        return (inventory, date, current_entity)
+
+    def _fixAndParse(self, content, from_ip):
+        """
+        Extracts the CONTENT section of the inventory request, fixes it
+        using the py config scripts and parses it.
+
+        @return: inventory, LOGDATE and TAG, None if the inventory can't
+                 be used
+        @rtype: tuple
+        """
+        inv_data, encoding, date = '', '', strftime("%Y-%m-%d %H:%M:%S")
+        current_entity = ''
+
+        try:
+            inv_data = re.compile(r'<CONTENT>(.+)</CONTENT>', re.DOTALL).search(content).group(1)
+        except AttributeError:
+            # we can not work without it!
+            self.logger.warn("Could not get any CONTENT section in inventory from %s"%(from_ip))
+            return None
 
-    def countInventories(self):
-        self.sem.acquire()
-        count = len(self.inventories)
-        self.sem.release()
-        return count
+        try:
+            encoding = re.search(r' encoding=["\']([^"\']+)["\']', content).group(1)
+        except AttributeError:
+            self.logger.warn("Could not get any encoding in inventory from %s"%(from_ip))
+
+        try:
+            date = re.compile(r'<LOGDATE>(.+)</LOGDATE>', re.DOTALL).search(inv_data).group(1)
+        except AttributeError:
+            # we can work without it
+            self.logger.warn("Could not get any LOGDATE section in inventory from %s"%(from_ip))
+
+        try:
+            current_entity = re.compile(r'<TAG>(.+)</TAG>', re.DOTALL).search(content).group(1)
+        except AttributeError:
+            # we can work without it
+            self.logger.debug("Could not get any TAG section in inventory from %s" % from_ip)
+
+        inventory = '<?xml version="1.0" encoding="%s" ?><Inventory>%s</Inventory>' % (encoding, inv_data)
+        inventory = re.sub(r'</?HISTORY>', '', inventory)
+        inventory = re.sub(r'</?DOWNLOAD>', '', inventory)
 
-    def popInventory(self):
-        self.sem.acquire()
-        deviceId, from_ip, content = self.inventories.pop()
-        self.sem.release()
-        return (deviceId, from_ip, content)
+        # Let's fix the XML using py config scripts
+        invfix = InventoryFix(self.config, inventory)
+        inventory = invfix.get()
+        # Store data on the server
+        return (OcsMapping().parse(inventory), date, current_entity)
 
 class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
     """Handle requests in a separate thread."""
@@ -540,6 +527,12 @@ class InventoryGetService(Singleton):
         except IOError, e:
             self.logger.error(e)
             return False
+        XmlFixRegistry().init(self.config)
+        try:
+            InventorySpool().init(self.config)
+        except (IOError, OSError), e:
+            self.logger.error("Can't use the inventory spool %s: %s" % (self.config.inventory_spool_dir, str(e)))
+            return False
         if self.config.enable_forward:
             return True
 
@@ -583,11 +576,14 @@ class InventoryGetService(Singleton):
         signal.signal(signal.SIGTERM, self.handler)
         signal.signal(signal.SIGINT, self.handler)
 
-        self.logger.debug("Start launching of treat inventory thread")
-        self.treatinv = TreatInv(self.config)
-        self.treatinv.setDaemon(True)
-        self.treatinv.start()
-        self.logger.debug("Treat inventory thread started")
+        self.logger.debug("Start launching of %d treat inventory threads" % self.config.inventory_workers)
+        self.treatinv = []
+        for i in range(max(1, self.config.inventory_workers)):
+            treatinv = TreatInv(self.config)
+            treatinv.setDaemon(True)
+            treatinv.start()
+            self.treatinv.append(treatinv)
+        self.logger.debug("Treat inventory threads started")
 
         server_address = (self.bind, int(self.port))
         if self.config.enablessl: # warning if ssl is activated, given server and handler class will be override...
@@ -0,0 +1,243 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Pulse 2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+"""
+Persistent FIFO queue of the received inventories.
+
+Each inventory is written in a file of the spool directory, named after
+its position in the queue, and removed once injected: the inventories
+waiting at shutdown are injected after restart.
+
+Only the newest pending inventory of a device is kept, it takes the place
+of the previous one in the queue.
+"""
+
+import os
+import re
+import time
+import pickle
+import logging
+from collections import deque
+from threading import Condition
+
+from pulse2.utils import Singleton
+
+# name of spooled inventory files: <position>-<device id>.inv
+SPOOL_FILE = re.compile('^(\d+)-(.*)\.inv$')
+
+
+class InventorySpool(Singleton):
+    """
+    Queue shared by the HTTP handlers, which put the inventories, and
+    the inventory workers, which take them.
+    """
+    condition = Condition()
+    # pending inventories: (filename, device id)
+    pending = deque()
+    # {device id: filename} of pending inventories
+    by_device = {}
+    # device ids of inventories being injected
+    working = set()
+    seq = 0
+    counters = {}
+
+    def init(self, config):
+        """
+        Creates the spool directory and reloads the inventories
+        waiting in it.
+
+        @param config: inventory server configuration
+        @type config: Pulse2OcsserverConfigParser
+
+        @return: number of reloaded inventories
+        @rtype: int
+        """
+        self.logger = logging.getLogger()
+        self.directory = config.inventory_spool_dir
+        self.max_pending = config.inventory_queue_max
+        self.pending = deque()
+        self.by_device = {}
+        self.working = set()
+        self.seq = 0
+        self.counters = {'received': 0, 'replaced': 0, 'refused': 0,
+                         'injected': 0, 'failed': 0}
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory, 0700)
+
+        spooled = []
+        for filename in os.listdir(self.directory):
+            m = SPOOL_FILE.match(filename)
+            if m is None:
+                if filename.endswith('.tmp'):
+                    os.unlink(os.path.join(self.directory, filename))
+                continue
+            spooled.append((int(m.group(1)), filename, m.group(2)))
+        spooled.sort()
+        pending = []
+        for seq, filename, deviceid in spooled:
+            self.seq = max(self.seq, seq)
+            if deviceid in self.by_device:
+                # an inventory was being injected when the server stopped,
+                # keep the newest one in the place of the older one
+                older = self.by_device[deviceid]
+                os.unlink(os.path.join(self.directory, older))
+                pending[pending.index((older, deviceid))] = (filename, deviceid)
+            else:
+                pending.append((filename, deviceid))
+            self.by_device[deviceid] = filename
+        self.pending = deque(pending)
+        if len(self.pending) > 0:
+            self.logger.info("%d inventories reloaded from %s" % (len(self.pending), self.directory))
+        return len(self.pending)
+
+    def _write(self, filename, data):
+        path = os.path.join(self.directory, filename)
+        f = open(path + '.tmp', 'wb')
+        try:
+            pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+        finally:
+            f.close()
+        os.rename(path + '.tmp', path)
+
+    def put(self, deviceid, from_ip, content):
+        """
+        Queues an inventory.
+
+        @param deviceid: DEVICEID of inventory
+        @type deviceid: str
+
+        @param content: [inventory XML, content type]
+        @type content: list
+
+        @return: False if the queue is full
+        @rtype: bool
+        """
+        self.condition.acquire()
+        try:
+            self.counters['received'] += 1
+            filename = self.by_device.get(deviceid)
+            if filename is not None:
+                # replace the pending inventory of this device
+                self._write(filename, (deviceid, from_ip, content, time.time()))
+                self.counters['replaced'] += 1
+                return True
+            if self.max_pending > 0 and len(self.pending) >= self.max_pending:
+                self.counters['refused'] += 1
+                return False
+            self.seq += 1
+            filename = "%020d-%s.inv" % (self.seq, deviceid)
+            self._write(filename, (deviceid, from_ip, content, time.time()))
+            self.by_device[deviceid] = filename
+            self.pending.append((filename, deviceid))
+            self.condition.notify()
+            return True
+        finally:
+            self.condition.release()
+
+    def take(self, timeout = None):
+        """
+        Takes the oldest inventory of a device not being injected,
+        waiting for it.
+
+        @param timeout: max waiting time in seconds, None for no limit
+        @type timeout: float
+
+        @return: (filename, device id, from ip, content, reception time),
+                 None if none arrived before timeout
+        @rtype: tuple
+        """
+        self.condition.acquire()
+        try:
+            end = timeout is not None and time.time() + timeout or None
+            while True:
+                for item in self.pending:
+                    filename, deviceid = item
+                    if not deviceid in self.working:
+                        self.pending.remove(item)
+                        del self.by_device[deviceid]
+                        self.working.add(deviceid)
+                        try:
+                            f = open(os.path.join(self.directory, filename), 'rb')
+                            try:
+                                deviceid, from_ip, content, received = pickle.load(f)
+                            finally:
+                                f.close()
+                        except Exception, e:
+                            self.logger.error("Can't read spooled inventory %s: %s" % (filename, str(e)))
+                            self._remove(filename, deviceid)
+                            self.counters['failed'] += 1
+                            break
+                        return (filename, deviceid, from_ip, content, received)
+                else:
+                    if end is None:
+                        self.condition.wait()
+                    else:
+                        remaining = end - time.time()
+                        if remaining <= 0:
+                            return None
+                        self.condition.wait(remaining)
+        finally:
+            self.condition.release()
+
+    def _remove(self, filename, deviceid):
+        self.working.discard(deviceid)
+        try:
+            os.unlink(os.path.join(self.directory, filename))
+        except OSError, e:
+            self.logger.warn("Can't remove spooled inventory %s: %s" % (filename, str(e)))
+        # a newer inventory of this device may be waiting
+        self.condition.notify()
+
+    def done(self, filename, deviceid, success):
+        """
+        Removes an inventory from the spool once injected.
+        """
+        self.condition.acquire()
+        try:
+            self._remove(filename, deviceid)
+            if success:
+                self.counters['injected'] += 1
+            else:
+                self.counters['failed'] += 1
+        finally:
+            self.condition.release()
+
+    def getStatistics(self):
+        """
+        @return: queue length, inventories being injected, age of the oldest
+                 pending inventory and counters
+        @rtype: dict
+        """
+        self.condition.acquire()
+        try:
+            stats = self.counters.copy()
+            stats['pending'] = len(self.pending)
+            stats['working'] = len(self.working)
+            stats['oldest'] = 0
+            if len(self.pending) > 0:
+                filename = self.pending[0][0]
+                try:
+                    stats['oldest'] = int(time.time() - os.stat(os.path.join(self.directory, filename)).st_mtime)
+                except OSError:
+                    pass
+            return stats
+        finally:
+            self.condition.release()
@@ -0,0 +1,224 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Pulse 2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+"""
+Registry of the scripts fixing the inventories XML.
+
+The scripts of xmlfixplugindir are loaded once, then the directory is
+checked again at most every xmlfix_check_interval seconds: only the
+added or modified scripts are loaded again.
+"""
+
+import os
+import re
+import sys
+import imp
+import time
+import logging
+import traceback
+from threading import Lock
+
+from pulse2.utils import Singleton
+
+
+class XmlFixRegistry(Singleton):
+    """
+    Loaded fixing scripts, and the time spent in each of them.
+    """
+    lock = Lock()
+    # {pathname: ((mtime, size), xml_fix function)}
+    scripts = {}
+    # pathnames of the scripts, in run order
+    order = []
+    # {script name: {'calls': n, 'errors': n, 'time': s, 'max_time': s}}
+    counters = {}
+    last_check = 0
+    last_stats = 0
+
+    def init(self, config):
+        """
+        @param config: inventory server configuration
+        @type config: Pulse2OcsserverConfigParser
+        """
+        self.logger = logging.getLogger()
+        self.directory = config.xmlfixplugindir
+        self.check_interval = config.xmlfix_check_interval
+        self.stats_interval = config.xmlfix_stats_interval
+        self.scripts = {}
+        self.order = []
+        self.counters = {}
+        self.last_stats = time.time()
+        self.lock.acquire()
+        try:
+            self._reload()
+        finally:
+            self.lock.release()
+
+    def _scan(self):
+        """
+        @return: (mtime, size) of the scripts by pathname, and their
+                 run order
+        @rtype: tuple
+        """
+        found = {}
+        order = []
+        for (path, dirs, files) in os.walk(self.directory):
+            dirs.sort()
+            for filename in sorted(files):
+                pathname = os.path.join(path, filename)
+                if re.match('^.*\.py$', pathname):
+                    try:
+                        st = os.stat(pathname)
+                    except OSError:
+                        continue
+                    found[pathname] = (st.st_mtime, st.st_size)
+                    order.append(pathname)
+        return (found, order)
+
+    def _load(self, pathname):
+        """
+        Loads a script, checking that it has a callable named 'xml_fix'.
+
+        @return: the xml_fix function, None if the script is not valid
+        """
+        filename = os.path.basename(pathname)
+        try:
+            py_mod = imp.load_source(filename, pathname)
+        except ImportError:
+            self.logger.warn("Cannot load fixing script '%s'" % filename)
+            return None
+        except Exception, e:
+            self.logger.warn("Unable to run %s script: %s" % (filename, e))
+            return None
+
+        if hasattr(py_mod, 'xml_fix'):
+            fnc = getattr(py_mod, 'xml_fix')
+            if hasattr(fnc, "__call__"):
+                return fnc
+            self.logger.warn("module %s : attribute xml_fix is not a function or method" % filename)
+        else:
+            self.logger.warn("Unable to run %s script: missing xml_fix() function" % filename)
+        return None
+
+    def _reload(self):
+        """
+        Loads the added and modified scripts, forgets the removed ones.
+        Must be called with lock held.
+        """
+        self.last_check = time.time()
+        found, order = self._scan()
+        for pathname in self.scripts.keys():
+            if not pathname in found:
+                self.logger.info("Fixing script %s removed" % pathname)
+                del self.scripts[pathname]
+        for pathname in order:
+            if pathname in self.scripts and self.scripts[pathname][0] == found[pathname]:
+                continue
+            if pathname in self.scripts:
+                self.logger.info("Fixing script %s changed, reloading it" % pathname)
+            self.scripts[pathname] = (found[pathname], self._load(pathname))
+        self.order = order
+
+    def getFixers(self):
+        """
+        Gets the fixing functions, loading the scripts changed since
+        the last check.
+
+        @return: (script name, xml_fix function) in run order
+        @rtype: list
+        """
+        self.lock.acquire()
+        try:
+            if time.time() - self.last_check >= self.check_interval:
+                self._reload()
+            ret = []
+            for pathname in self.order:
+                fnc = self.scripts[pathname][1]
+                if fnc is not None:
+                    ret.append((os.path.basename(pathname), fnc))
+            return ret
+        finally:
+            self.lock.release()
+
+    def apply(self, inventory):
+        """
+        Runs the fixing scripts on an inventory.
+
+        @param inventory: inventory XML
+        @type inventory: str
+
+        @return: fixed inventory XML
+        @rtype: str
+        """
+        for name, fnc in self.getFixers():
+            start = time.time()
+            failed = False
+            try:
+                inventory = fnc(inventory)
+                self.logger.debug("Inventory fixed by '%s' script" % fnc.__module__)
+            except:
+                failed = True
+                info = sys.exc_info()
+                for fname, linenumber, fnc_name, text in traceback.extract_tb(info[2]):
+                    args = (fname, linenumber, fnc_name)
+                    self.logger.error("module: %s line: %d in function: %s" % args)
+                    self.logger.error("Failed on: %s" % text)
+            self._count(name, time.time() - start, failed)
+        self._logStatistics()
+        return inventory
+
+    def _count(self, name, duration, failed):
+        self.lock.acquire()
+        try:
+            counters = self.counters.setdefault(name, {'calls': 0, 'errors': 0, 'time': 0.0, 'max_time': 0.0})
+            counters['calls'] += 1
+            counters['time'] += duration
+            counters['max_time'] = max(counters['max_time'], duration)
+            if failed:
+                counters['errors'] += 1
+        finally:
+            self.lock.release()
+
+    def getStatistics(self):
+        """
+        @return: calls, errors, total and max time (in seconds) by script
+        @rtype: dict
+        """
+        self.lock.acquire()
+        try:
+            ret = {}
+            for name, counters in self.counters.items():
+                ret[name] = counters.copy()
+            return ret
+        finally:
+            self.lock.release()
+
+    def _logStatistics(self):
+        if self.stats_interval <= 0 or time.time() - self.last_stats < self.stats_interval:
+            return
+        self.last_stats = time.time()
+        stats = self.getStatistics().items()
+        # slowest scripts first
+        stats.sort(lambda x, y: cmp(y[1]['time'], x[1]['time']))
+        for name, counters in stats:
+            average = counters['time'] / max(1, counters['calls'])
+            self.logger.info("Fixing script %s: %d calls, %d errors, %.3f s spent, %.3f s average, %.3f s max" % \
+                             (name, counters['calls'], counters['errors'], counters['time'], average, counters['max_time']))
@@ -54,8 +54,12 @@ class LauncherConfig(pulse2.utils.Singleton):
     inventory_command = '''export P2SRV=`echo $SSH_CONNECTION | cut -f1 -d\ `; export P2PORT=9999; export http_proxy=""; export ftp_proxy=""; ( [ -x /cygdrive/c/Program\ Files/FusionInventory-Agent/uninstFI.exe ] && /cygdrive/c/Program\ Files/FusionInventory-Agent/perl/bin/perl "C:\Program Files\FusionInventory-Agent\perl\\bin\\fusioninventory-agent" /server=http://$P2SRV:$P2PORT ) || ( [ -x /cygdrive/c/Program\ Files\ \(x86\)/FusionInventory-Agent/uninstFI.exe ] && /cygdrive/c/Program\ Files\ \(x86\)/FusionInventory-Agent/perl/bin/perl "C:\Program Files (x86)\FusionInventory-Agent\perl\\bin\\fusioninventory-agent" /server=http://$P2SRV:$P2PORT ) || ( [ -x /cygdrive/c/Program\ Files/FusionInventory-Agent/fusioninventory-agent.bat ] && /cygdrive/c/Program\ Files/FusionInventory-Agent/fusioninventory-agent.bat /server=http://$P2SRV:$P2PORT ) || ( [ -x /cygdrive/c/Program\ Files\ \(x86\)/FusionInventory-Agent/fusioninventory-agent.bat ] && /cygdrive/c/Program\ Files\ \(x86\)/FusionInventory-Agent/fusioninventory-agent.bat /server=http://$P2SRV:$P2PORT ) || ( [ -x /cygdrive/c/Program\ Files/OCS\ Inventory\ Agent/OCSInventory.exe ] && /cygdrive/c/Program\ Files/OCS\ Inventory\ Agent/OCSInventory.exe /np /server:$P2SRV /pnum:$P2PORT ) || ( [ -x /cygdrive/c/Program\ Files\ \(x86\)/OCS\ Inventory\ Agent/OCSInventory.exe ] && /cygdrive/c/Program\ Files\ \(x86\)/OCS\ Inventory\ Agent/OCSInventory.exe /np /server:$P2SRV /pnum:$P2PORT ) || ( [ -x /usr/bin/ocsinventory-agent ] && /usr/bin/ocsinventory-agent --server=http://$P2SRV:$P2PORT ) || ( [ -x /usr/sbin/ocsinventory-agent ] && /usr/sbin/ocsinventory-agent --server=http://$P2SRV:$P2PORT ) || ( [ -x /usr/local/sbin/ocs_mac_agent.php ] && /usr/local/sbin/ocs_mac_agent.php ) || ( [ -x /usr/local/bin/fusioninventory-agent ] && /usr/local/bin/fusioninventory-agent --server=http://$P2SRV:$P2PORT ) || ( [ -x /usr/bin/fusioninventory-agent ] && /usr/bin/fusioninventory-agent --server=http://$P2SRV:$P2PORT )'''
     launcher_path = "/usr/sbin/pulse2-launcher"
     max_command_age = 86400
+    # delay to gather the slots changes before to push them to the scheduler
+    # (0 to disable, the scheduler polls the launcher)
+    slots_push_delay = 1
     max_ping_time = 4
     max_probe_time = 20
+    batch_concurrency = 50
     ping_path = "/usr/sbin/pulse2-ping"
     reboot_command = "/bin/shutdown.exe -f -r 1 || shutdown -r now"
     source_path = "/var/lib/pulse2/packages"
@@ -73,6 +77,19 @@ class LauncherConfig(pulse2.utils.Singleton):
     wrapper_max_log_size = 512000
     wrapper_path = "/usr/sbin/pulse2-output-wrapper"
 
+    # commands output capture: bytes kept from start and end of output
+    # (not bounded if both are 0), the whole output is written into
+    # a temporary file of output_spill_dir if set
+    output_head_size = 262144
+    output_tail_size = 262144
+    output_spill_dir = ""
+
+    # bandwidth budgets of transfers (in bit/s, 0 = no limit)
+    transfer_budget = 0
+    transfer_budgets = {}
+    transfer_min_rate = 65536
+    transfer_admission_delay = 1
+
     # ssh stuff
     scp_path_default = scp_path = "/usr/bin/scp"
     ssh_agent_path_default = ssh_agent_path = "/usr/bin/ssh-agent"
@@ -94,6 +111,11 @@ class LauncherConfig(pulse2.utils.Singleton):
         'ConnectTimeout=10'
     ]
     ssh_path_default = ssh_path = "/usr/bin/ssh"
+    # connections multiplexing through control masters
+    ssh_multiplexing = True
+    ssh_control_dir = "/var/run/pulse2/ssh"
+    ssh_control_persist = 300
+    ssh_max_masters = 100
 
     # wget stuff
     wget_path_default = wget_path = '/usr/bin/wget'
@@ -111,6 +133,10 @@ class LauncherConfig(pulse2.utils.Singleton):
     wol_bcast = '255.255.255.255'
     wol_path = '/usr/sbin/pulse2-wol'
     wol_port = '40000'
+    # magic packets sent by launcher instead of wol_path
+    wol_native = True
+    wol_repeat = 1
+    wol_delay = 0
 
     # SSH Proxy stuff
     tcp_sproxy_path = '/usr/sbin/pulse2-tcp-sproxy'
@@ -199,8 +225,10 @@ class LauncherConfig(pulse2.utils.Singleton):
         self.setoption('launchers', 'inventory_command', 'inventory_command')
         self.setoption('launchers', 'launcher_path', 'launcher_path')
         self.setoption('launchers', 'max_command_age', 'max_command_age', 'int')
+        self.setoption('launchers', 'slots_push_delay', 'slots_push_delay', 'int')
         self.setoption('launchers', 'max_ping_time', 'max_ping_time', 'int')
         self.setoption('launchers', 'max_probe_time', 'max_probe_time', 'int')
+        self.setoption('launchers', 'batch_concurrency', 'batch_concurrency', 'int')
         self.setoption('launchers', 'ping_path', 'ping_path')
         self.setoption('launchers', 'source_path', 'source_path')
         self.setoption('launchers', 'reboot_command', 'reboot_command')
@@ -213,6 +241,20 @@ class LauncherConfig(pulse2.utils.Singleton):
         self.setoption('wrapper', 'max_exec_time', 'wrapper_max_exec_time', 'int')
         self.setoption('wrapper', 'path', 'wrapper_path')
 
+        # Parse "output" section
+        self.setoption('output', 'head_size', 'output_head_size', 'int')
+        self.setoption('output', 'tail_size', 'output_tail_size', 'int')
+        self.setoption('output', 'spill_dir', 'output_spill_dir')
+
+        # Parse "transfers" section
+        self.setoption('transfers', 'budget', 'transfer_budget', 'int')
+        self.setoption('transfers', 'min_rate', 'transfer_min_rate', 'int')
+        self.setoption('transfers', 'admission_delay', 'transfer_admission_delay', 'int')
+        if self.cp.has_section('transfers'):
+            for option in self.cp.options('transfers'):
+                if option.startswith('budget_'):
+                    self.transfer_budgets[option[len('budget_'):]] = self.cp.getint('transfers', option)
+
         # Parse "wget" section
         self.setoption('wget', 'wget_path', 'wget_path')
         if self.cp.has_section("wget"):
@@ -279,6 +321,9 @@ class LauncherConfig(pulse2.utils.Singleton):
         self.setoption('wol', 'wol_bcast', 'wol_bcast')
         self.setoption('wol', 'wol_path', 'wol_path')
         self.setoption('wol', 'wol_port', 'wol_port')
+        self.setoption('wol', 'wol_native', 'wol_native', 'bool')
+        self.setoption('wol', 'wol_repeat', 'wol_repeat', 'int')
+        self.setoption('wol', 'wol_delay', 'wol_delay', 'int')
 
         # Parse "tcp_sproxy" section
         self.setoption('tcp_sproxy', 'tcp_sproxy_path', 'tcp_sproxy_path')
@@ -447,6 +492,10 @@ class LauncherConfig(pulse2.utils.Singleton):
         # Parse "ssh" sections
         self.setoption('ssh', 'default_key', 'ssh_defaultkey')
         self.setoption('ssh', 'forward_key', 'ssh_forward_key')
+        self.setoption('ssh', 'multiplexing', 'ssh_multiplexing', 'bool')
+        self.setoption('ssh', 'control_dir', 'ssh_control_dir')
+        self.setoption('ssh', 'control_persist', 'ssh_control_persist', 'int')
+        self.setoption('ssh', 'max_masters', 'ssh_max_masters', 'int')
 
         self.setoption('ssh', 'ssh_options', 'ssh_options')
         if not type(self.ssh_options) == type([]):
@@ -496,7 +545,9 @@ class LauncherConfig(pulse2.utils.Singleton):
         """
         Raise an error if the configuration is bad
         """
-        paths = [self.launcher_path, self.ping_path, self.wrapper_path, self.wol_path]
+        paths = [self.launcher_path, self.ping_path, self.wrapper_path]
+        if not self.wol_native:
+            paths.append(self.wol_path)
         sshkeys = self.ssh_keys.values()
         if len(sshkeys) == 0:
             log.error("Configuration error: no ssh key has been defined")
@@ -24,6 +24,7 @@
 
 from pulse2.health import basicHealth
 from pulse2.launcher.process_control import ProcessList
+from pulse2.launcher.transfers import TransferScheduler
 
 def getHealth(config):
     # take basic informations
@@ -34,5 +35,6 @@ def getHealth(config):
         "slotused" : ProcessList().getProcessCount()
     }
 
-    health.update({'slots': slots})
+    health.update({'slots': slots,
+                   'transfers': TransferScheduler().getStatistics()})
     return health
@@ -34,50 +34,90 @@ from twisted.internet import defer
 # Other stuff
 from pulse2.launcher.config import LauncherConfig
 import pulse2.launcher.process_control
+import pulse2.launcher.wol
 SEPARATOR = u'·'
 
 def wolClient(mac_addrs, target_bcast = None):
     """ Send a BCast WOL packet to mac_addrs """
-    def __cb_wol_end(shprocess):
-        if not shprocess.exit_code == 0:
-            logging.getLogger().warn("launcher %s: WOL failed: %s, %s" % (LauncherConfig().name, shprocess.stdout, shprocess.stderr))
-            return (False, "mac addresses: %s, target broadcasts: %s" % (mac_addrs, target_bcast), "")
+    def cbReturn(results):
+        message = "mac addresses: %s, target broadcasts: %s" % (mac_addrs, target_bcast)
+        if False in results.values():
+            return (False, message, "")
         logging.getLogger().debug("launcher %s: WOL succeeded" % (LauncherConfig().name))
-        return (True, "mac addresses: %s, target broadcasts: %s" % (mac_addrs, target_bcast), "")
+        return (True, message, "")
 
-    def cbReturn(result):
-        ret = (True, "mac addresses: %s, target broadcasts: %s" % (mac_addrs, target_bcast), "")
-        for res in result:
-            if not res[1]:
-                return (False, "mac addresses: %s, target broadcasts: %s" % (mac_addrs, target_bcast), "")
-        return ret
+    networks = {}
+    for i in range(len(mac_addrs)):
+        if mac_addrs[i]:
+            bcast = ''
+            if target_bcast and target_bcast[i]:
+                bcast = target_bcast[i]
+            networks.setdefault(bcast, []).append(mac_addrs[i])
+
+    d = wolNetworks(networks)
+    d.addCallback(cbReturn)
+    return d
+
+def wolNetworks(networks):
+    """
+    Send BCast WOL packets to lists of MAC addresses.
+
+    @param networks: MAC addresses by broadcast address, an empty
+                     broadcast address standing for wol_bcast
+    @type networks: dict
+
+    @return: WOL success by broadcast address
+    @rtype: Deferred
+    """
+    config = LauncherConfig()
+    resolved = {}
+    keys = {}
+    for bcast, mac_addrs in networks.items():
+        real_bcast = bcast or config.wol_bcast
+        resolved.setdefault(real_bcast, []).extend([mac for mac in mac_addrs if mac])
+        keys.setdefault(real_bcast, []).append(bcast)
+
+    def cbResults(sent):
+        results = {}
+        for real_bcast, success in sent.items():
+            for bcast in keys[real_bcast]:
+                results[bcast] = success
+        return results
+
+    if config.wol_native:
+        sender = pulse2.launcher.wol.WOLSender(int(config.wol_port),
+                                               config.wol_repeat,
+                                               config.wol_delay / 1000.0)
+        d = sender.send(resolved)
+    else:
+        d = wolHelper(resolved)
+    d.addCallback(cbResults)
+    return d
+
+def wolHelper(networks):
+    """ Send BCast WOL packets through the wol helper, one process by broadcast address """
+    def __cb_wol_end(shprocess, bcast):
+        if not shprocess.exit_code == 0:
+            logging.getLogger().warn("launcher %s: WOL on %s failed: %s, %s" % (LauncherConfig().name, bcast, shprocess.stdout, shprocess.stderr))
+            return False
+        return True
 
     command_list = [
         LauncherConfig().wol_path,
         '--port=%s' % LauncherConfig().wol_port,
     ]
 
+    bcasts = networks.keys()
     dl = []
-    sorted = {}
-    for i in range(len(mac_addrs)):
-        if mac_addrs[i]:
-            bcast = LauncherConfig().wol_bcast
-            if target_bcast[i]:
-                bcast = target_bcast[i]
-            if not sorted.has_key(bcast):
-                sorted[bcast] = []
-            sorted[bcast].append(mac_addrs[i])
-    for bcat in sorted:
-        mac_addresses = sorted[bcat]
-        cmd = command_list + ['--ipaddr=%s' % bcat] + mac_addresses
-        logging.getLogger().debug("launcher %s: WOL: %s" % (str(cmd), LauncherConfig().name))
-        dl.append(pulse2.launcher.process_control.commandRunner(cmd, __cb_wol_end))
-
-    if len(dl) == 1:
-        return dl[0]
-    dl = defer.DeferredList(dl)
-    dl.addCallback(cbReturn)
-    return dl
+    for bcast in bcasts:
+        cmd = command_list + ['--ipaddr=%s' % bcast] + networks[bcast]
+        logging.getLogger().debug("launcher %s: WOL: %s" % (LauncherConfig().name, str(cmd)))
+        dl.append(defer.maybeDeferred(pulse2.launcher.process_control.commandRunner,
+                                      cmd,
+                                      lambda shprocess, bcast=bcast: __cb_wol_end(shprocess, bcast)))
+    d = defer.gatherResults(dl)
+    d.addCallback(lambda results: dict(zip(bcasts, results)))
+    return d
 
 def icmpClient(client, timeout):
     """ Send a Ping to our client """
@@ -138,6 +178,64 @@ def probeClient(client, timeout):
     mydeffered.addCallback(__cb_probe_end)
     return mydeffered
 
+def icmpAndProbeClient(client, ping_timeout, probe_timeout):
+    """
+    Ping our client, then check its ssh connectivity.
+
+    @return: 0 => ping NOK, 1 => ping OK, ssh NOK, 2 => ping OK, ssh OK
+    @rtype: Deferred
+    """
+    def __cb_icmp_end(result, client=client):
+        if not result:
+            return 0
+        d = defer.maybeDeferred(probeClient, client, probe_timeout)
+        d.addCallback(lambda platform: platform != "Not available" and 2 or 1)
+        return d
+    d = defer.maybeDeferred(icmpClient, client, ping_timeout)
+    d.addCallback(__cb_icmp_end)
+    return d
+
+def batchClients(clients, check, failed, *args):
+    """
+    Runs a check on a list of clients, at most batch_concurrency
+    checks being run at once.
+
+    @param clients: checked clients
+    @type clients: list
+
+    @param check: called as check(client, *args) for each client
+    @type check: callable
+
+    @param failed: result of a check raising an error
+    @type failed: object
+
+    @return: results of checks, in the order of clients
+    @rtype: Deferred
+    """
+    def __eb_check(failure, client):
+        logging.getLogger().warn("launcher %s: check of %s failed: %s" % (LauncherConfig().name, client, failure.getErrorMessage()))
+        return failed
+
+    semaphore = defer.DeferredSemaphore(max(1, LauncherConfig().batch_concurrency))
+    dl = []
+    for client in clients:
+        d = semaphore.run(check, client, *args)
+        d.addErrback(__eb_check, client)
+        dl.append(d)
+    return defer.gatherResults(dl)
+
+def icmpClients(clients, timeout):
+    """ Send a Ping to a list of clients """
+    return batchClients(clients, icmpClient, False, timeout)
+
+def probeClients(clients, timeout):
+    """ Check ssh connectivity with a list of clients """
+    return batchClients(clients, probeClient, "Not available", timeout)
+
+def icmpAndProbeClients(clients, ping_timeout, probe_timeout):
+    """ Ping and check ssh connectivity with a list of clients """
+    return batchClients(clients, icmpAndProbeClient, 0, ping_timeout, probe_timeout)
+
 def downloadFile(client, path, bwlimit, timeout):
     """
     Get the first file found in the given path from client.
@@ -0,0 +1,194 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Pulse 2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+"""
+Bounded capture of the output of commands.
+"""
+
+import os
+import logging
+import tempfile
+from collections import deque
+
+
+def _is_utf8_continuation(char):
+    return 0x80 <= ord(char) <= 0xbf
+
+
+class OutputBuffer(object):
+    """
+    Keeps the head and the tail of an output as lists of chunks.
+
+    Whatever the output size, at most head_size + tail_size bytes are kept
+    in memory, the skipped middle part being replaced by a marker in the
+    trimmed view. The cuts are moved on UTF-8 characters boundaries.
+
+    In spill mode, the whole output is also written into a temporary
+    file of spill_dir, named by spill_path, until the buffer is closed.
+    """
+    # replaces the skipped part in the trimmed view
+    SKIP_MARKER = "\n[... %d bytes skipped ...]\n"
+
+    def __init__(self, head_size=0, tail_size=0, spill_dir=None):
+        """
+        @param head_size: max bytes kept from the start of output
+        @type head_size: int
+
+        @param tail_size: max bytes kept from the end of output,
+                          if both sizes are 0, the output is not bounded
+        @type tail_size: int
+
+        @param spill_dir: directory of the file of whole output (no file if None)
+        @type spill_dir: str
+        """
+        self.head_size = head_size
+        self.tail_size = tail_size
+        self.spill_dir = spill_dir
+
+        self.head = []
+        # the head is full, following data go to the tail
+        self.head_full = False
+        self.tail = deque()
+        # byte counters
+        self.received = 0
+        self.head_length = 0
+        self.tail_length = 0
+
+        self.spill_path = None
+        self._spill_file = None
+        self._value = ""
+        self._changed = False
+
+    @property
+    def bounded(self):
+        return self.head_size + self.tail_size > 0
+
+    @property
+    def skipped(self):
+        """ Number of bytes skipped from the trimmed view """
+        return self.received - self.head_length - self.tail_length
+
+    def write(self, data):
+        """
+        Appends a chunk of output.
+
+        @param data: received data
+        @type data: str
+        """
+        if len(data) == 0 :
+            return
+        self.received += len(data)
+        self._changed = True
+        self._spill(data)
+
+        if not self.head_full :
+            if self.bounded and self.head_length + len(data) > self.head_size :
+                cut = self.head_size - self.head_length
+                while cut > 0 and _is_utf8_continuation(data[cut]) :
+                    cut -= 1
+                self.head.append(data[:cut])
+                self.head_length += cut
+                self.head_full = True
+                # remaining part not fitting into the head
+                data = data[cut:]
+            else :
+                self.head.append(data)
+                self.head_length += len(data)
+                return
+
+        self.tail.append(data)
+        self.tail_length += len(data)
+        self._trim_tail()
+
+    def _trim_tail(self):
+        """ Drops the oldest chunks of tail exceeding tail_size """
+        while self.tail_length > self.tail_size :
+            first = self.tail[0]
+            excess = self.tail_length - self.tail_size
+            if len(first) <= excess :
+                self.tail.popleft()
+                self.tail_length -= len(first)
+            else :
+                while excess < len(first) and _is_utf8_continuation(first[excess]) :
+                    excess += 1
+                self.tail[0] = first[excess:]
+                self.tail_length -= excess
+
+    def _spill(self, data):
+        """
+        Writes the data into the file of whole output.
+
+        @param data: received data
+        @type data: str
+        """
+        if self.spill_dir is None :
+            return
+        try:
+            if self._spill_file is None :
+                fd, self.spill_path = tempfile.mkstemp(prefix="pulse2-output-",
+                                                       dir=self.spill_dir)
+                self._spill_file = os.fdopen(fd, "wb")
+            self._spill_file.write(data)
+        except (IOError, OSError), e:
+            logging.getLogger().warn("Output spill into %s failed: %s" % (self.spill_dir, str(e)))
+            self.spill_dir = None
+
+    def getvalue(self):
+        """
+        Gets the trimmed view of output.
+
+        @rtype: str
+        """
+        if self._changed :
+            if self.skipped > 0 :
+                marker = self.SKIP_MARKER % self.skipped
+            else :
+                marker = ""
+            self._value = "".join(self.head) + marker + "".join(self.tail)
+            self._changed = False
+        return self._value
+
+    def getStatistics(self):
+        """
+        @return: byte counters
+        @rtype: dict
+        """
+        return {'received': self.received,
+                'skipped': self.skipped,
+                }
+
+    def end(self):
+        """ Closes the file of whole output, which stays readable until close() """
+        if self._spill_file is not None :
+            try:
+                self._spill_file.close()
+            except (IOError, OSError), e:
+                logging.getLogger().warn("Output spill into %s failed: %s" % (self.spill_path, str(e)))
+            self._spill_file = None
+
+    def close(self):
+        """ Closes and removes the file of whole output """
+        if self._spill_file is not None :
+            self._spill_file.close()
+            self._spill_file = None
+        if self.spill_path is not None and os.path.exists(self.spill_path):
+            os.unlink(self.spill_path)
+        self.spill_path = None
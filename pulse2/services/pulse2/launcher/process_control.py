@@ -38,6 +38,10 @@ import twisted.internet.protocol
 # Others Pulse2 Stuff
 from pulse2.utils import Singleton, HasSufficientMemory
 from pulse2.launcher.config import LauncherConfig
+from pulse2.launcher.xmlrpc import getProxy
+from pulse2.launcher.utils import getScheduler
+from pulse2.launcher.output import OutputBuffer
+from pulse2.launcher.transfers import TransferScheduler
 from pulse2.consts import PULSE2_WRAPPER_ERROR_SIGNAL_BASE
 
 @HasSufficientMemory(80)
@@ -100,6 +104,7 @@ def commandForker(cmd, cbCommandEnd, id, defer_results, callbackName, max_exec_t
         # do some cleanup
         return False
 
+    process.max_age = max_exec_time
     if not ProcessList().addProcess(process, id):
         logging.getLogger().warn('launcher %s: attempted to add command %s twice ??' % (LauncherConfig().name, id))
         # FIXME: need to do some cleanup
@@ -109,7 +114,6 @@ def commandForker(cmd, cbCommandEnd, id, defer_results, callbackName, max_exec_t
     process.returnxmlrpcfunc = callbackName
     process.defer_results = defer_results
     process.endback = cbCommandEnd
-    process.max_age = max_exec_time
     process.group = group
     process.kind = kind
     return True
@@ -133,8 +137,17 @@ class commandProtocol(twisted.internet.protocol.ProcessProtocol):
         self.max_age = 0
 
         # command output
-        self.stdout = ""
-        self.stderr = ""
+        config = LauncherConfig()
+        if config.output_spill_dir:
+            spill_dir = config.output_spill_dir
+        else:
+            spill_dir = None
+        self.stdout_buffer = OutputBuffer(config.output_head_size,
+                                          config.output_tail_size,
+                                          spill_dir)
+        self.stderr_buffer = OutputBuffer(config.output_head_size,
+                                          config.output_tail_size,
+                                          spill_dir)
 
         # command stats
         timestamp = time.time()
@@ -153,15 +166,23 @@ class commandProtocol(twisted.internet.protocol.ProcessProtocol):
     def write(self,data):
         self.transport.write(data)
 
+    @property
+    def stdout(self):
+        return self.stdout_buffer.getvalue()
+
+    @property
+    def stderr(self):
+        return self.stderr_buffer.getvalue()
+
     def outReceived(self, data):
-        self.stdout += data
+        self.stdout_buffer.write(data)
         self.lastout = data
         timestamp = time.time()
         self.last_see_time = timestamp
         self.last_stdout_time = timestamp
 
     def errReceived(self, data):
-        self.stderr += data
+        self.stderr_buffer.write(data)
         timestamp = time.time()
         self.last_see_time = timestamp
         self.last_stderr_time = timestamp
@@ -184,9 +205,24 @@ class commandProtocol(twisted.internet.protocol.ProcessProtocol):
         self.last_see_time = timestamp
         self.end_time = timestamp
 
+        # the whole output is complete
+        self.stdout_buffer.end()
+        self.stderr_buffer.end()
+
+        managed = self.id is not None and ProcessList().getProcess(self.id) is self
+        if managed:
+            ProcessList().processEnded(self.id)
+
         if self.deferred:                   # if deffered exists, we should be in sync mode
             self.deferred.callback(self)    # fire callback
+            self.cleanUp()                  # never removed from the process list
             return                          # and stop (will not go further)
+        if not managed:
+            # nobody will remove it from the process list
+            if not self.defer_results:
+                self.installEndBack()
+            self.cleanUp()
+            return
         if not self.defer_results:          # if we have to send results when available (ie defer_results == False)
             self.installEndBack()           # install and fire callback immediately
 
@@ -232,6 +268,11 @@ class commandProtocol(twisted.internet.protocol.ProcessProtocol):
             'signal': self.signal,
             'pid': pid,
             'done': self.done,
+            'stdout_bytes': self.stdout_buffer.received,
+            'stderr_bytes': self.stderr_buffer.received,
+            # files of whole outputs, in spill mode
+            'stdout_spill': self.stdout_buffer.spill_path or '',
+            'stderr_spill': self.stderr_buffer.spill_path or '',
         }
 
     def getStatistics(self):
@@ -288,56 +329,99 @@ class commandProtocol(twisted.internet.protocol.ProcessProtocol):
     def getAge(self):
         return time.time() - self.start_time
 
+    def cleanUp(self):
+        """ releases the captured output """
+        self.stdout_buffer.close()
+        self.stderr_buffer.close()
+
 class ProcessList(Singleton):
     """
         Launcher core: kep a track of launched commands
     """
     _processArr = dict()
+    _running = set()    # ids of running commands
+    _zombies = set()    # ids of finished commands not yet removed
+    _timeouts = dict()  # kills of out-of-time commands, by id
     _event = list()
     slots = 0           # max number of commands
-    sleepperiod = 60    # amount of second between two wake-up
     default_timeout = 0 # number of second above which we kill a process
+    push_pending = False # a push of slots to the scheduler is scheduled
 
     """ Singleton Setup """
     def setup(self, slots, default_timeout):
         self.slots = slots
         self.default_timeout = default_timeout
-        self.scheduleWakeUp()
-
-    """ Periodical wake-up stuff """
-    def wakeUp(self):
-        # do things here
-        self.killOldCommands()
-        # reschedule
-        self.scheduleWakeUp()
-
-    def scheduleWakeUp(self):
-        twisted.internet.reactor.callLater(self.sleepperiod, self.wakeUp)
-
-    """ Administrative tasks """
-    def killOldCommands(self):
-        """ attempt to kill out-of-time commands """
-        if self.getRunningCount() > 0:
-            for id in self.getRunningIds():
-                process = self.getProcess(id)
-                times = process.getTimes()
-                # priority check order: use process.max_age if not 0, else use self.default_timeout if not 0
-                if not process.max_age == 0:
-                    if times['age'] > process.max_age: # kill time
-                        logging.getLogger().warn('launcher %s: killing %s (out of time: current %s, max %s)' % (LauncherConfig().name, id, times['age'], process.max_age))
-                        killProcess(id)
-                elif not self.default_timeout == 0:
-                    if times['age'] > self.default_timeout: # kill time
-                        logging.getLogger().warn('launcher %s: killing %s (out of time: current %s, max %s)' % (LauncherConfig().name, id, times['age'], self.default_timeout))
-                        killProcess(id)
+
+    """ Timeouts handling """
+    def scheduleTimeout(self, id):
+        """ schedule the kill of command when out of time """
+        process = self.getProcess(id)
+        # priority check order: use process.max_age if not 0, else use self.default_timeout if not 0
+        if not process.max_age == 0:
+            max_age = process.max_age
+        elif not self.default_timeout == 0:
+            max_age = self.default_timeout
+        else:
+            return
+        delay = max(0, max_age - process.getAge())
+        self._timeouts[id] = twisted.internet.reactor.callLater(delay, self.killOnTimeout, id, max_age)
+
+    def cancelTimeout(self, id):
+        delayed = self._timeouts.pop(id, None)
+        if delayed and delayed.active():
+            delayed.cancel()
+
+    def killOnTimeout(self, id, max_age):
+        """ kill an out-of-time command """
+        self._timeouts.pop(id, None)
+        if self.isRunning(id):
+            process = self.getProcess(id)
+            logging.getLogger().warn('launcher %s: killing %s (out of time: current %s, max %s)' % (LauncherConfig().name, id, process.getAge(), max_age))
+            killProcess(id)
+
+    """ Slots pushing to the scheduler """
+    def scheduleSlotsPush(self):
+        """ push the slots usage to our scheduler, coalescing the changes """
+        delay = LauncherConfig().slots_push_delay
+        if delay <= 0 or self.push_pending:
+            return
+        self.push_pending = True
+        twisted.internet.reactor.callLater(delay, self.pushSlots)
+
+    def pushSlots(self):
+        def _eb(reason): # the scheduler will poll us, log and continue
+            logging.getLogger().debug('launcher %s: failed to push slots to our scheduler: %s' % (LauncherConfig().name, reason.value))
+
+        self.push_pending = False
+        mydeffered = getProxy(getScheduler()).callRemote(
+            'tell_slots',
+            LauncherConfig().name,
+            self.slots,
+            self.getProcessCount()
+        )
+        mydeffered.addErrback(_eb)
+        return mydeffered
 
     """ Process handling """
     def addProcess(self, obj, id):
         if not self.canAddThisProcess(id):
             return False
         self._processArr[id] = obj
+        if obj.done:
+            self._zombies.add(id)
+        else:
+            self._running.add(id)
+            self.scheduleTimeout(id)
+        self.scheduleSlotsPush()
         return True
 
+    def processEnded(self, id):
+        """ a tracked command ends: running -> zombie """
+        self.cancelTimeout(id)
+        self._running.discard(id)
+        self._zombies.add(id)
+        TransferScheduler().finished(id)
+
     def canAddThisProcess(self, id):
         if self.existsProcess(id):
             return False
@@ -354,10 +438,15 @@ class ProcessList(Singleton):
         return None
 
     def existsProcess(self, id):
-        return id in self._processArr.keys()
+        return id in self._processArr
 
     def removeProcess(self, id):
+        self.cancelTimeout(id)
+        self._running.discard(id)
+        self._zombies.discard(id)
+        self._processArr[id].cleanUp()
         del self._processArr[id]
+        self.scheduleSlotsPush()
 
     """ Massive process handling """
     def listProcesses(self):
@@ -375,31 +464,23 @@ class ProcessList(Singleton):
 
     """ Zombies handling """
     def isZombie(self, id):
-        return self.getProcess(id).done
+        return id in self._zombies
 
     def getZombieIds(self):
-        ret = []
-        for i in self.listProcesses().keys():
-            if self.isZombie(i):
-                ret.append(i)
-        return ret
+        return list(self._zombies)
 
     def getZombiesCount(self):
-        return len(self.getZombieIds())
+        return len(self._zombies)
 
     """ Running handling """
     def isRunning(self, id):
-        return not self.isZombie(id)
+        return id in self._running
 
     def getRunningIds(self):
-        ret = []
-        for i in self.listProcesses().keys():
-            if self.isRunning(i):
-                ret.append(i)
-        return ret
+        return list(self._running)
 
     def getRunningCount(self):
-        return len(self.getRunningIds())
+        return len(self._running)
 
 """ XMLRPC functions """
 def getProcessCount():
@@ -466,12 +547,12 @@ def termProcess(id):
     process = ProcessList().getProcess(id)
     if process:
         return process.sendSigTerm()
-    return False
+    return TransferScheduler().cancel(id)
 def killProcess(id):
     process = ProcessList().getProcess(id)
     if process:
         return process.sendSigKill()
-    return False
+    return TransferScheduler().cancel(id)
 def hupProcess(id):
     process = ProcessList().getProcess(id)
     if process:
@@ -35,6 +35,7 @@ from base64 import b64encode
 import pulse2.launcher.process_control
 import pulse2.launcher.utils
 from pulse2.launcher.config import LauncherConfig
+from pulse2.launcher.transfers import TransferScheduler
 from pulse2.launcher.xmlrpc import getProxy
 from pulse2.consts import PULSE2_WRAPPER_ARG_SEPARATOR
 
@@ -47,6 +48,20 @@ def async_remote_push(command_id, client, files_list, wrapper_timeout):
     return remote_push(command_id, client, files_list, 'async', wrapper_timeout)
 
 def remote_push(command_id, client, files_list, mode, wrapper_timeout):
+    """ Handle remote copy (push), async transfers sharing the bandwidth of their group """
+    if mode == 'async':
+        def start(maxbw):
+            if maxbw:
+                client['maxbw'] = maxbw
+            return _remote_push(command_id, client, files_list, mode, wrapper_timeout)
+        return TransferScheduler().request(command_id,
+                                           client.get('group'),
+                                           client.get('maxbw', 0),
+                                           start,
+                                           'completed_push')
+    return _remote_push(command_id, client, files_list, mode, wrapper_timeout)
+
+def _remote_push(command_id, client, files_list, mode, wrapper_timeout):
     """ Handle remote copy (push) """
     target_path = os.path.join(LauncherConfig().target_path, pulse2.launcher.utils.getTempFolderName(command_id, client['uuid']))
     client = pulse2.launcher.utils.setDefaultClientOptions(client)
@@ -125,6 +140,20 @@ def async_remote_pull(command_id, client, files_list, wrapper_timeout):
     return remote_pull(command_id, client, files_list, 'async', wrapper_timeout)
 
 def remote_pull(command_id, client, files_list, mode, wrapper_timeout):
+    """ Handle remote copy (pull) on target, async transfers sharing the bandwidth of their group """
+    if mode == 'async':
+        def start(maxbw):
+            if maxbw:
+                client['maxbw'] = maxbw
+            return _remote_pull(command_id, client, files_list, mode, wrapper_timeout)
+        return TransferScheduler().request(command_id,
+                                           client.get('group'),
+                                           client.get('maxbw', 0),
+                                           start,
+                                           'completed_pull')
+    return _remote_pull(command_id, client, files_list, mode, wrapper_timeout)
+
+def _remote_pull(command_id, client, files_list, mode, wrapper_timeout):
     """ Handle remote copy (pull) on target """
     client = pulse2.launcher.utils.setDefaultClientOptions(client)
     target_path = os.path.join(LauncherConfig().target_path, pulse2.launcher.utils.getTempFolderName(command_id, client['uuid']))
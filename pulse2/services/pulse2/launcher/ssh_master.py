@@ -0,0 +1,135 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Pulse 2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+"""
+Pool of SSH control masters.
+
+The first SSH connection to a client becomes a control master (see
+ControlMaster in ssh_config(5)), the following ones of the next phases
+are multiplexed into its already authenticated channel. An idle master
+exits by itself after ssh_control_persist seconds.
+"""
+
+import os
+import time
+import logging
+import subprocess
+
+import pulse2.utils
+from pulse2.launcher.config import LauncherConfig
+
+
+class SSHMasterPool(pulse2.utils.Singleton):
+    """
+    Tracks the control masters opened by launcher, keyed by client host.
+
+    At most ssh_max_masters masters are kept, above this cap
+    the connections to other clients are not multiplexed.
+    """
+    # {(user, host, port): last use timestamp}
+    masters = {}
+    enabled = False
+
+    def setup(self):
+        """
+        Creates the directory of control sockets.
+
+        @return: True if multiplexing is enabled
+        @rtype: bool
+        """
+        config = LauncherConfig()
+        self.enabled = config.ssh_multiplexing
+        if not self.enabled :
+            return False
+        try:
+            if not os.path.isdir(config.ssh_control_dir):
+                os.makedirs(config.ssh_control_dir, 0700)
+        except OSError, e:
+            logging.getLogger().warn("launcher %s: can't create %s, SSH multiplexing disabled: %s" % (config.name, config.ssh_control_dir, str(e)))
+            self.enabled = False
+        return self.enabled
+
+    def controlPath(self, key):
+        """
+        @param key: (user, host, port) of client
+        @type key: tuple
+
+        @return: path of control socket
+        @rtype: str
+        """
+        return os.path.join(LauncherConfig().ssh_control_dir, "%s@%s:%s" % key)
+
+    def expire(self, now=None):
+        """
+        Forgets the masters idle for more than ssh_control_persist seconds.
+
+        A master still serving a long session keeps its socket,
+        so it is kept in the pool.
+
+        @param now: current timestamp
+        @type now: float
+        """
+        if now is None :
+            now = time.time()
+        max_idle = LauncherConfig().ssh_control_persist
+        for key, last_use in self.masters.items() :
+            if now - last_use > max_idle and not os.path.exists(self.controlPath(key)):
+                del self.masters[key]
+
+    def getOptions(self, client):
+        """
+        Gets the SSH options to reach a client through the pool.
+
+        @param client: client connection infos (see setDefaultClientOptions)
+        @type client: dict
+
+        @return: SSH options
+        @rtype: list
+        """
+        if not self.enabled :
+            return []
+        key = (client['user'], client['host'], client['port'])
+        now = time.time()
+        if not key in self.masters and len(self.masters) >= LauncherConfig().ssh_max_masters :
+            self.expire(now)
+            if len(self.masters) >= LauncherConfig().ssh_max_masters :
+                logging.getLogger().debug("launcher %s: SSH masters pool full, %s not multiplexed" % (LauncherConfig().name, client['host']))
+                return ['-o', 'ControlMaster=no', '-o', 'ControlPath=none']
+        self.masters[key] = now
+        return ['-o', 'ControlMaster=auto',
+                '-o', 'ControlPath=%s' % self.controlPath(key),
+                '-o', 'ControlPersist=%d' % LauncherConfig().ssh_control_persist]
+
+    def closeAll(self):
+        """ Asks the running masters to exit """
+        config = LauncherConfig()
+        devnull = open(os.devnull, 'w')
+        try:
+            for key in self.masters.keys() :
+                path = self.controlPath(key)
+                if os.path.exists(path):
+                    subprocess.call([config.ssh_path,
+                                     '-o', 'ControlPath=%s' % path,
+                                     '-O', 'exit', key[1]],
+                                    stdout=devnull, stderr=devnull)
+        finally:
+            devnull.close()
+        self.masters.clear()
@@ -26,6 +26,7 @@
 """
 
 from pulse2.launcher.process_control import ProcessList
+from pulse2.launcher.transfers import TransferScheduler
 
 def getBalance(config):
     """ Attempt to give enought information to take a decision on
@@ -79,4 +80,7 @@ def getBalance(config):
             kind_stats[process_state['kind']]['running'] += 1
             counts['running'] += 1
 
-    return {'by_group': group_stats, 'global': counts, 'by_kind': kind_stats}
+    # bandwidth budget and throughput counters by group
+    transfer_stats = TransferScheduler().getStatistics()
+
+    return {'by_group': group_stats, 'global': counts, 'by_kind': kind_stats, 'by_network': transfer_stats}
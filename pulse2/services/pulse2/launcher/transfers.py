@@ -0,0 +1,234 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Pulse 2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+"""
+Sharing of a bandwidth budget between the transfers of a client group.
+
+Each client group (usually a network, see the 'group' of client) can
+have a budget in bit/s. The transfers of a group are queued, then
+admitted while the budget is not fully allocated, each one getting
+the fair share of the free budget as bandwidth limit. As the limit of
+a running transfer can't be changed, the budget is shared again on each
+admission: when a transfer ends, its bandwidth goes to the queued ones.
+"""
+
+import time
+import logging
+from base64 import b64encode
+
+import twisted.internet.reactor
+
+from pulse2.utils import Singleton
+from pulse2.launcher.config import LauncherConfig
+from pulse2.launcher.xmlrpc import getProxy
+from pulse2.launcher.utils import getScheduler
+from pulse2.consts import PULSE2_WRAPPER_ERROR_FAILURE
+
+
+class TransferScheduler(Singleton):
+    """
+    Queues the transfers and admits them within the budget of their group.
+    """
+    # {group: {id: allocated bit/s}}
+    active = {}
+    # {group: [(id, maxbw, start, callbackName)]}
+    queue = {}
+    # {id: (group, start timestamp)} of admitted transfers
+    admitted = {}
+    # groups having a scheduled admission
+    pending = set()
+    # {group: {'completed': n, 'allocated_bandwidth_estimate': bits}}
+    counters = {}
+
+    def getBudget(self, group):
+        """
+        @param group: client group
+        @type group: str
+
+        @return: budget of group in bit/s, 0 if not limited
+        @rtype: int
+        """
+        config = LauncherConfig()
+        return config.transfer_budgets.get(group, config.transfer_budget)
+
+    def request(self, id, group, maxbw, start, callbackName):
+        """
+        Starts a transfer, or queues it until its group has enough bandwidth.
+
+        @param id: commands_on_host id
+        @type id: int
+
+        @param group: client group
+        @type group: str
+
+        @param maxbw: bandwidth limit of command in bit/s, 0 if not limited
+        @type maxbw: int
+
+        @param start: called with the bandwidth limit to start the transfer,
+                      returns True if started
+        @type start: callable
+
+        @param callbackName: scheduler method receiving the result
+        @type callbackName: str
+
+        @return: True if the transfer is started or queued
+        @rtype: bool
+        """
+        group = group or ''
+        if self.getBudget(group) <= 0 :
+            return start(maxbw)
+        if self.isQueued(id) or id in self.admitted :
+            logging.getLogger().warn('launcher %s: attempted to add transfer #%s twice' % (LauncherConfig().name, id))
+            return False
+        self.queue.setdefault(group, []).append((id, maxbw, start, callbackName))
+        self.scheduleAdmission(group)
+        return True
+
+    def scheduleAdmission(self, group):
+        """
+        Admits the queued transfers after admission_delay seconds,
+        so the transfers requested together share the budget.
+
+        @param group: client group
+        @type group: str
+        """
+        delay = LauncherConfig().transfer_admission_delay
+        if delay <= 0 :
+            self.admit(group)
+        elif not group in self.pending :
+            self.pending.add(group)
+            twisted.internet.reactor.callLater(delay, self.admit, group)
+
+    def admit(self, group):
+        """
+        Starts the queued transfers of group while its budget is not
+        fully allocated.
+
+        @param group: client group
+        @type group: str
+        """
+        self.pending.discard(group)
+        budget = self.getBudget(group)
+        min_rate = min(LauncherConfig().transfer_min_rate, budget)
+        active = self.active.setdefault(group, {})
+        queue = self.queue.get(group, [])
+
+        while len(queue) > 0 :
+            free = budget - sum(active.values())
+            if free < min_rate or free <= 0 :
+                break
+            id, maxbw, start, callbackName = queue.pop(0)
+            rate = min(free, max(free / (len(queue) + 1), min_rate))
+            if maxbw > 0 :
+                rate = min(rate, maxbw)
+            if start(rate):
+                active[id] = rate
+                self.admitted[id] = (group, time.time())
+                logging.getLogger().debug('launcher %s: transfer #%s started at %d bit/s' % (LauncherConfig().name, id, rate))
+            else :
+                self.notifyFailure(id, callbackName)
+
+    def finished(self, id):
+        """
+        Gives the bandwidth of an ended transfer to the queued ones.
+
+        @param id: commands_on_host id
+        @type id: int
+        """
+        if not id in self.admitted :
+            return
+        group, started = self.admitted.pop(id)
+        rate = self.active[group].pop(id)
+        counters = self.counters.setdefault(group, {'completed': 0, 'allocated_bandwidth_estimate': 0.0})
+        counters['completed'] += 1
+        counters['allocated_bandwidth_estimate'] += rate * (time.time() - started)
+        if len(self.queue.get(group, [])) > 0 :
+            self.admit(group)
+
+    def isQueued(self, id):
+        for queue in self.queue.values():
+            for queued in queue :
+                if queued[0] == id :
+                    return True
+        return False
+
+    def cancel(self, id):
+        """
+        Removes a transfer from the queue.
+
+        @param id: commands_on_host id
+        @type id: int
+
+        @return: True if the transfer was queued
+        @rtype: bool
+        """
+        for queue in self.queue.values():
+            for queued in queue :
+                if queued[0] == id :
+                    queue.remove(queued)
+                    return True
+        return False
+
+    def notifyFailure(self, id, callbackName):
+        """
+        Sends the failure of a queued transfer to our scheduler,
+        as its request was already answered.
+
+        @param id: commands_on_host id
+        @type id: int
+
+        @param callbackName: scheduler method receiving the result
+        @type callbackName: str
+        """
+        def _eb(reason):
+            logging.getLogger().warn('launcher %s: failed to send results of command #%s to our scheduler: %s' % (LauncherConfig().name, id, reason.value))
+
+        logging.getLogger().warn('launcher %s: queued transfer #%s failed to start' % (LauncherConfig().name, id))
+        mydeffered = getProxy(getScheduler()).callRemote(
+            callbackName,
+            LauncherConfig().name,
+            (PULSE2_WRAPPER_ERROR_FAILURE, b64encode(''), b64encode('transfer failed to start on launcher')),
+            id
+        )
+        mydeffered.addErrback(_eb)
+
+    def getStatistics(self):
+        """
+        The bandwidth estimate of a group sums, for its completed
+        transfers, the allocated rate multiplied by the transfer duration.
+        It is an upper bound of the transferred bits, not a measure.
+
+        @return: budget, transfers counters and bandwidth estimate
+                 (bits, float) by client group
+        @rtype: dict
+        """
+        stats = {}
+        groups = set(self.active.keys() + self.queue.keys() + self.counters.keys())
+        for group in groups :
+            counters = self.counters.get(group, {'completed': 0, 'allocated_bandwidth_estimate': 0.0})
+            stats[group] = {'budget': self.getBudget(group),
+                            'allocated': sum(self.active.get(group, {}).values()),
+                            'active': len(self.active.get(group, {})),
+                            'queued': len(self.queue.get(group, [])),
+                            'completed': counters['completed'],
+                            'allocated_bandwidth_estimate': counters['allocated_bandwidth_estimate'],
+                            }
+        return stats
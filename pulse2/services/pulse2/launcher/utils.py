@@ -28,6 +28,7 @@ Some utils
 import hashlib
 
 from pulse2.launcher.config import LauncherConfig
+from pulse2.launcher.ssh_master import SSHMasterPool
 
 def getScheduler():
     """ Get our referent scheduler """
@@ -107,6 +108,7 @@ def setDefaultClientOptions(client):
         client['transp_args'] = ['-T', '-o', 'IdentityFile=%s' % client['cert'], '-o', 'User=%s' % client['user']]
         for option in LauncherConfig().ssh_options:
             client['transp_args'] += ['-o', option]
+        client['transp_args'] += SSHMasterPool().getOptions(client)
         if LauncherConfig().ssh_forward_key == 'always' or \
             LauncherConfig().ssh_forward_key == 'let' and 'forward_key' in client:
             client['transp_args'] += ['-A']
@@ -147,6 +149,7 @@ def setDefaultClientOptions(client):
         client['transp_args'] = ['-T', '-o', 'IdentityFile=%s' % client['cert'], '-o', 'User=%s' % client['user']]
         for option in LauncherConfig().ssh_options:
             client['transp_args'] += ['-o', option]
+        client['transp_args'] += SSHMasterPool().getOptions(client)
 
     # Local Proxy mode (obviously using rsync)
     if client['protocol'] == 'rsyncproxy':
@@ -159,6 +162,7 @@ def setDefaultClientOptions(client):
         client['transp_args'] = ['-T', '-o', 'IdentityFile=%s' % client['cert'], '-o', 'User=%s' % client['user']]
         for option in LauncherConfig().ssh_options:
             client['transp_args'] += ['-o', option]
+        client['transp_args'] += SSHMasterPool().getOptions(client)
         client['transp_args'] += ['-A'] # always forward TCP key
         client['transp_args'] += ['-o', 'UserKnownHostsFile=/dev/null', '-o', 'StrictHostKeyChecking=no'] # required to prevent key forwarding failure
         if not 'proto_args' in client:
@@ -182,6 +186,7 @@ def setDefaultClientOptions(client):
             client['proto_args'] += ['--partial', '--append']
         for option in LauncherConfig().ssh_options:
             client['transp_args'] += ['-o', option]
+        client['transp_args'] += SSHMasterPool().getOptions(client)
         client['proto_args'] += ['--rsh', ' '.join([LauncherConfig().ssh_path] + client['transp_args'])]
         if 'maxbw' in client:
             if client['maxbw'] == 0: # bwlimit forced to 0 => no BW limit
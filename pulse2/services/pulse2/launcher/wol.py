@@ -0,0 +1,126 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Pulse 2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+"""
+In-process sending of Wake-on-LAN magic packets.
+"""
+
+import re
+import socket
+import logging
+import binascii
+
+import twisted.internet.reactor
+from twisted.internet.defer import Deferred
+
+from pulse2.launcher.config import LauncherConfig
+
+
+def magicPacket(mac_addr):
+    """
+    Builds the magic packet waking up a computer.
+
+    @param mac_addr: MAC address, with or without separators
+    @type mac_addr: str
+
+    @return: 6 bytes 0xff followed by 16 times the MAC address
+    @rtype: str
+    """
+    digits = re.sub('[:.-]', '', mac_addr.strip())
+    if not re.match('^[0-9a-fA-F]{12}$', digits):
+        raise ValueError("invalid MAC address: %s" % mac_addr)
+    return '\xff' * 6 + binascii.unhexlify(digits) * 16
+
+
+class WOLSender(object):
+    """
+    Sends the magic packets of lists of MAC addresses, grouped by
+    broadcast address, through one UDP socket per broadcast address.
+
+    The whole list is sent repeat times, waiting delay seconds
+    between two packets.
+    """
+
+    def __init__(self, port, repeat=1, delay=0):
+        """
+        @param port: UDP destination port
+        @type port: int
+
+        @param repeat: number of times each packet is sent
+        @type repeat: int
+
+        @param delay: delay between two packets (in seconds)
+        @type delay: float
+        """
+        self.port = port
+        self.repeat = max(1, repeat)
+        self.delay = delay
+
+    def _open(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        return sock
+
+    def send(self, networks):
+        """
+        Sends the magic packets.
+
+        @param networks: MAC addresses by broadcast address
+        @type networks: dict
+
+        @return: sending success by broadcast address
+        @rtype: Deferred
+        """
+        results = {}
+        packets = []
+        for bcast, mac_addrs in networks.items():
+            results[bcast] = True
+            for mac_addr in mac_addrs:
+                try:
+                    packets.append((bcast, magicPacket(mac_addr)))
+                except ValueError, e:
+                    logging.getLogger().warn("launcher %s: WOL: %s" % (LauncherConfig().name, str(e)))
+                    results[bcast] = False
+        packets = packets * self.repeat
+
+        sockets = {}
+        d = Deferred()
+
+        def _send(index):
+            while index < len(packets):
+                bcast, packet = packets[index]
+                index += 1
+                try:
+                    if not bcast in sockets :
+                        sockets[bcast] = self._open()
+                    sockets[bcast].sendto(packet, (bcast, self.port))
+                except socket.error, e:
+                    logging.getLogger().warn("launcher %s: WOL on %s failed: %s" % (LauncherConfig().name, bcast, str(e)))
+                    results[bcast] = False
+                if self.delay > 0 and index < len(packets):
+                    twisted.internet.reactor.callLater(self.delay, _send, index)
+                    return
+            for sock in sockets.values():
+                sock.close()
+            d.callback(results)
+
+        _send(0)
+        return d
@@ -31,6 +31,8 @@ import sys
 
 from pulse2.package_server.config import config_addons
 from pulse2.package_server.common import Common
+from pulse2.package_server.common.watcher import PackageWatcher
+from pulse2.package_server.common.replication import MirrorReplication
 from pulse2.package_server.common.serializer import PkgsRsyncStateSerializer
 import pulse2.utils
 
@@ -69,7 +71,29 @@ class ThreadPackageDetect(ThreadPackageHelper):
             logging.getLogger().error('an Exception happened when trying to detect packages:' + str(e))
         self.working = False
 
+    def startWatcher(self):
+        """
+        Detect the packages from inotify events, the full detection
+        only being a periodic consistency check.
+
+        @return: True if the package watcher is started
+        @rtype: bool
+        """
+        watcher = PackageWatcher()
+        watcher.init(self.config, Common().detectChangedPackage)
+        if not watcher.start(Common().mp2src.values()):
+            return False
+        if self.config.package_detect_tmp_activate:
+            t = task.LoopingCall(Common().moveCorrectPackages)
+            t.start(self.config.package_detect_loop)
+        l = task.LoopingCall(self.runSub)
+        l.start(self.config.package_detect_rescan_loop, now = False)
+        return True
+
     def run(self):
+        if self.config.package_detect_inotify and self.startWatcher():
+            self.logger.info("Package detection is driven by inotify")
+            return
         l = task.LoopingCall(self.runSub)
         l.start(self.config.package_detect_loop)
 
@@ -139,6 +163,8 @@ class ThreadPackageMirror(ThreadPackageHelper):
     def __init__(self, config, sync_status):
         ThreadPackageHelper.__init__(self, config)
         self.status = self.config.package_mirror_status_file
+        self.semaphore = defer.DeferredSemaphore(max(1, self.config.package_mirror_concurrency))
+        MirrorReplication().init(config, Common().hash_index)
         if not sync_status:
             # sync global
             Common().rsyncPackageOnMirrors()
@@ -146,25 +172,29 @@ class ThreadPackageMirror(ThreadPackageHelper):
     def onError(self, reason, args):
         pid, target = args
         self.logger.warning("ThreadPackageMirror failed to synchronise %s" % (str(reason)))
+        MirrorReplication().finish(pid, target, False)
 
     def onSuccess(self, result, args):
-        pid, target, is_deletion = args
+        pid, target, is_deletion, manifest, files = args
         out, err, code = result
         if code == 0:
             self.logger.debug("ThreadPackageMirror succeed %s" % (str(result)))
+            MirrorReplication().finish(pid, target, True, manifest, files)
             Common().removePackagesFromRsyncList(pid, target)
         else:
             self.logger.error("ThreadPackageMirror mirroring command failed %s" % (str(result)))
+            MirrorReplication().finish(pid, target, False)
 
     def _runSub(self):
         def mirror_level0(result, args):
-            pid, target, is_deletion = args
+            pid, target, is_deletion, manifest, files = args
             out, err, code = result
             if code == 0:
                 pkg = Common().packages[pid]
                 try:
                     self.logger.debug("Removing %s" % (pkg.root))
-                    os.rmdir(pkg.root)
+                    if os.path.exists(pkg.root):
+                        os.rmdir(pkg.root)
                     exe = self.config.package_mirror_command
                     args = []
                     args.extend(self.config.package_mirror_level0_command_options)
@@ -178,59 +208,79 @@ class ThreadPackageMirror(ThreadPackageHelper):
                     self.logger.error("ThreadPackageMirror mirror level0 failed for package %s : %s" % (pid, str(e)))
             else:
                 self.logger.debug("ThreadPackageMirror failed %s" % (str(result)))
+            MirrorReplication().finish(pid, target, False)
 
-        def createDeferred(exe, args, pid, target, is_deletion = False):
+        def createDeferred(exe, args, pid, target, is_deletion = False, manifest = None, files = 0):
             d = utils.getProcessOutputAndValue(exe, args)
             if is_deletion:
-                d.addCallback(mirror_level0, (pid, target, is_deletion))
+                d.addCallback(mirror_level0, (pid, target, is_deletion, manifest, files))
             else:
-                d.addCallback(self.onSuccess, (pid, target, is_deletion))
+                d.addCallback(self.onSuccess, (pid, target, is_deletion, manifest, files))
             d.addErrback(self.onError, (pid, target))
             return d
 
-        def cbEnding(result, self):
-            if result == []:
-                self.logger.debug("ThreadPackageMirror end mirroring")
-            else:
-                self.logger.debug("ThreadPackageMirror end mirroring: %s" % str(result))
-            self.working = False
+        def cbEnding(result, target, files_from):
+            if files_from is not None and os.path.exists(files_from):
+                os.unlink(files_from)
+            self.logger.debug("ThreadPackageMirror progress on %s: %s" % (target, str(MirrorReplication().getStatistics().get(target))))
 
-        if self.working:
-            self.logger.debug("already running")
-            return
-        self.working = True
+        replication = MirrorReplication()
         self.logger.debug("ThreadPackageMirror is looking for new things to mirror")
-        dlist = []
         for pid, targets, pkg in Common().getPackagesThatNeedRsync():
             exe = self.config.package_mirror_command
             p_dir = pkg.root
             is_deletion = False
+            manifest = None
+            targets = [target for target in targets if target != '' and not replication.isRunning(pid, target)]
+            if len(targets) == 0:
+                continue
             if not os.path.exists(p_dir):
                 # deletion = mirror empty dir + mirror top level on just 1 level
                 os.mkdir(p_dir)
                 # mark as deletion
                 is_deletion = True
+            else:
+                manifest = replication.manifest(p_dir)
 
             for target in targets:
-                if target == '':
-                    continue
                 try:
+                    delta = None
+                    if not is_deletion:
+                        delta = replication.delta(target, pid, manifest)
+                    if delta == []:
+                        # nothing changed since the last replication
+                        self.logger.debug("ThreadPackageMirror %s is up to date on %s" % (pid, target))
+                        replication.start(pid, target, 'skipped')
+                        replication.finish(pid, target, True, manifest)
+                        Common().removePackagesFromRsyncList(pid, target)
+                        continue
+
                     self.logger.debug("ThreadPackageMirror will mirror %s on %s" % (pid, target))
                     args = []
                     args.extend(self.config.package_mirror_command_options)
                     if type(self.config.package_mirror_command_options_ssh_options) == list:
                         args.extend(['--rsh', '/usr/bin/ssh -o %s' % (" -o ".join(self.config.package_mirror_command_options_ssh_options))])
-                    args.append(str(p_dir))
+                    files_from = None
+                    if delta is None:
+                        files = manifest and len(manifest) or 0
+                        args.append(str(p_dir))
+                        replication.start(pid, target, 'full')
+                    else:
+                        # only send the changed files, the removed ones being
+                        # deleted on mirror
+                        files = len(delta)
+                        files_from = replication.writeFileList(os.path.basename(p_dir), delta)
+                        args.extend(['--files-from=%s' % files_from, '--delete-missing-args'])
+                        args.append(str("%s%s" % (os.path.dirname(p_dir), os.path.sep)))
+                        replication.start(pid, target, 'delta')
                     args.append("%s:%s" % (target, os.path.dirname(pkg.root)))
                     self.logger.debug("ThreadPackageMirror execute : %s %s" % (exe, str(args)))
-                    dlist.append(createDeferred(exe, args, pid, target, is_deletion))
+                    d = self.semaphore.run(createDeferred, exe, args, pid, target, is_deletion, manifest, files)
+                    d.addBoth(cbEnding, target, files_from)
                 except Exception, e:
+                    replication.finish(pid, target, False)
                     self.logger.error("ThreadPackageMirror failed to mirror %s : %s" % (pid, str(e)))
 
-        dl = defer.DeferredList(dlist)
-        dl.addCallback(cbEnding, (self))
-        return dl
-
     def runSub(self):
         try:
             self._runSub()
@@ -31,15 +31,14 @@ import stat
 import time
 import re
 import shutil
-import hashlib
 import logging
 import random
 from pulse2.package_server.types import File
 from pulse2.package_server.parser import PackageParser
 from pulse2.package_server.find import Find
 import pulse2.utils
-from pulse2.package_server.utilities import md5file
 from pulse2.package_server.common.serializer import PkgsRsyncStateSerializer
+from pulse2.package_server.common.hash_index import FileHashIndex
 
 class Common(pulse2.utils.Singleton):
     """  Base class
@@ -54,6 +53,12 @@ class Common(pulse2.utils.Singleton):
     SMART_DETECT_CHANGES    = 3
     SMART_DETECT_ERROR      = 4
 
+    # incremented on each change of the packages lists, kept on reload,
+    # seeded with the start time so a restart doesn't reuse old versions
+    catalog_version = 0
+    # {(mp, pending, all): packages} computed for catalog_version
+    catalog_views = {}
+
     def init(self, config):
         self.working = True
         self.working_pkgs = {}
@@ -61,7 +66,8 @@ class Common(pulse2.utils.Singleton):
         self.logger.info("Loading PackageServer > Common")
         self.config = config
 
-        self.file_properties = {}
+        self.hash_index = FileHashIndex()
+        self.hash_index.init(config)
         self.packages = {}
         self.mp2p = {}
         self.reverse = {}
@@ -78,13 +84,17 @@ class Common(pulse2.utils.Singleton):
         self.newAssociation = {}
         self.inEdition = {}
         self.mp2src = {}
+        if self.catalog_version == 0:
+            self.catalog_version = int(time.time())
 
         try:
             self._detectPackages()
             self._buildReverse()
             self._buildFileList()
+            self.hash_index.save()
 
             self.logger.info("Common : finish loading %d packages" % (len(self.packages)))
+            self._catalogChanged()
             self.working = False
         except Exception, e:
             self.logger.error("Common : failed to finish loading packages")
@@ -128,20 +138,7 @@ class Common(pulse2.utils.Singleton):
         if len(self.config.mirrors) > 0:
             for mirror_params in self.config.mirrors:
                 try:
-                    access = {
-                        'proto':self.config.proto,
-                        'file_access_uri':mirror_params['file_access_uri'],
-                        'file_access_port':mirror_params['file_access_port'],
-                        'file_access_path':mirror_params['file_access_path']
-                    }
-                    if mirror_params.has_key('mirror'):
-                        access = {
-                            'proto':'',
-                            'file_access_uri':'',
-                            'file_access_port':'',
-                            'file_access_path':'',
-                            'mirror':mirror_params['mirror']
-                        }
+                    access = self._mirrorAccess(mirror_params)
                     self.logger.debug("Getting packages for %s %s %s" % (
                         mirror_params['mount_point'],
                         mirror_params['src'],
@@ -191,12 +188,50 @@ class Common(pulse2.utils.Singleton):
                     self.logger.error("_detectPackages failed for package api put")
                     self.logger.error(e)
 
-    def _detectRemovedAndEditedPackages(self):
+    def _mirrorAccess(self, mirror_params):
+        if mirror_params.has_key('mirror'):
+            return {
+                'proto':'',
+                'file_access_uri':'',
+                'file_access_port':'',
+                'file_access_path':'',
+                'mirror':mirror_params['mirror']
+            }
+        return {
+            'proto':self.config.proto,
+            'file_access_uri':mirror_params['file_access_uri'],
+            'file_access_port':mirror_params['file_access_port'],
+            'file_access_path':mirror_params['file_access_path']
+        }
+
+    def _mountPointsOf(self, src):
+        """
+        Get the mount points serving the packages of a source directory.
+
+        @return: list of (mount point, access)
+        @rtype: list
+        """
+        ret = []
+        src = os.path.normpath(src)
+        for mirror_params in self.config.mirrors:
+            if os.path.normpath(mirror_params['src']) == src:
+                ret.append((mirror_params['mount_point'], self._mirrorAccess(mirror_params)))
+        for mirror_params in self.config.package_api_get + self.config.package_api_put:
+            if os.path.normpath(mirror_params['src']) == src:
+                ret.append((mirror_params['mount_point'], {}))
+        return ret
+
+    def _detectRemovedAndEditedPackages(self, pids = None):
         """
         Look for no more available conf.xml files, and unregister packages.
+
+        @param pids: checked packages, all of them by default
+        @type pids: list
         """
         todelete = []
-        for pid in self.packages:
+        if pids is None:
+            pids = self.packages.keys()
+        for pid in pids:
             try:
                 proot = self._getPackageRoot(pid)
                 confxml = os.path.join(proot, "conf.xml")
@@ -243,6 +278,7 @@ class Common(pulse2.utils.Singleton):
                 del self.packageDetectionDate[pid]
             if self.packages.has_key(pid):
                 del self.packages[pid]
+            self._catalogChanged()
 
     def __removePackage(self, pid, proot):
         # Remove the package from the mirror
@@ -290,6 +326,7 @@ class Common(pulse2.utils.Singleton):
             self._buildReverse()
             self.logger.debug1("Common.detectNewPackages : build file list...")
             self._buildFileList()
+            self.hash_index.save()
             self.logger.debug1("Common.detectNewPackages : done")
             self.working = False
             return True
@@ -304,6 +341,45 @@ class Common(pulse2.utils.Singleton):
             self.logger.info(e)
         return False
 
+    def detectChangedPackage(self, proot):
+        """
+        Detect the changes of one package directory, the package watcher
+        calling it once nothing happened in the directory for
+        package_detect_debounce seconds.
+
+        @param proot: root of package
+        @type proot: str
+
+        @return: False if a detection is already running
+        @rtype: bool
+        """
+        if self.working:
+            self.logger.debug("Common.detectChangedPackage : already working")
+            return False
+        try:
+            self.working = True
+            self.working_pkgs = {}
+            confxml = os.path.join(proot, self.CONFXML)
+            if os.path.exists(confxml):
+                self.logger.debug1("Common.detectChangedPackage : detecting %s" % proot)
+                for mp, access in self._mountPointsOf(os.path.dirname(proot)):
+                    if self.mp2src.has_key(mp):
+                        self._treatNewConfFile(confxml, mp, access, settled = True)
+            else:
+                pids = [pid for pid, pkg in self.packages.items() if os.path.normpath(pkg.root) == proot]
+                if len(pids) > 0:
+                    self.logger.debug1("Common.detectChangedPackage : %s removed" % proot)
+                    self._detectRemovedAndEditedPackages(pids)
+            self._buildReverse()
+            self._buildFileList()
+            self.hash_index.save()
+        except Exception, e:
+            self.logger.error("Common.detectChangedPackage : an exception happened")
+            self.logger.debug(type(e))
+            self.logger.info(e)
+        self.working = False
+        return True
+
     def setDesc(self, description):
         self.desc = description
 
@@ -331,6 +407,7 @@ class Common(pulse2.utils.Singleton):
                 if not self.mp2p[desc['mp']].__contains__(pid):
                     self.logger.debug("Link package %s to %s" % (pid, desc['mp']))
                     self.mp2p[desc['mp']].append(pid)
+                    self._catalogChanged()
         return True
 
     def desassociatePackage2mp(self, pid, mp):
@@ -343,6 +420,7 @@ class Common(pulse2.utils.Singleton):
                 if pid in self.mp2p[desc['mp']]:
                     self.logger.debug("Unlink package %s from %s" % (pid, desc['mp']))
                     self.mp2p[desc['mp']].remove(pid)
+                    self._catalogChanged()
         return True
 
     ######################################################
@@ -362,6 +440,7 @@ class Common(pulse2.utils.Singleton):
         else:
             self.logger.debug("rsyncPackageOnMirrors for '%s'"%(pid))
             self.dontgivepkgs[pid] = self.config.package_mirror_target[:]
+        self._catalogChanged()
         PkgsRsyncStateSerializer().serialize()
 
     def isPackageAccessible(self, pid):
@@ -379,6 +458,8 @@ class Common(pulse2.utils.Singleton):
                 ret.append([x, self.dontgivepkgs[x], self.packages[x]])
         for x in rem:
             del self.dontgivepkgs[x]
+        if len(rem) > 0:
+            self._catalogChanged()
         return ret
 
     def removePackagesFromRsyncList(self, pid, target):
@@ -400,6 +481,7 @@ class Common(pulse2.utils.Singleton):
                     self.logger.debug("PackageMirror: removing package %s from available packages" % pid)
                     self.suppressFromInternal(pid)
             if modif:
+                self._catalogChanged()
                 PkgsRsyncStateSerializer().serialize()
             return True
         else:
@@ -423,6 +505,7 @@ class Common(pulse2.utils.Singleton):
             if not self.reverse.has_key(pa.label):
                 self.reverse[pa.label] = {}
             self.reverse[pa.label][pa.version] = pid
+            self._catalogChanged()
         except Exception, e:
             self.logger.error("addPackage failed")
             self.logger.error(e)
@@ -446,6 +529,7 @@ class Common(pulse2.utils.Singleton):
             if not self.reverse.has_key(pack.label):
                 self.reverse[pack.label] = {}
             self.reverse[pack.label][pack.version] = pid
+            self._catalogChanged()
         except Exception, e:
             self.logger.error("reloadPackage failed")
             self.logger.error(e)
@@ -473,6 +557,7 @@ class Common(pulse2.utils.Singleton):
             if not self.reverse.has_key(pack.label):
                 self.reverse[pack.label] = {}
             self.reverse[pack.label][pack.version] = pid
+            self._catalogChanged()
         except Exception, e:
             self.logger.error("editPackage failed")
             self.logger.error(e)
@@ -508,6 +593,7 @@ class Common(pulse2.utils.Singleton):
             os.remove(confxml)
         # notify it's an edition
         self.inEdition[pid] = True
+        self._catalogChanged()
         shutil.move(confxmltmp, confxml)
         self.packageDetectionDate[pid] = self.__getDate(confxml)
         if not os.path.exists(confxml):
@@ -617,6 +703,7 @@ class Common(pulse2.utils.Singleton):
         # TODO remove package from mirrors
         if self.config.package_mirror_activate:
             Common().rsyncPackageOnMirrors(pid)
+        self._catalogChanged()
 
         return pid
 
@@ -633,20 +720,34 @@ class Common(pulse2.utils.Singleton):
         ret = self.getPackages(mp, True)
         return ret
 
+    def getCatalogVersion(self):
+        return self.catalog_version
+
+    def _catalogChanged(self):
+        """
+        Forget the packages lists computed for the previous version.
+        """
+        self.catalog_version += 1
+        self.catalog_views = {}
+
     def getPackages(self, mp, pending = False, all = False, pidlist = None): #TODO check the clone memory impact
+        """
+        Without pidlist, the packages of a mount point are computed once
+        per catalog version, a copy of them is returned.
+        """
         # "all" override "pending" flag
         ret = {}
         ordered = []
         try:
             if pidlist == None:
-                for k in self.packages:
-                    if pidlist != None:
-                        if not k in pidlist:
-                            continue
-                    p = self.__packageSelection(k, mp, pending, all)
-                    if p != None:
-                        ret[k] = p
-                return ret
+                key = (mp, pending, all)
+                if not self.catalog_views.has_key(key):
+                    for k in self.packages:
+                        p = self.__packageSelection(k, mp, pending, all)
+                        if p != None:
+                            ret[k] = p
+                    self.catalog_views[key] = ret
+                return dict(self.catalog_views[key])
             else:
                 for id in pidlist:
                     if not self.packages.has_key(id): # shouldn't happen, but who knows...
@@ -660,6 +761,30 @@ class Common(pulse2.utils.Singleton):
             self.logger.error(e)
             return None
 
+    def getPackagesH(self, mp, pending = False):
+        """
+        Get a copy of the exported packages of a mount point, computed
+        once per catalog version.
+
+        @param pending: get the packages not yet available
+        @type pending: bool
+
+        @rtype: list
+        """
+        key = ('H', mp, pending)
+        if not self.catalog_views.has_key(key):
+            packages = self.getPackages(mp, pending)
+            if packages is None:
+                return None
+            ret = []
+            for pid in packages:
+                p = packages[pid].toH()
+                if pending and (self.newAssociation.has_key(pid) or self.inEdition.has_key(pid)):
+                    p['why'] = 'association'
+                ret.append(p)
+            self.catalog_views[key] = ret
+        return [dict(p) for p in self.catalog_views[key]]
+
     def __packageSelection(self, pid, mp = None, pending = False, all = False):
         is_acc = self.isPackageAccessible(pid)
         if not all:
@@ -741,16 +866,17 @@ class Common(pulse2.utils.Singleton):
         if not os.path.exists(fmd5name): # create file only if it do not exists
             self.logger.info("Computing MD5 sums file %s" % fmd5name)
             md5sums = []
+            filepaths = []
             for root, dirs, files in os.walk(dirname):
                 for name in files:
                     if name != self.CONFXML:
-                        try:
-                            filepath = os.path.join(root, name)
-                            f = file(filepath, "rb")
-                            md5sums.append([filepath[len(dirname)+1:], hashlib.md5(f.read()).hexdigest()])
-                            f.close()
-                        except IOError, e:
-                            self.logger.warn("Error while reading %s: %s" % (filepath, e))
+                        filepaths.append(os.path.join(root, name))
+            self.hash_index.prefetch(filepaths)
+            for filepath in filepaths:
+                try:
+                    md5sums.append([filepath[len(dirname)+1:], self.hash_index.get(filepath)[1]])
+                except (IOError, OSError), e:
+                    self.logger.warn("Error while reading %s: %s" % (filepath, e))
             fmd5 = file(fmd5name, "w+b")
             md5sums.sort(lambda x, y: cmp(x[0], y[0]))
             for name, md5hash in md5sums:
@@ -879,13 +1005,20 @@ class Common(pulse2.utils.Singleton):
     def __getDate(self, conffile):
         return os.stat(conffile)[stat.ST_MTIME]
 
-    def _treatNewConfFile(self, file, mp, access, runid = -1):
+    def _treatNewConfFile(self, file, mp, access, runid = -1, settled = False):
         if os.path.basename(file) == 'conf.xml':
             l_package = self.parser.parse(file)
             if l_package == None: return
             if self.working_pkgs.has_key(l_package.id): return
             l_package.setRoot(os.path.dirname(file))
-            isReady = self._hasChanged(os.path.dirname(file), l_package.id, runid)
+            if settled:
+                # the package watcher waited for the end of the changes
+                if self.already_declared.has_key(file):
+                    isReady = self.SMART_DETECT_CHANGES
+                else:
+                    isReady = self.SMART_DETECT_NOCHANGES
+            else:
+                isReady = self._hasChanged(os.path.dirname(file), l_package.id, runid)
             if not self.already_declared.has_key(file):
                 if isReady == self.SMART_DETECT_CHANGES:
                     self.logger.debug("'%s' has changed recently"%(str(l_package.id)))
@@ -895,12 +1028,15 @@ class Common(pulse2.utils.Singleton):
                         self._createMD5File(os.path.dirname(file))
                         pid = self._treatDir(os.path.dirname(file), mp, access, True, l_package)
                         self.associatePackage2mp(pid, mp)
+                        self._catalogChanged()
                         self.already_declared[file] = True
                         if self.newAssociation.has_key(pid):
                             del self.newAssociation[pid]
                         if self.inEdition.has_key(pid):
                             del self.inEdition[pid]
                         self.packageDetectionDate[pid] = self.__getDate(file)
+                        if settled:
+                            self.__subHasChangedGetGlobalSize(l_package.root, pid)
                         if self.config.package_mirror_activate:
                             Common().rsyncPackageOnMirrors(pid)
                     else:
@@ -910,6 +1046,7 @@ class Common(pulse2.utils.Singleton):
                     pid = l_package.id
                     self.logger.debug("detect an already detected package (edition mode) : %s"%(pid))
                     del self.inEdition[pid]
+                    self._catalogChanged()
                     # put the new date/size
                     self.packageDetectionDate[pid] = self.__getDate(file)
                     self.__subHasChangedGetGlobalSize(l_package.root, pid)
@@ -922,7 +1059,10 @@ class Common(pulse2.utils.Singleton):
                     self._createMD5File(os.path.dirname(file))
                     pid = self._treatDir(os.path.dirname(file), mp, access, True, l_package, True) # force loading
                     self.associatePackage2mp(pid, mp)
+                    self._catalogChanged()
                     self.packageDetectionDate[pid] = self.__getDate(file)
+                    if settled:
+                        self.__subHasChangedGetGlobalSize(l_package.root, pid)
                     if self.config.package_mirror_activate:
                         Common().rsyncPackageOnMirrors(pid)
 
@@ -992,6 +1132,7 @@ class Common(pulse2.utils.Singleton):
                 else:
                     # find all files and then get sizes and md5
                     files = self._getFiles(file)
+                    self.hash_index.prefetch(files)
                     for f in files:
                         path = '/'+re.sub(re.escape(toRelative+os.sep), '', os.path.dirname(f))
                         size += self._treatFile(pid, f, path, access)
@@ -1026,14 +1167,10 @@ class Common(pulse2.utils.Singleton):
     def _treatFile(self, pid, f, path, access = None, fid = None):
         if access is None: # dont modify the default value!
             access = {}
-        (fsize, fmd5) = [0,0]
-        if not self.file_properties.has_key(f):
-            fsize = os.path.getsize(f)
-            fmd5 = md5file(f)
-            self.logger.debug('ish: Creating md5 entry for '+f)
-            self.file_properties[f] = [fsize, fmd5]
-        else:
-            (fsize, fmd5) = self.file_properties[f]
+        try:
+            (fsize, fmd5) = self.hash_index.get(f)
+        except IOError:
+            (fsize, fmd5) = [os.path.getsize(f), 'Failed to open file']
 
         file = File(os.path.basename(f), path, fmd5, fsize, access, fid)
         self.packages[pid].addFile(file)
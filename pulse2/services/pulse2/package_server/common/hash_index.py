@@ -0,0 +1,202 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Pulse 2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+"""
+Persistent index of the sizes and md5 sums of packages files.
+
+An entry is valid while the inode, size and modification time of its
+file are unchanged, so a restarted package server only has to stat
+the files of the repository, the changed ones being hashed again.
+"""
+
+import os
+import sys
+import pickle
+import hashlib
+import logging
+from multiprocessing.pool import ThreadPool
+
+import pulse2.utils
+
+# size of the chunks read when hashing a file
+CHUNK_SIZE = 1048576
+
+def hashFile(path):
+    """
+    Computes the md5 sum of a file, reading it by chunks.
+
+    @param path: path of file
+    @type path: str
+
+    @rtype: str
+    """
+    m = hashlib.md5()
+    f = open(path, 'rb')
+    try:
+        while True:
+            data = f.read(CHUNK_SIZE)
+            if not data:
+                break
+            m.update(data)
+    finally:
+        f.close()
+    return m.hexdigest()
+
+
+class FileHashIndex(pulse2.utils.Singleton):
+    """
+    Sizes and md5 sums of files, keyed by path.
+    """
+    # version of file format
+    VERSION = 1
+
+    def init(self, config):
+        self.logger = logging.getLogger()
+        self.filename = config.package_hash_index_file
+        self.workers = config.package_hash_workers
+        # {path: (inode, size, mtime, md5)}
+        self.entries = {}
+        self.changed = False
+        return self.load()
+
+    def _signature(self, path):
+        st = os.stat(path)
+        return (st.st_ino, st.st_size, st.st_mtime)
+
+    def _lookup(self, path, signature):
+        entry = self.entries.get(path)
+        if entry is not None and entry[:3] == signature:
+            return entry[3]
+        return None
+
+    def get(self, path):
+        """
+        Gets the properties of a file, hashing it if not in index.
+
+        @param path: path of file
+        @type path: str
+
+        @return: [size, md5]
+        @rtype: list
+        """
+        signature = self._signature(path)
+        md5 = self._lookup(path, signature)
+        if md5 is None:
+            md5 = hashFile(path)
+            self.entries[path] = signature + (md5,)
+            self.changed = True
+        return [signature[1], md5]
+
+    def prefetch(self, paths):
+        """
+        Hashes the files missing from index on a pool of workers.
+
+        @param paths: paths of files
+        @type paths: list
+        """
+        missing = []
+        for path in paths:
+            try:
+                signature = self._signature(path)
+            except OSError:
+                continue
+            if self._lookup(path, signature) is None:
+                missing.append((path, signature))
+        if len(missing) == 0:
+            return
+
+        def _hash(item):
+            path, signature = item
+            try:
+                return (path, signature, hashFile(path))
+            except IOError, e:
+                self.logger.warn("Error while reading %s: %s" % (path, e))
+                return (path, signature, None)
+
+        self.logger.debug("Hashing %d files" % len(missing))
+        if self.workers > 1 and len(missing) > 1:
+            pool = ThreadPool(min(self.workers, len(missing)))
+            try:
+                results = pool.map(_hash, missing)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = map(_hash, missing)
+
+        for path, signature, md5 in results:
+            if md5 is not None:
+                self.entries[path] = signature + (md5,)
+                self.changed = True
+
+    def load(self):
+        """
+        Reads the index file.
+
+        @return: True if the index was loaded
+        @rtype: bool
+        """
+        if not os.path.exists(self.filename):
+            return False
+        try:
+            f = open(self.filename, 'rb')
+            try:
+                data = pickle.load(f)
+            finally:
+                f.close()
+        except Exception, e:
+            self.logger.warn("Files hash index, load of %s failed: %s" % (self.filename, str(e)))
+            return False
+        if type(data) != dict or data.get('version') != self.VERSION:
+            self.logger.warn("Files hash index, unknown format of %s, ignored" % self.filename)
+            return False
+        self.entries = data['entries']
+        self.logger.debug("Files hash index, %d entries loaded" % len(self.entries))
+        return True
+
+    def save(self):
+        """
+        Writes the index file if changed, forgetting the removed files.
+
+        @return: True if the index was written
+        @rtype: bool
+        """
+        if not self.changed:
+            return False
+        for path in self.entries.keys():
+            if not os.path.exists(path):
+                del self.entries[path]
+        tmp_filename = "%s.tmp" % self.filename
+        try:
+            f = open(tmp_filename, 'wb')
+            try:
+                pickle.dump({'version': self.VERSION, 'entries': self.entries}, f, pickle.HIGHEST_PROTOCOL)
+            finally:
+                f.close()
+            if sys.platform == "win32" and os.path.exists(self.filename):
+                os.unlink(self.filename)
+            os.rename(tmp_filename, self.filename)
+        except (IOError, OSError), e:
+            self.logger.warn("Files hash index, save into %s failed: %s" % (self.filename, str(e)))
+            return False
+        self.changed = False
+        self.logger.debug("Files hash index, %d entries saved" % len(self.entries))
+        return True
@@ -0,0 +1,214 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Pulse 2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+"""
+State of the replication of packages on the mirrors.
+
+The md5 sums of the files of a package are kept for each mirror once
+the package is replicated on it, so the next replication only has to
+send the files changed since then.
+"""
+
+import os
+import sys
+import pickle
+import logging
+import tempfile
+
+import pulse2.utils
+
+
+class MirrorReplication(pulse2.utils.Singleton):
+    """
+    Manifests of the packages replicated on each mirror, replications
+    in progress and their counters.
+    """
+    # version of file format
+    VERSION = 1
+
+    # {target: {pid: {relative path: md5}}} of the last replications
+    manifests = {}
+    # (pid, target) being replicated
+    running = set()
+    # {target: {'full': n, 'delta': n, 'skipped': n, 'failed': n, 'files': n}}
+    counters = {}
+
+    def init(self, config, hash_index):
+        """
+        @param config: package server configuration
+        @type config: P2PServerCP
+
+        @param hash_index: md5 sums of packages files
+        @type hash_index: FileHashIndex
+        """
+        self.logger = logging.getLogger()
+        self.filename = config.package_mirror_manifest_file
+        self.delta_enabled = config.package_mirror_delta
+        self.hash_index = hash_index
+        self.manifests = {}
+        self.running = set()
+        self.counters = {}
+        return self.load()
+
+    def manifest(self, root):
+        """
+        @param root: root of package
+        @type root: str
+
+        @return: md5 sums of the package files by relative path, None if
+                 a file can't be read
+        @rtype: dict
+        """
+        ret = {}
+        try:
+            for dirpath, dirs, files in os.walk(root):
+                for name in files:
+                    path = os.path.join(dirpath, name)
+                    ret[path[len(root) + 1:]] = self.hash_index.get(path)[1]
+        except (IOError, OSError), e:
+            self.logger.warn("PackageMirror: can't get the manifest of %s: %s" % (root, str(e)))
+            return None
+        return ret
+
+    def delta(self, target, pid, manifest):
+        """
+        Get the files of a package to send to a mirror.
+
+        @param manifest: current manifest of package
+        @type manifest: dict
+
+        @return: changed and removed files since the last replication,
+                 None if the whole package has to be sent
+        @rtype: list
+        """
+        if not self.delta_enabled or manifest is None:
+            return None
+        previous = self.manifests.get(target, {}).get(pid)
+        if previous is None:
+            return None
+        changed = [path for path, md5 in manifest.items() if previous.get(path) != md5]
+        removed = [path for path in previous if not path in manifest]
+        ret = changed + removed
+        ret.sort()
+        return ret
+
+    def writeFileList(self, pdir, paths):
+        """
+        Write the list of files given to rsync --files-from.
+
+        @param pdir: name of package directory
+        @type pdir: str
+
+        @param paths: paths relative to package directory
+        @type paths: list
+
+        @return: name of the file list
+        @rtype: str
+        """
+        fd, filename = tempfile.mkstemp(prefix = 'pulse2-mirror-')
+        f = os.fdopen(fd, 'w')
+        try:
+            for path in paths:
+                f.write("%s\n" % os.path.join(pdir, path))
+        finally:
+            f.close()
+        return filename
+
+    def isRunning(self, pid, target):
+        return (pid, target) in self.running
+
+    def start(self, pid, target, mode):
+        """
+        @param mode: 'full', 'delta' or 'skipped'
+        @type mode: str
+        """
+        self.running.add((pid, target))
+        counters = self.counters.setdefault(target, {'full': 0, 'delta': 0, 'skipped': 0, 'failed': 0, 'files': 0})
+        counters[mode] += 1
+
+    def finish(self, pid, target, success, manifest = None, files = 0):
+        """
+        End a replication, keeping the manifest of the package sent.
+
+        @param manifest: manifest of the package sent, None for a removed
+                         package
+        @type manifest: dict
+
+        @param files: number of files sent
+        @type files: int
+        """
+        self.running.discard((pid, target))
+        counters = self.counters.setdefault(target, {'full': 0, 'delta': 0, 'skipped': 0, 'failed': 0, 'files': 0})
+        if not success:
+            counters['failed'] += 1
+            return
+        counters['files'] += files
+        if manifest is None:
+            if self.manifests.get(target, {}).has_key(pid):
+                del self.manifests[target][pid]
+        else:
+            self.manifests.setdefault(target, {})[pid] = manifest
+        self.save()
+
+    def getStatistics(self):
+        """
+        @return: replications counters by mirror
+        @rtype: dict
+        """
+        stats = {}
+        for target, counters in self.counters.items():
+            stats[target] = counters.copy()
+            stats[target]['running'] = len([r for r in self.running if r[1] == target])
+        return stats
+
+    def load(self):
+        if not os.path.exists(self.filename):
+            return False
+        try:
+            f = open(self.filename, 'rb')
+            try:
+                data = pickle.load(f)
+            finally:
+                f.close()
+        except Exception, e:
+            self.logger.warn("PackageMirror: load of %s failed: %s" % (self.filename, str(e)))
+            return False
+        if type(data) != dict or data.get('version') != self.VERSION:
+            self.logger.warn("PackageMirror: unknown format of %s, ignored" % self.filename)
+            return False
+        self.manifests = data['manifests']
+        return True
+
+    def save(self):
+        tmp_filename = "%s.tmp" % self.filename
+        try:
+            f = open(tmp_filename, 'wb')
+            try:
+                pickle.dump({'version': self.VERSION, 'manifests': self.manifests}, f, pickle.HIGHEST_PROTOCOL)
+            finally:
+                f.close()
+            if sys.platform == "win32" and os.path.exists(self.filename):
+                os.unlink(self.filename)
+            os.rename(tmp_filename, self.filename)
+        except (IOError, OSError), e:
+            self.logger.warn("PackageMirror: save into %s failed: %s" % (self.filename, str(e)))
+            return False
+        return True
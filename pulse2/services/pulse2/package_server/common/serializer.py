@@ -66,6 +66,7 @@ class PkgsRsyncStateSerializer(pulse2.utils.Singleton):
             file.close()
             if type(r) == dict:
                 self.common.dontgivepkgs = r
+                self.common._catalogChanged()
                 self.logger.debug("Package synchro state serialization, unserialize succeed")
                 return True
             self.logger.debug("Package synchro state serialization, unserialize failed")
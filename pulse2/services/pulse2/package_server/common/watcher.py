@@ -0,0 +1,176 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Pulse 2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+"""
+Event driven detection of packages, based on inotify.
+
+Each event of a package directory (re)starts its debounce timer, the
+package is only detected again once nothing happened in it during
+package_detect_debounce seconds, ie. once it has been fully copied.
+"""
+
+import os
+import logging
+
+from twisted.internet import reactor
+
+try:
+    from twisted.internet import inotify
+    from twisted.python import filepath
+except ImportError:
+    # not available on this platform, the packages are polled
+    inotify = None
+
+import pulse2.utils
+
+# file written by package server itself in each package directory
+MD5SUMS = "MD5SUMS"
+
+
+class PackageWatcher(pulse2.utils.Singleton):
+    """
+    Watches the sources of mount points and calls back the detection
+    of the package directories once their content is stable.
+    """
+    # {package root: DelayedCall of its detection}
+    pending = {}
+    # watched sources, longest first
+    sources = []
+    notifier = None
+
+    def init(self, config, detect, clock = None):
+        """
+        @param config: package server configuration
+        @type config: P2PServerCP
+
+        @param detect: called with the root of a package whose content is
+                       stable, returns False if it has to be called later
+        @type detect: callable
+
+        @param clock: object providing callLater, the reactor by default
+        """
+        self.logger = logging.getLogger()
+        self.debounce = config.package_detect_debounce
+        self.detect = detect
+        self.clock = clock or reactor
+        self.pending = {}
+        self.sources = []
+
+    def start(self, sources):
+        """
+        Watches recursively the package sources.
+
+        @param sources: directories holding the package directories
+        @type sources: list
+
+        @return: True if the sources are watched
+        @rtype: bool
+        """
+        if inotify is None:
+            self.logger.warn("Package watcher: inotify is not available")
+            return False
+        try:
+            self.notifier = inotify.INotify()
+            self.notifier.startReading()
+        except Exception, e:
+            self.logger.warn("Package watcher: can't use inotify: %s" % str(e))
+            self.notifier = None
+            return False
+
+        mask = inotify.IN_CREATE | inotify.IN_DELETE | inotify.IN_MODIFY | \
+               inotify.IN_ATTRIB | inotify.IN_MOVED_FROM | inotify.IN_MOVED_TO | \
+               inotify.IN_DELETE_SELF
+        for src in sources:
+            src = os.path.normpath(src)
+            if src in self.sources:
+                continue
+            try:
+                self.notifier.watch(filepath.FilePath(src),
+                                    mask = mask,
+                                    autoAdd = True,
+                                    recursive = True,
+                                    callbacks = [self._onEvent])
+            except Exception, e:
+                self.logger.warn("Package watcher: can't watch %s: %s" % (src, str(e)))
+                continue
+            self.logger.debug("Package watcher: watching %s" % src)
+            self.sources.append(src)
+        self.sources.sort(key = len, reverse = True)
+        return True
+
+    def stop(self):
+        if self.notifier is not None:
+            self.notifier.loseConnection()
+            self.notifier = None
+        for call in self.pending.values():
+            if call.active():
+                call.cancel()
+        self.pending = {}
+
+    def _onEvent(self, ignored, fp, mask):
+        if mask & inotify.IN_Q_OVERFLOW:
+            self.logger.warn("Package watcher: events lost, waiting for next full detection")
+            return
+        self.notify(fp.path)
+
+    def packageRoot(self, path):
+        """
+        @param path: path of a file or directory under a watched source
+        @type path: str
+
+        @return: root of the package holding path, None if outside of
+                 the package directories
+        @rtype: str
+        """
+        path = os.path.normpath(path)
+        for src in self.sources:
+            if path.startswith(src + os.sep):
+                return os.path.join(src, path[len(src) + 1:].split(os.sep)[0])
+        return None
+
+    def notify(self, path):
+        """
+        Delays the detection of the package holding path.
+
+        @param path: path of changed file or directory
+        @type path: str
+        """
+        if os.path.basename(path) == MD5SUMS:
+            return
+        proot = self.packageRoot(path)
+        if proot is None:
+            return
+        call = self.pending.get(proot)
+        if call is not None and call.active():
+            call.reset(self.debounce)
+        else:
+            self.pending[proot] = self.clock.callLater(self.debounce, self._settled, proot)
+
+    def _settled(self, proot):
+        del self.pending[proot]
+        try:
+            done = self.detect(proot)
+        except Exception, e:
+            self.logger.error("Package watcher: detection of %s failed: %s" % (proot, str(e)))
+            return
+        if not done:
+            # a detection is already running
+            self.pending[proot] = self.clock.callLater(self.debounce, self._settled, proot)
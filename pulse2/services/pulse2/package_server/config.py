@@ -93,8 +93,15 @@ class P2PServerCP(pulse2.utils.Singleton):
 
     package_detect_tmp_activate = False
 
+    package_detect_inotify = True
+    package_detect_debounce = 10
+    package_detect_rescan_loop = 3600
+
     real_package_deletion = True
 
+    package_hash_index_file = '/var/lib/pulse2/package-server-hash-index'
+    package_hash_workers = 4
+
     package_mirror_loop = 5
     package_mirror_activate = False
     package_mirror_target = ''
@@ -103,6 +110,9 @@ class P2PServerCP(pulse2.utils.Singleton):
     package_mirror_command_options = ['-ar', '--delete']
     package_mirror_level0_command_options = ['-d', '--delete']
     package_mirror_command_options_ssh_options = None
+    package_mirror_concurrency = 4
+    package_mirror_delta = True
+    package_mirror_manifest_file = '/var/data/mmc/mirror-manifests'
     package_global_mirror_activate = True
     package_global_mirror_loop = 3600
     package_global_mirror_command_options = ['-ar', '--delete']
@@ -487,6 +497,13 @@ class P2PServerCP(pulse2.utils.Singleton):
                 else:
                     self.package_detect_smart = False
 
+            if self.cp.has_option("main", "package_detect_inotify"):
+                self.package_detect_inotify = self.cp.getboolean("main", "package_detect_inotify")
+            if self.cp.has_option("main", "package_detect_debounce"):
+                self.package_detect_debounce = self.cp.getint("main", "package_detect_debounce")
+            if self.cp.has_option("main", "package_detect_rescan_loop"):
+                self.package_detect_rescan_loop = self.cp.getint("main", "package_detect_rescan_loop")
+
         if self.cp.has_option("main", "package_mirror_target"):
             self.package_mirror_target = self.cp.get("main", "package_mirror_target").split(' ')
             if (type(self.package_mirror_target) == str and self.package_mirror_target != '') or \
@@ -507,6 +524,12 @@ class P2PServerCP(pulse2.utils.Singleton):
                     self.package_mirror_command_options_ssh_options = self.cp.get("main", 'package_mirror_command_options_ssh_options').split(' ')
                 if self.cp.has_option("main", 'package_mirror_level0_command_options'):
                     self.package_mirror_level0_command_options = self.cp.get("main", 'package_mirror_level0_command_options').split(' ')
+                if self.cp.has_option("main", 'package_mirror_concurrency'):
+                    self.package_mirror_concurrency = self.cp.getint("main", 'package_mirror_concurrency')
+                if self.cp.has_option("main", 'package_mirror_delta'):
+                    self.package_mirror_delta = self.cp.getboolean("main", 'package_mirror_delta')
+                if self.cp.has_option("main", 'package_mirror_manifest_file'):
+                    self.package_mirror_manifest_file = self.cp.get("main", 'package_mirror_manifest_file')
 
             if self.cp.has_option("main", "package_global_mirror_activate"):
                 self.package_global_mirror_activate = self.cp.getboolean("main", "package_global_mirror_activate")
@@ -517,6 +540,10 @@ class P2PServerCP(pulse2.utils.Singleton):
 
         if self.cp.has_option("main", "real_package_deletion"):
             self.real_package_deletion = self.cp.getboolean("main", "real_package_deletion")
+        if self.cp.has_option("main", "package_hash_index_file"):
+            self.package_hash_index_file = self.cp.get("main", "package_hash_index_file")
+        if self.cp.has_option("main", "package_hash_workers"):
+            self.package_hash_workers = self.cp.getint("main", "package_hash_workers")
         if self.cp.has_option("main", "mm_assign_algo"):
             self.mm_assign_algo = self.cp.get("main", 'mm_assign_algo')
         if self.cp.has_option("main", "up_assign_algo"):
@@ -43,7 +43,7 @@ class Mirror(MyXmlrpc):
         self.logger.info("(%s) %s : initialised with packages : %s"%(self.type, self.name, str(Common().getPackages(self.mp).keys())))
 
     def xmlrpc_getServerDetails(self):
-        return map(lambda x: Common().package(x).toH(), Common().getPackages(self.mp))
+        return Common().getPackagesH(self.mp)
 
     def xmlrpc_isAvailable(self, pid):
         return Common().getPackages(self.mp).has_key(pid)
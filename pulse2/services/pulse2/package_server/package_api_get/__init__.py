@@ -44,22 +44,29 @@ class PackageApiGet(MyXmlrpc):
         self.logger.info("(%s) %s : initialised with packages : %s"%(self.type, self.name, str(Common().getPackages(self.mp).keys())))
 
     def xmlrpc_getServerDetails(self):
-        return map(lambda x: Common().package(x).toH(), Common().getPackages(self.mp))
+        return Common().getPackagesH(self.mp)
 
     def xmlrpc_getAllPackages(self, mirror = None):
-        return map(lambda x: Common().package(x).toH(), Common().getPackages(self.mp))
+        return Common().getPackagesH(self.mp)
+
+    def xmlrpc_getCatalogVersion(self):
+        return Common().getCatalogVersion()
+
+    def xmlrpc_getAllPackagesSince(self, version):
+        """
+        Get the packages if they changed since the given catalog version.
+
+        @return: {'version': current version, 'changed': bool,
+                  'packages': list of packages, only if changed}
+        @rtype: dict
+        """
+        current = Common().getCatalogVersion()
+        if version == current:
+            return {'version': current, 'changed': False}
+        return {'version': current, 'changed': True, 'packages': Common().getPackagesH(self.mp)}
 
     def xmlrpc_getAllPendingPackages(self, mirror = None):
-        ret = Common().getPendingPackages(self.mp)
-        r = []
-        for x in ret:
-            p = ret[x].toH()
-            self.logger.debug(Common().newAssociation)
-            self.logger.debug(Common().inEdition)
-            if Common().newAssociation.has_key(p['id']) or Common().inEdition.has_key(p['id']):
-                p['why'] = 'association'
-            r.append(p)
-        return r
+        return Common().getPackagesH(self.mp, True)
 
     def xmlrpc_getPackagesDetail(self, pidlist):
         return map(lambda p: p.toH(), Common().packagelist(pidlist, self.mp))
@@ -24,7 +24,7 @@ import time
 from twisted.internet.defer import DeferredList
 
 from pulse2.scheduler.tracking.proxy import LocalProxiesUsageTracking
-from pulse2.scheduler.types import MscContainer
+from pulse2.scheduler.types import MscContainer, CC_STATUS
 
 
 class MscQueryManager(MscContainer):
@@ -44,15 +44,26 @@ class MscQueryManager(MscContainer):
         @return: grouped counts of circuits by network
         @rtype: dict
         """
-        result = {}
+        result = dict((group, 0) for group in self.groups)
 
-        for group in self.groups :
-            count = len([c for c in circuits if c.network_address==group])
-
-            result[group] = count
+        for circuit in circuits :
+            if circuit.network_address in result :
+                result[circuit.network_address] += 1
 
         return result
 
+    def _analyze_running_groups(self):
+        """
+        Counts the active circuits by network.
+
+        Unlike _analyze_groups, the counts are maintained by the circuits
+        registry, so no scan of container is needed.
+
+        @return: grouped counts of active circuits by network
+        @rtype: dict
+        """
+        return self._circuits.count_by_groups(CC_STATUS.ACTIVE, self.groups)
+
     def get_circuits(self, ids):
         """
         Get the all circuits from internal circuits container.
@@ -63,7 +74,7 @@ class MscQueryManager(MscContainer):
         @return: list of all circuits
         @rtype: list
         """
-        return [c for c in self._circuits if c.id in ids]
+        return [self._circuits.get(id) for id in ids if id in self._circuits]
 
     def get_running_circuits(self):
         """
@@ -88,7 +99,7 @@ class MscQueryManager(MscContainer):
         @return: list of all circuits
         @rtype: list
         """
-        return [c for c in self.waiting_circuits if c.id in ids]
+        return [c for c in self.get_circuits(ids) if c.status == CC_STATUS.WAITING]
 
 
     def get_active_circuits(self, coh_ids=[]):
@@ -202,8 +213,7 @@ class MscQueryManager(MscContainer):
         @return: True if another deployment is running on checked target
         @rtype: bool
         """
-        uuid = circuit.cohq.target.target_uuid
-        return uuid in [c.cohq.target.target_uuid for c in self.circuits]
+        return self._circuits.has_target(circuit.target_uuid, CC_STATUS.ACTIVE)
 
     def get_circuits_on_done(self):
         return [c for c in self.circuits if c.cohq.coh.isStateDone()]
@@ -23,6 +23,8 @@
 Create and control deferred execution plan of scheduled commands.
 """
 
+import bisect
+import heapq
 import logging
 import random
 import time
@@ -38,6 +40,8 @@ class ParabolicBalance (object):
     Output is a list of balance coeficients which total is 1. 
     """
     delta = 1
+    # {attempts_total: balances}
+    _cache = {}
 
     #    Example for 5 attepts :
     #    -----------------------
@@ -89,6 +93,9 @@ class ParabolicBalance (object):
         return self.fx(x) - self.fx(x - self.delta)
 
     def _calc(self):
+        if self.attempts_total in self._cache :
+            self._balances = list(self._cache[self.attempts_total])
+            return
 
         areas = []
         for period in range(self.attempts_total) :
@@ -100,6 +107,7 @@ class ParabolicBalance (object):
         for area in areas :
             balance = 1.0 * area / total_area
             self._balances.append(balance)
+        self._cache[self.attempts_total] = list(self._balances)
 
     @property
     def balances (self):
@@ -107,14 +115,77 @@ class ParabolicBalance (object):
 
 
 
+class WeightedSampler (object):
+    """
+    Weighted random sampling over a fixed set of items.
+
+    The cumulative weights are computed once (on first draw), so each
+    single draw is a binary search (O(log n)). A sample of k distinct
+    items is drawn in one pass, each item getting the key u^(1/weight)
+    (u uniform in [0, 1)) and the k largest keys being selected
+    (Efraimidis-Spirakis), so O(n log k).
+    """
+    items = None
+    cumulative = None
+    total = 0.0
+
+    def __init__(self, weights):
+        """
+        @param weights: weight per item
+        @type weights: dict
+        """
+        self.weights = weights
+
+    def _cumulate(self):
+        """ Builds the table of cumulative weights """
+        self.items = []
+        self.cumulative = []
+        total = 0.0
+        for item, weight in self.weights.iteritems() :
+            if weight > 0 :
+                total += weight
+                self.items.append(item)
+                self.cumulative.append(total)
+        self.total = total
+
+    def draw(self):
+        """
+        Draws one item (with replacement).
+
+        @return: drawn item, None if all weights are null
+        """
+        if self.cumulative is None :
+            self._cumulate()
+        if self.total <= 0 :
+            return None
+        index = bisect.bisect_right(self.cumulative, random.random() * self.total)
+        return self.items[min(index, len(self.items) - 1)]
+
+    def sample(self, k):
+        """
+        Draws k distinct items, items having a null weight come last.
+
+        @param k: number of items to draw
+        @type k: int
+
+        @return: drawn items
+        @rtype: list
+        """
+        rnd = random.random
+        def key(item):
+            weight = self.weights[item]
+            if weight > 0 :
+                return rnd() ** (1.0 / weight)
+            return - rnd()
+        return heapq.nlargest(k, self.weights, key=key)
+
+
 def randomListByBalance (balances, limit):
     """
     Function to selecting the commands_on_host ids to re-schedule.
 
-    First step is the choice of treshold into the sorted dict (by balance).
-    This treshold is considered as the lower limit of the interval to drawing
-    next ids to select. 
-    All the choices are based on random selecting.
+    The ids are drawn without replacement, the probability of each
+    id being proportional to its balance.
 
     @param balances: dictionary of balances having CoH id as key
     @type balances: dict
@@ -130,40 +201,23 @@ def randomListByBalance (balances, limit):
         if len(balances) <= limit :
             # no necesity to choice the most important CoHs
             return balances.keys()
-        while True :
+        return WeightedSampler(balances).sample(limit)
+    return []
 
-            # sort by balance
-            sorted_keys = sorted(balances, key=balances.get, reverse=True)
-            # draw the treshold  
-            drw_coh = random.choice(sorted_keys)
- 
-            logging.getLogger().debug("Keys to draw: %s " % str(sorted_keys))
-            treshold_idx = sorted_keys.index(drw_coh)
-            # remove all the keys bellow the treshold
-            sorted_keys = sorted_keys[-treshold_idx:]
-            logging.getLogger().debug("Reduced interval: %s " % str(sorted_keys))
-
-            count = 0
-            selected = []
-            while True :
-                if count >= limit :
-                    break
-                if count >= len(sorted_keys) :
-                    break
-                drw_coh = random.choice(sorted_keys)
-                if drw_coh not in selected :
-                    selected.append(drw_coh)
-                    count += 1
-            if len(selected) / limit > 0.8 :
-                # OK when number of selected is more than 80% of limit
-                return selected 
-            else :
-                logging.getLogger().debug("List of drawed CoHs too small. Repeat the drawing")
+# (start_date, end_date, attempts_failed) : (half-cycle timestamp,
+#                                            half-cycle duration,
+#                                            attempts divisor)
+_balance_constants = {}
+# _balance_constants is flushed when this size is reached
+BALANCE_CONSTANTS_SIZE = 100000
 
 def getBalanceByAttempts (start_date, end_date, attempts_failed) :
     """
     Calculate the command priority.
 
+    The part not depending on current time is memoised
+    per (start_date, end_date, attempts_failed).
+
     @param start_date: date of start of launched action
     @type start_date: datetime
 
@@ -178,18 +232,78 @@ def getBalanceByAttempts (start_date, end_date, attempts_failed) :
     P2 = 2.0
     now = time.time()
 
-    start_timestamp = time.mktime(start_date.timetuple())
-    end_timestamp = time.mktime(end_date.timetuple())
+    key = (start_date, end_date, attempts_failed)
+    if key in _balance_constants :
+        l, d, dd = _balance_constants[key]
+    else :
+        start_timestamp = time.mktime(start_date.timetuple())
+        end_timestamp = time.mktime(end_date.timetuple())
 
+        # half-cycle timestamp
+        l = (end_timestamp + start_timestamp) / 2.0
+        # half-cycle duration
+        d = (end_timestamp - start_timestamp) / 2.0
 
-    # half-cycle timestamp
-    l = (end_timestamp + start_timestamp) / 2.0
-    # half-cycle duration
-    d = (end_timestamp - start_timestamp) / 2.0
+        dd = P1 ** (attempts_failed * 1.0)
+
+        if len(_balance_constants) >= BALANCE_CONSTANTS_SIZE :
+            _balance_constants.clear()
+        _balance_constants[key] = (l, d, dd)
 
     td = ((now - l) / d) ** P2
-    dd = P1 ** (attempts_failed * 1.0)
 
     return td / dd
     
 
+
+def allocateByWeights (groups, running, waiting, slots, weights=None):
+    """
+    Fair-share allocation of free slots between groups (networks).
+
+    Each free slot is given to the group having the lowest share
+    (running + allocated) / weight while it has some waiting circuits.
+    Groups are kept in a heap ordered by their share, so the cost is
+    O(k log g) for k slots and g groups. Ties are resolved by the order
+    of groups.
+
+    @param groups: list of all groups
+    @type groups: list
+
+    @param running: number of running circuits per group
+    @type running: dict
+
+    @param waiting: number of circuits to allocate per group
+    @type waiting: dict
+
+    @param slots: number of free slots
+    @type slots: int
+
+    @param weights: weight per group (default 1)
+    @type weights: dict
+
+    @return: number of circuits to add per group
+    @rtype: dict
+    """
+    if weights is None :
+        weights = {}
+
+    to_add = dict((group, 0) for group in groups)
+
+    heap = []
+    for index, group in enumerate(groups) :
+        if waiting.get(group, 0) > 0 :
+            share = running.get(group, 0) / float(weights.get(group, 1))
+            heap.append((share, index, group))
+    heapq.heapify(heap)
+
+    while slots > 0 and len(heap) > 0 :
+        share, index, group = heap[0]
+        to_add[group] += 1
+        slots -= 1
+        if to_add[group] < waiting[group] :
+            share = (running.get(group, 0) + to_add[group]) / float(weights.get(group, 1))
+            heapq.heapreplace(heap, (share, index, group))
+        else :
+            heapq.heappop(heap)
+
+    return to_add
@@ -114,6 +114,18 @@ class SchedulerConfig(object):
     cache_timeout = 500
     imaging = False
     max_to_overtimed = 1000
+    start_feed_rescan_period = 300
+    tick_stats_dump = ''
+    tick_stats_dump_period = 60
+    network_weights = {}
+    warm_restart_file = ''
+    warm_restart_period = 60
+    warm_restart_max_age = 3600
+    launchers_capacity_max_age = 60
+    wol_batch_delay = 1
+    # number of scheduler workers and index of this one
+    shards = 1
+    shard = 0
 
     # [daemon] section
     daemon_group = 0
@@ -156,6 +168,37 @@ class SchedulerConfig(object):
             else:
                 log.debug("scheduler %s: section %s, option %s not set, using default value" % (self.name, section, key))
 
+    def set_shard(self, shard):
+        """
+        Sets the index of this scheduler worker.
+
+        Each worker except the first one uses its own unix socket
+        and state files (suffixed by the index).
+
+        @param shard: index of worker (0 <= shard < shards)
+        @type shard: int
+        """
+        if not 0 <= shard < self.shards :
+            raise Exception('scheduler "%s": shard %d out of range (shards = %d)' % (self.name, shard, self.shards))
+        self.shard = shard
+        if shard > 0 :
+            if self.warm_restart_file :
+                self.warm_restart_file = "%s.%d" % (self.warm_restart_file, shard)
+            if self.tick_stats_dump :
+                self.tick_stats_dump = "%s.%d" % (self.tick_stats_dump, shard)
+
+    def shard_socket_path(self, shard):
+        """
+        @param shard: index of worker
+        @type shard: int
+
+        @return: path of unix socket of the worker
+        @rtype: str
+        """
+        if shard > 0 :
+            return "%s.%d" % (self.scheduler_proxy_socket_path, shard)
+        return self.scheduler_proxy_socket_path
+
     def presetup(self, config_file):
         """
             used to pre-parse conf file to gather enough data to setuid() soon
@@ -202,6 +245,17 @@ class SchedulerConfig(object):
 
         self.setoption("scheduler", "imaging", "imaging", 'bool')
         self.setoption("scheduler", "max_to_overtimed", "max_to_overtimed", 'int')
+        self.setoption("scheduler", "start_feed_rescan_period", "start_feed_rescan_period", 'int')
+        self.setoption("scheduler", "tick_stats_dump", "tick_stats_dump", 'str')
+        self.setoption("scheduler", "tick_stats_dump_period", "tick_stats_dump_period", 'int')
+        self.setoption("scheduler", "warm_restart_file", "warm_restart_file", 'str')
+        self.setoption("scheduler", "warm_restart_period", "warm_restart_period", 'int')
+        self.setoption("scheduler", "warm_restart_max_age", "warm_restart_max_age", 'int')
+        self.setoption("scheduler", "launchers_capacity_max_age", "launchers_capacity_max_age", 'int')
+        self.setoption("scheduler", "wol_batch_delay", "wol_batch_delay", 'int')
+        self.setoption("scheduler", "shards", "shards", 'int')
+        if self.shards < 1 :
+            raise Exception('scheduler "%s": number of shards must be at least 1' % self.name)
 
         if self.cp.has_option("scheduler", "non_fatal_steps"):
             self.non_fatal_steps = self.cp.get("scheduler", "non_fatal_steps").split(' ')
@@ -263,6 +317,15 @@ class SchedulerConfig(object):
         else :
             self.preferred_network = pnp.get_default()
 
+        if self.cp.has_option("scheduler", "network_weights"):
+            self.network_weights = {}
+            for token in self.cp.get("scheduler", "network_weights").split(','):
+                (key, val) = token.strip().split('=')
+                weight = float(val)
+                if weight <= 0 :
+                    raise Exception('scheduler "%s": weight of network "%s" must be positive' % (self.name, key))
+                self.network_weights[key.strip()] = weight
+            log.info("scheduler %s: section %s, option %s set to '%s'" % (self.name, 'scheduler', 'network_weights', self.network_weights))
 
         self.setoption("scheduler", "netbios_path", "netbios_path")
         self.setoption("scheduler", "scheduler_path", "scheduler_path")
@@ -23,6 +23,7 @@
 
 import random
 from base64 import b64decode
+from itertools import izip_longest
 
 from twisted.internet.defer import Deferred, maybeDeferred, DeferredList
 from twisted.internet.threads import deferToThread
@@ -30,10 +31,13 @@ from twisted.internet import reactor
 
 from pulse2.scheduler.types import MscContainer, Circuit, CC_STATUS
 from pulse2.scheduler.analyses import MscQueryManager
+from pulse2.scheduler.balance import allocateByWeights
 from pulse2.scheduler.launchers_driving import RemoteCallProxy
 from pulse2.scheduler.queries import get_cohs, is_command_in_valid_time
 from pulse2.scheduler.queries import switch_commands_to_start
-from pulse2.scheduler.queries import get_ids_to_start, get_commands
+from pulse2.scheduler.queries import reschedule_commands_now
+from pulse2.scheduler.queries import get_commands
+from pulse2.scheduler.queries import StateSnapshot
 from pulse2.scheduler.dlp import get_dlp_method
 
 
@@ -41,16 +45,37 @@ class MethodProxy(MscContainer):
     """ Interface to dispatch the circuit operations from exterior. """
 
 
+    # progress of bulk operations {name: [processed, total]}
+    bulk_progress = {}
+
+    def _bulk_progress(self, name):
+        """
+        Gets a progress reporter of a bulk operation.
+
+        @param name: name of operation
+        @type name: str
+
+        @return: callable with processed and total commands_on_host
+        @rtype: func
+        """
+        self.bulk_progress[name] = [0, 0]
+        def progress(processed, total):
+            self.bulk_progress[name] = [processed, total]
+            self.logger.info("%s: %d/%d commands_on_host processed" %
+                    (name, processed, total))
+        return progress
+
     def start_commands(self, cmds):
         self.logger.info("Prepare %d commands to START..." % len(cmds))
 
         scheduler = self.config.name
 
-        if len(cmds) > 0 :
-            for cmd_id in cmds :
-                if is_command_in_valid_time(cmd_id):
-                    cohs = get_cohs(cmd_id, scheduler)
-                    self.start_commands_on_host(cohs)
+        cohs = []
+        for cmd_id in cmds :
+            if is_command_in_valid_time(cmd_id):
+                cohs.extend(get_cohs(cmd_id, scheduler))
+        if len(cohs) > 0 :
+            return self.start_commands_on_host(cohs)
         return True
 
 
@@ -58,56 +83,91 @@ class MethodProxy(MscContainer):
         """
         Starts selected commands on host.
 
+        The states are switched by batches of set-based updates
+        in a thread, the records of active circuits are then
+        re-queried in bulk.
+
         @param cmd_ids: list of commands ids
         @type cmd_ids: list
         """
-        cmd_ids = get_commands(cohs)
-        for cmd_id in cmd_ids :
-            self.statistics.watchdog_schedule(cmd_id)
-        switch_commands_to_start(cohs)
-
-        self.logger.debug("Cohs %s starting" % cohs)
-
-        active_circuits = [c for c in self._circuits if c.id in cohs]
+        cohs = [id for id in cohs if self.owns(id)]
+        if len(cohs) == 0 :
+            return True
 
+        active_circuits = self.get_circuits(cohs)
         active_cohs = [c.id for c in active_circuits]
-        new_cohs = [id for id in cohs if id not in active_cohs and not id in self.stopped_track]
-        self.logger.info("Starting %s circuits" % len(new_cohs))
 
-        for circuit in active_circuits :
-            self.logger.info("Circuit #%s: start" % circuit.id)
+        def _bulk_start():
+            cmd_ids = get_commands(cohs)
+            switch_commands_to_start(cohs, self._bulk_progress("start"))
             # set the next_launch_date for now
-            circuit.cohq.coh.reSchedule(0, False)
-            circuit.cohq.cmd.refresh()
-        return True
+            reschedule_commands_now(active_cohs)
+            StateSnapshot().reload(active_cohs, cmd_ids)
+            return cmd_ids
+
+        d = deferToThread(_bulk_start)
+        @d.addCallback
+        def _started(cmd_ids):
+            for cmd_id in cmd_ids :
+                self.statistics.watchdog_schedule(cmd_id)
+            # re-scheduled cohs may be due before the last poll
+            self.start_feed.reset()
+
+            new_cohs = [id for id in cohs if id not in active_cohs and not id in self.stopped_track]
+            self.logger.info("Starting %s circuits, %d already active" %
+                    (len(new_cohs), len(active_cohs)))
+            return True
+
+        @d.addErrback
+        def _eb(failure):
+            self.logger.error("Start of commands_on_host failed: %s" % failure)
+            return False
+        return d
 
 
     def stop_commands(self, cohs=[]):
         """
         Stops all or selected circuits.
 
+        The records of active circuits are re-queried in bulk
+        in a thread before to release the circuits.
+
         @param cohs: list of commands_on_host
         @type cohs: list
         """
-        cmd_ids = get_commands(cohs)
-        active_circuits = [c for c in self._circuits if c.id in cohs]
+        cohs = [id for id in cohs if self.owns(id)]
+        active_circuits = self.get_circuits(cohs)
 
         active_cohs = [c.id for c in active_circuits]
 
         self.logger.info("Prepare %d circuits to STOP ..." % len(active_cohs))
-        for cmd_id in cmd_ids:
-            # final statistics calculate
-            self.statistics.watchdog_schedule(cmd_id)
 
         self.stopped_track.add(active_cohs)
+        self.start_feed.discard(cohs)
+
+        def _bulk_stop():
+            cmd_ids = get_commands(cohs)
+            StateSnapshot().reload(active_cohs, cmd_ids)
+            return cmd_ids
+
+        d = deferToThread(_bulk_stop)
+        @d.addCallback
+        def _stopped(cmd_ids):
+            for cmd_id in cmd_ids:
+                # final statistics calculate
+                self.statistics.watchdog_schedule(cmd_id)
+
+            progress = self._bulk_progress("stop")
+            for circuit in active_circuits :
+                circuit.release()
+            progress(len(cohs), len(cohs))
+            return True
 
-        for circuit in active_circuits :
-            circuit.cohq.coh.refresh()
-            circuit.cohq.cmd.refresh()
-            circuit.release()
-
-
-        return True
+        @d.addErrback
+        def _eb(failure):
+            self.logger.error("Stop of commands_on_host failed: %s" % failure)
+            return False
+        return d
 
 
     def run_proxymethod(self, launcher, id, name, args, from_dlp):
@@ -238,13 +298,19 @@ class MethodProxy(MscContainer):
         """
         self.logger.info("re-scheduling command id = <%s> from %s to %s" %
                 (cmd_id, start_date, end_date))
-        circuits = self.get_circuits_by_command(cmd_id)
+        ids = [circuit.id for circuit in self.get_circuits_by_command(cmd_id)]
 
-        for circuit in circuits :
-            circuit.cohq.coh.refresh()
-            circuit.cohq.cmd.refresh()
+        d = deferToThread(StateSnapshot().reload, ids, [cmd_id])
+        @d.addCallback
+        def _extended(result):
+            self.start_feed.reset()
+            return True
 
-        return True
+        @d.addErrback
+        def _eb(failure):
+            self.logger.error("Re-scheduling of command %s failed: %s" % (cmd_id, failure))
+            return False
+        return d
 
 
 
@@ -265,18 +331,14 @@ class MscDispatcher (MscQueryManager, MethodProxy):
         banned = self.bundles.get_banned_cohs()
         ids = [id for id in ids if id not in banned]
 
-        already_initialized_circuits = [c for c in self._circuits
-                                          if c.id in ids
-                                       ]
+        already_initialized_circuits = self.get_circuits(ids)
 	# already initialized circuits will be started
         aicd = maybeDeferred(self._circuits_activate,
 			     already_initialized_circuits)
 	aicd.addCallback(self._run_all)
         aicd.addErrback(self._start_failed)
 
-        already_initialized_ids = [c.id for c in already_initialized_circuits]
-
-        new_ids = [id for id in ids if not id in already_initialized_ids]
+        new_ids = [id for id in ids if id not in self._circuits]
 
         if truncate and len(new_ids) > self.free_slots :
 
@@ -286,13 +348,16 @@ class MscDispatcher (MscQueryManager, MethodProxy):
             self.logger.info("Remaining circuits will be requested soon")
 
         if len(new_ids) > 0 :
-            d1 = self._setup_all(new_ids)
+            timed = self.tick_stats.timed
+
+            StateSnapshot().prefetch(new_ids)
+            d1 = timed("setup_all", self._setup_all)(new_ids)
 
-            d1.addCallback(self._assign_launcher)
+            d1.addCallback(timed("assign_launcher", self._assign_launcher))
             d1.addCallback(self._class_bundles)
-            d1.addCallback(self._class_all)
-            d1.addCallback(self._revolve_all)
-            d1.addCallback(self._run_all)
+            d1.addCallback(timed("class_all", self._class_all))
+            d1.addCallback(timed("revolve_all", self._revolve_all))
+            d1.addCallback(timed("run_all", self._run_all))
             d1.addErrback(self._start_failed)
 	return d1
 
@@ -353,8 +418,8 @@ class MscDispatcher (MscQueryManager, MethodProxy):
                 self.logger.debug("Dispatcher killed")
                 return DeferredList(dl)
 
-            if any([True for c in self._circuits if c.id == id]):
-                circuit = self.get(id)
+            circuit = self._circuits.get(id)
+            if circuit :
                 if circuit.initialized :
                     deferToThread(circuit.run)
                 else :
@@ -471,16 +536,18 @@ class MscDispatcher (MscQueryManager, MethodProxy):
             else :
                 launchers = self.get_launchers_by_network(circuit.network_address)
                 if len(launchers) > 0 :
+                    launcher = launchers[0]
                     circuit.launchers_provider = RemoteCallProxy(self.config.launchers_uri,
-                                                                 launchers[0])
+                                                                 launcher)
                     self.logger.debug("Circuit #%s: assigned launcher <%s>" %
-                            (circuit.id, launchers[0]))
+                            (circuit.id, launcher))
                 else:
                     launcher = self.config.launchers.keys()[0]
                     circuit.launchers_provider = RemoteCallProxy(self.config.launchers_uri,
                                                                  launcher)
                     self.logger.debug("Launcher pre-detect failed, assigning the first launcher '%s' to circuit #%s" %
                                   (launcher, circuit.id))
+            circuit.launcher = launcher
             circuits.append(circuit)
         return circuits
 
@@ -511,9 +578,11 @@ class MscDispatcher (MscQueryManager, MethodProxy):
         new_circuits = []
         banned = self.bundles.get_banned_cohs()
         circuits_to_start = []
+        new_by_groups = {}
         for circuit in incoming_circuits :
             circuit.status = CC_STATUS.WAITING
             new_circuits.append(circuit)
+            new_by_groups.setdefault(circuit.network_address, []).append(circuit)
 
         grouped = self._select_balanced(new_circuits)
 
@@ -521,7 +590,7 @@ class MscDispatcher (MscQueryManager, MethodProxy):
             circuits_to_run = []
 
             count = 0
-            for circuit in [c for c in new_circuits if c.network_address==group] :
+            for circuit in new_by_groups.get(group, []) :
 
                 # bundle banned excluding
                 if circuit.id in banned:
@@ -539,7 +608,6 @@ class MscDispatcher (MscQueryManager, MethodProxy):
                     circuit.status = CC_STATUS.ACTIVE
                     self.started_track.add([circuit.id])
                     circuits_to_run.append(circuit)
-                    new_circuits.remove(circuit)
                     count += 1
 
 
@@ -547,35 +615,37 @@ class MscDispatcher (MscQueryManager, MethodProxy):
 
 
         # rest of new circuits in queue
-        new_circuits = [c for c in new_circuits if c not in self.waiting_circuits]
+        new_circuits = [c for c in new_circuits if c.status == CC_STATUS.WAITING]
 
         self._circuits.extend(new_circuits)
         self.logger.info("Circuits stats: running: %d waiting: %d" %
-                (len(self.circuits), len(self.waiting_circuits)))
+                (self._circuits.count(CC_STATUS.ACTIVE),
+                 self._circuits.count(CC_STATUS.WAITING)))
 
         return circuits_to_start
 
     def _revolve_all(self, circuits_to_start):
         """ Randomizing the deployment orders by group """
 
-        final_length = len(circuits_to_start)
-        circuits_by_groups = {}
+        circuits_by_groups = dict((group, []) for group in self.groups)
+        others = []
+        for circuit in circuits_to_start :
+            if circuit.network_address in circuits_by_groups :
+                circuits_by_groups[circuit.network_address].append(circuit)
+            else :
+                others.append(circuit)
+
+        contents = []
         for group in self.groups :
-            content = [c for c in circuits_to_start if c.network_address==group]
+            content = circuits_by_groups[group]
             random.shuffle(content)
+            contents.append(content)
 
-            circuits_by_groups[group] = content
-
+        # one circuit of each group per round
         circuits = []
-        while True :
-            if len(circuits) == final_length:
-                break
-            for group in self.groups :
-                try :
-                    c = circuits_by_groups[group].pop(0)
-                    circuits.append(c)
-                except IndexError:
-                    continue
+        for row in izip_longest(*contents) :
+            circuits.extend([c for c in row if c is not None])
+        circuits.extend(others)
 
         return circuits
 
@@ -590,6 +660,7 @@ class MscDispatcher (MscQueryManager, MethodProxy):
         more than others.
         Final number of new_circuits, together with running circuits,
         covers the maximum of running circuits (max_slots).
+        Groups are weighted by network_weights option (see allocateByWeights).
 
         @param new_circuits: new circuits to equalize
         @type new_circuits: list
@@ -601,36 +672,23 @@ class MscDispatcher (MscQueryManager, MethodProxy):
         # sorted statistics from circuits to add
         new_grps_stat = self._analyze_groups(new_circuits)
         # sorted statistics from running circuits
-        running_grps_stat = self._analyze_groups(self.circuits)
+        running_grps_stat = self._analyze_running_groups()
+        nbr_running = self._circuits.count(CC_STATUS.ACTIVE)
 
         to_add = None
 
-        if len(self.circuits) < self.max_slots :
+        if nbr_running < self.max_slots :
             # number of new circuits to add
-            free_slots = self.max_slots - len(self.circuits)
+            free_slots = self.max_slots - nbr_running
 
-            if  len(self.circuits) + len(new_circuits) <= self.max_slots :
+            if  nbr_running + len(new_circuits) <= self.max_slots :
                 return new_grps_stat
             else :
-
-                to_add = dict((group, 0) for group in self.groups)
-
-                zero_blacklist = []
-                while True :
-
-                    masked = dict((group, value + to_add[group])
-                                    for (group, value) in running_grps_stat.items()
-                                    if group not in zero_blacklist)
-                    # group having minimum circuits
-                    min_key = min(masked, key=masked.get)
-                    if new_grps_stat[min_key] > 0 :
-                        to_add[min_key] += 1
-                        new_grps_stat[min_key] -= 1
-                    else :
-                        zero_blacklist.append(min_key)
-
-                    if sum(to_add.values()) == free_slots :
-                        break
+                to_add = allocateByWeights(self.groups,
+                                           running_grps_stat,
+                                           new_grps_stat,
+                                           free_slots,
+                                           self.config.network_weights)
         else :
             return dict((g, 0) for g in self.groups)
 
@@ -710,39 +768,38 @@ class MscDispatcher (MscQueryManager, MethodProxy):
         which is located at least saturated network.
         """
         try:
-            running = self._analyze_groups(self.circuits)
-            remaining = self._analyze_groups(self.get_valid_waitings())
-
-            for _ in xrange(self.nbr_groups):
-                # the least saturated network
-                 slightest_group = min(running, key=running.get)
-                 if remaining[slightest_group] > 0 :
-                     # waiting circuits not processed yet
-                     unprocessed_circuits = self.get_unprocessed_waitings()
-                     # waiting circuits already processed (recycling of failed attempts)
-                     already_treated_circuits = self.get_valid_waitings()
-
-                     for circuits in [unprocessed_circuits, already_treated_circuits]:
-                         if self.has_free_slots():
-                             circuit = self._get_next_waiting(circuits, slightest_group)
-                             if circuit :
-                                 circuit.run()
-                                 return True
-                         else:
-                             return False
-
-                 else :
-                     if slightest_group in running :
-                         del running[slightest_group]
-                     # if not a candidate in waiting circuits, skip on next group
-                     continue
-            if len(self.get_valid_waitings()) > 0 :
-                circuit = self.get_valid_waitings()[0]
+            running = self._analyze_running_groups()
+            # waiting circuits already processed (recycling of failed attempts)
+            already_treated_circuits = self.get_valid_waitings()
+            remaining = self._analyze_groups(already_treated_circuits)
+            # waiting circuits not processed yet
+            unprocessed_circuits = self.get_unprocessed_waitings()
+
+            weights = self.config.network_weights
+            # from the least saturated network
+            for slightest_group in sorted(running,
+                                          key=lambda g: running[g] / float(weights.get(g, 1))):
+                if remaining[slightest_group] == 0 :
+                    # if not a candidate in waiting circuits, skip on next group
+                    continue
+                for circuits in [unprocessed_circuits, already_treated_circuits]:
+                    if self.has_free_slots():
+                        circuit = self._get_next_waiting(circuits, slightest_group)
+                        if circuit :
+                            circuit.run()
+                            self.tick_stats.started()
+                            return True
+                    else:
+                        return False
+
+            if len(already_treated_circuits) > 0 :
+                circuit = already_treated_circuits[0]
                 if circuit :
                     self.logger.debug("Remaining waiting circuit #%s: start" % circuit.id)
                     circuit.status = CC_STATUS.ACTIVE
                     circuit.run()
                     self.started_track.add([circuit.id])
+                    self.tick_stats.started()
                     return True
             return False
         except Exception, e:
@@ -764,9 +821,11 @@ class MscDispatcher (MscQueryManager, MethodProxy):
 
     def update_stats(self, result):
         """ Update of global statistics of all valid running commands """
-        self.statistics.update()
+        # statistics are global, the first worker updates them for all
+        if self.config.shard == 0 :
+            self.statistics.update()
 
-        self.logger.debug("Command stats - %s" % self.statistics.stats)
+            self.logger.debug("Command stats - %s" % self.statistics.stats)
 
         b_ids = self.get_all_running_bundles()
         self.logger.debug("Bundles to hold: %s" % str(b_ids))
@@ -785,6 +844,11 @@ class MscDispatcher (MscQueryManager, MethodProxy):
                     self.started_track.remove(id)
 
 
+    def save_state(self, reason):
+        """Periodical save of container state for a warm restart """
+        self.warm_start.save_periodically(self)
+
+
     def unlock_when_empty(self, reason):
         """Unlocks empty startloops """
         if self.lock_start.locked and len(self.circuits)==0:
@@ -794,15 +858,29 @@ class MscDispatcher (MscQueryManager, MethodProxy):
 
     def mainloop(self):
         """ The main loop of scheduler """
-        d = maybeDeferred(self._mainloop)
+        self.tick_stats.tick_begin()
+
+        d = maybeDeferred(self.tick_stats.timed("mainloop", self._mainloop))
         #d.addCallback(self.launch_remaining_waitings)
         d.addCallback(self.update_stats)
         d.addCallback(self.remove_expired)
         #d.addCallback(self.unlock_when_empty)
+        d.addCallback(self.save_state)
         d.addErrback(self.eb_mainloop)
+        d.addCallback(self.tick_end)
 
         return d
 
+    def tick_end(self, reason):
+        """ Closes the timings and counters of current awake """
+        try:
+            self.tick_stats.tick_end(self.slots,
+                                     self.used_slots(),
+                                     self._circuits.count(CC_STATUS.ACTIVE),
+                                     self._circuits.count(CC_STATUS.WAITING))
+        except Exception, e:
+            self.logger.warn("Tick statistics failed: %s" % str(e))
+
     def eb_mainloop(self, failure):
         self.logger.error("Mainloop failed: %s" % str(failure))
 
@@ -812,6 +890,9 @@ class MscDispatcher (MscQueryManager, MethodProxy):
 
         self.logger.debug("Looking for new commands")
         try :
+            # actual state of all live circuits
+            StateSnapshot().load([c.id for c in self._circuits])
+
             self.rn_stats()
             self.wt_stats()
 
@@ -824,17 +905,9 @@ class MscDispatcher (MscQueryManager, MethodProxy):
             if self.has_free_slots():
                 top = self.free_slots
                 if top > 0 :
-
-                    starting_ids = [c.id for c in self.circuits if not c.is_running]
-                    running_ids = [c.id for c in self.circuits if c.initialized]
-                    waiting_ids = [c.id for c in self.get_valid_waitings()]
-
-                    ids_to_exclude = running_ids + waiting_ids + starting_ids
-
                     # Looking for new commands
-                    ids = get_ids_to_start(self.config.name,
-                                           ids_to_exclude,
-                                           top)
+                    ids = self.start_feed.take(top,
+                                               lambda id: id in self._circuits)
 
                     if len(ids) > 0 :
                         self.logger.info("Prepare %d new commands to initialize" % len(ids))
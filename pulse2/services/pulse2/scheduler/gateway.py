@@ -40,12 +40,13 @@ and mmc-agent.
 import logging
 
 from twisted.internet.protocol import Factory
-from twisted.internet.defer import Deferred
+from twisted.internet.defer import Deferred, succeed
 
 from pulse2.utils import xmlrpcCleanup
 from pulse2.scheduler.network import chooseClientIP
 from pulse2.scheduler.control import MscDispatcher
 from pulse2.scheduler.health import getHealth
+from pulse2.scheduler.launchers_driving import LaunchersCapacity
 from pulse2.scheduler.utils import UnixProtocol
 from pulse2.scheduler.dlp import DownloadQuery, get_dlp_method
 
@@ -113,6 +114,59 @@ class SchedulerGateway(UnixProtocol):
             return self._nok()
 
 
+    def _batch_clients(self, method, targets, failed):
+        """
+        Calls a batched check on the launchers for a list of targets.
+
+        @param method: name of launchers provider method
+        @type method: str
+
+        @param targets: lists of (uuid, fqdn, shortname, ips, macs, netmasks)
+        @type targets: list
+
+        @param failed: result for targets without an usable IP address
+        @type failed: object
+
+        @return: results of checks, in the order of targets
+        @rtype: Deferred
+        """
+        results = [failed] * len(targets)
+        indexes = []
+        clients = []
+        for index, (uuid, fqdn, shortname, ips, macs, netmasks) in enumerate(targets):
+            client = chooseClientIP({
+                'uuid': uuid,
+                'fqdn': fqdn,
+                'shortname': shortname,
+                'ips': ips,
+                'macs': macs,
+                'netmasks': netmasks
+            })
+            if client :
+                indexes.append(index)
+                clients.append(client)
+
+        if len(clients) == 0 :
+            return succeed(results)
+
+        def _merge(checked):
+            for index, result in zip(indexes, checked):
+                results[index] = result
+            return results
+
+        d = getattr(MscDispatcher().launchers_provider, method)(clients)
+        d.addCallback(_merge)
+        return d
+
+    def ping_clients(self, targets):
+        return self._batch_clients("ping_clients", targets, False)
+
+    def probe_clients(self, targets):
+        return self._batch_clients("probe_clients", targets, "Not available")
+
+    def ping_and_probe_clients(self, targets):
+        return self._batch_clients("ping_and_probe_clients", targets, 0)
+
     def download_file(self, uuid, fqdn, shortname, ips, macs, netmasks, path, bwlimit):
         return MscDispatcher().launchers_provider.download_file(uuid, fqdn, shortname, ips, macs, netmasks, path, bwlimit)
 
@@ -147,6 +201,10 @@ class SchedulerGateway(UnixProtocol):
         logging.getLogger().info("Launcher %s tells us it is alive" % launcher)
         return True
 
+    def tell_slots(self, launcher, slottotal, slotused):
+        LaunchersCapacity().update(launcher, slottotal, slotused)
+        return True
+
 
 
     def completed_quick_action(self, launcher, (exitcode, stdout, stderr), id, from_dlp=False):
@@ -208,6 +266,12 @@ class SchedulerGateway(UnixProtocol):
     def get_health(self):
         return getHealth()
 
+    def get_tick_stats(self):
+        return xmlrpcCleanup(MscDispatcher().tick_stats.get_stats())
+
+    def get_bulk_progress(self):
+        return xmlrpcCleanup(MscDispatcher().bulk_progress)
+
     def choose_client_ip(self, interfaces):
         return chooseClientIP(interfaces)
 
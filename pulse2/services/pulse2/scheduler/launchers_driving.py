@@ -21,15 +21,18 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
 # MA 02110-1301, USA.
 
+import time
 import logging
 
-from twisted.internet.defer import DeferredList, fail
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, DeferredList, fail, succeed
 from twisted.internet.error import TCPTimedOutError, ConnectionRefusedError
 from twisted.internet.error import ConnectError
 from pulse2.scheduler.config import SchedulerConfig
 from pulse2.scheduler.network import chooseClientIP
 from pulse2.scheduler.checks import getCheck, getAnnounceCheck
 from pulse2.scheduler.xmlrpc import getProxy
+from pulse2.utils import Singleton
 
 
 class Stats :
@@ -57,6 +60,81 @@ class Stats :
             cont_attr = type('Statistics', (object,), values)
             setattr(self, cont_attr_name, cont_attr)
 
+class LaunchersCapacity(Singleton):
+    """
+    In-memory table of launchers capacity.
+
+    The launchers push their slots usage on each change (tell_slots),
+    the polled statistics are stored as well. So the choice of launcher
+    is a local lookup while the table is fresh, and the launchers
+    are polled only when an entry is missing or too old.
+    """
+    # {launcher: [slottotal, slotused, timestamp]}
+    table = {}
+
+    def update(self, launcher, slottotal, slotused):
+        """
+        Stores the slots of launcher.
+
+        @param launcher: name of launcher
+        @type launcher: str
+
+        @param slottotal: total of slots
+        @type slottotal: int
+
+        @param slotused: used slots
+        @type slotused: int
+        """
+        self.table[launcher] = [slottotal, slotused, time.time()]
+
+    def reserve(self, launcher):
+        """
+        Counts a slot as used until the next update from launcher.
+
+        @param launcher: name of launcher
+        @type launcher: str
+        """
+        if launcher in self.table :
+            self.table[launcher][1] += 1
+
+    def is_fresh(self, launchers):
+        """
+        Checks if all the launchers have a recent entry.
+
+        @param launchers: names of launchers
+        @type launchers: list
+
+        @rtype: bool
+        """
+        limit = time.time() - SchedulerConfig().launchers_capacity_max_age
+        for launcher in launchers :
+            if launcher not in self.table :
+                return False
+            if self.table[launcher][2] < limit :
+                return False
+        return True
+
+    def best_candidate(self, launchers):
+        """
+        Selects the launcher having the most free slots.
+
+        @param launchers: names of launchers
+        @type launchers: list
+
+        @return: selected launcher, None if no free slots
+        @rtype: str
+        """
+        final_launcher = None
+        best_score = 0
+        for launcher in launchers :
+            slottotal, slotused, timestamp = self.table[launcher]
+            score = slottotal - slotused
+            if score > best_score:
+                best_score = score
+                final_launcher = launcher
+        return final_launcher
+
+
 def getClientCheck(target):
     return getCheck(SchedulerConfig().client_check, target);
 
@@ -193,7 +271,11 @@ class LauncherCallingProvider(type):
         @rtype: list
         """
         if stats_dict :
-            return Stats(stats_dict), launcher
+            stats = Stats(stats_dict)
+            LaunchersCapacity().update(launcher,
+                                       stats.slots.slottotal,
+                                       stats.slots.slotused)
+            return stats, launcher
         else :
             return fail(LauncherCallError(launcher))
 
@@ -335,18 +417,39 @@ class LauncherCallingProvider(type):
             logging.getLogger().error("An error occured when selecting a launcher: %s" % failure)
         return failure
 
+    def _select_from_capacity(self):
+        """
+        Selects the best launcher from the capacity table.
+
+        @return: selected launcher
+        @rtype: Deferred
+        """
+        capacity = LaunchersCapacity()
+        launcher = capacity.best_candidate(self.launchers.keys())
+        if launcher :
+            capacity.reserve(launcher)
+        else :
+            logging.getLogger().warn("No free slots on launchers, operation aborted")
+        return succeed(launcher)
+
     def _dispatch_launchers(self, method, *args):
         """
         Extract the balance statistics and select of a launcher
 
+        The launchers are polled only when the capacity table
+        is not up to date.
+
         @param method: method name to call
         @type method: str
 
         @param args: arguments of called method
         @type args: list
         """
-        d = self._get_all_stats()
-        d.addCallback(self._extract_best_candidate)
+        if LaunchersCapacity().is_fresh(self.launchers.keys()):
+            d = self._select_from_capacity()
+        else :
+            d = self._get_all_stats()
+            d.addCallback(self._extract_best_candidate)
         d.addCallback(self._call, method, *args)
         d.addErrback(self._eb_select)
         return d
@@ -448,6 +551,79 @@ def same_call(method):
 
 
 
+class WOLBatch(Singleton):
+    """
+    Gathers the WOL requests of circuits during wol_batch_delay seconds,
+    then sends them to a launcher in one call, grouped by broadcast address.
+    """
+    # {broadcast address: set of MAC addresses}
+    networks = {}
+    # [(deferred, broadcast addresses, message)]
+    waiting = []
+    flush_call = None
+
+    def add(self, provider, mac_addrs, target_bcast):
+        """
+        Adds the MAC addresses of a target to the next batch.
+
+        @param provider: provider of launcher calls
+        @type provider: RemoteCallProxy
+
+        @param mac_addrs: MAC addresses of target
+        @type mac_addrs: list
+
+        @param target_bcast: broadcast addresses, one per MAC address
+        @type target_bcast: list
+
+        @return: same result as the wol call of launcher
+        @rtype: Deferred
+        """
+        bcasts = set()
+        for mac_addr, bcast in map(None, mac_addrs, target_bcast) :
+            if not mac_addr :
+                continue
+            bcast = bcast or ''
+            self.networks.setdefault(bcast, set()).add(mac_addr)
+            bcasts.add(bcast)
+        message = "mac addresses: %s, target broadcasts: %s" % (mac_addrs, target_bcast)
+
+        d = Deferred()
+        self.waiting.append((d, bcasts, message))
+        if self.flush_call is None :
+            self.flush_call = reactor.callLater(SchedulerConfig().wol_batch_delay,
+                                                self.flush,
+                                                provider)
+        return d
+
+    def flush(self, provider):
+        """
+        Sends the gathered requests.
+
+        @param provider: provider of launcher calls
+        @type provider: RemoteCallProxy
+        """
+        networks = dict([(bcast, list(mac_addrs))
+                         for (bcast, mac_addrs) in self.networks.items()])
+        waiting = self.waiting
+        self.networks = {}
+        self.waiting = []
+        self.flush_call = None
+
+        logging.getLogger().debug("WOL on %d networks for %d targets" % (len(networks), len(waiting)))
+        d = provider.call_method("wol_batch", networks)
+        d.addCallbacks(self._dispatch, self._dispatch_error,
+                       callbackArgs=(waiting,), errbackArgs=(waiting,))
+
+    def _dispatch(self, results, waiting):
+        for d, bcasts, message in waiting :
+            success = not False in [results.get(bcast, False) for bcast in bcasts]
+            d.callback((success, message, ""))
+
+    def _dispatch_error(self, failure, waiting):
+        for d, bcasts, message in waiting :
+            d.errback(failure)
+
+
 class RemoteCallProxy :
     """
     Provides the remote calls to launchers.
@@ -632,6 +808,11 @@ class RemoteCallProxy :
     def wol(self, mac_addrs, target_bcast):
         pass
 
+    def wol_batched(self, mac_addrs, target_bcast):
+        if SchedulerConfig().wol_batch_delay > 0 :
+            return WOLBatch().add(self, mac_addrs, target_bcast)
+        return self.wol(mac_addrs, target_bcast)
+
 
     def ping_client(self, client):
         return self.call_method("icmp", client)
@@ -660,6 +841,19 @@ class RemoteCallProxy :
         d.addCallback(_pingcb)
         return d
 
+    def ping_clients(self, clients):
+        return self.call_method("icmp_batch", clients)
+
+    def probe_clients(self, clients):
+        return self.call_method("probe_batch", clients)
+
+    def ping_and_probe_clients(self, clients):
+        """
+        returns the list of ping_and_probe_client results,
+        in the order of clients
+        """
+        return self.call_method("icmp_and_probe_batch", clients)
+
     #TODO
     def getLaunchersBalance(self) : pass
 
@@ -289,7 +289,7 @@ class WOLPhase(Phase):
         mac_addrs = self.target.target_macaddr.split('||')
         target_bcast = self.target.target_bcast.split('||')
 
-        d = self.launchers_provider.wol(mac_addrs, target_bcast)
+        d = self.launchers_provider.wol_batched(mac_addrs, target_bcast)
         d.addCallback(self.parseWOLAttempt)
         d.addErrback(self.parseWOLError)
         d.addErrback(self.got_error_in_error)
@@ -28,6 +28,7 @@ except ImportError :
 from functools import wraps
 
 from pulse2.utils import SingletonN
+from pulse2.scheduler.utils import PackUtils
 
 
 
@@ -70,6 +71,10 @@ class SendingBuffer(object):
 
     config = None
 
+    # with several scheduler workers, a sender per worker
+    senders = None
+    router = None
+
     def init(self, config):
         self.config = config
         self._initialized = True
@@ -78,6 +83,35 @@ class SendingBuffer(object):
     def register_sender(self, sender):
         self.sender = sender
 
+    def register_senders(self, senders, router):
+        """
+        Registers the senders of all scheduler workers.
+
+        @param senders: senders ordered by index of worker
+        @type senders: list
+
+        @param router: resolves the worker of a response
+        @type router: ShardRouter
+        """
+        self.senders = senders
+        self.router = router
+
+    def _get_sender(self, packet):
+        """
+        @param packet: packed response
+        @type packet: str
+
+        @return: sender of worker owning the response
+        @rtype: Sender
+        """
+        if self.router is None :
+            return self.sender
+        data = PackUtils.unpack(packet)
+        if isinstance(data, list) and len(data) == 2 :
+            func_name, args = data
+            return self.senders[self.router.shard_of(func_name, args)]
+        return self.senders[0]
+
     packets = []
     def add(self, pack):
         self.packets.append(pack)
@@ -85,14 +119,15 @@ class SendingBuffer(object):
     def send(self):
         """Sends a response to scheduler"""
         if len(self.packets) > 0 :
-            if not self.sender.send_locked :
-                self._send()
+            sender = self._get_sender(self.packets[0])
+            if not sender.send_locked :
+                self._send(sender)
 
-    def _send(self):
+    def _send(self, sender):
         """Sends the response to scheduler"""
         packet = self.packets[0]
         del self.packets[0]
-        self.sender.call_remote(packet)
+        sender.call_remote(packet)
         logging.getLogger().debug("Remaining requests to send: %d" % (len(self.packets))) 
 
     @initialized
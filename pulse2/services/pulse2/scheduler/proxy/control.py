@@ -28,7 +28,7 @@ from pulse2.xmlrpc import OpenSSLContext
 from pulse2.scheduler.xmlrpc import SchedulerSite
 
 from pulse2.scheduler.proxy.xmlrpc import ForwardingProxy
-from pulse2.scheduler.proxy.unix import Forwarder
+from pulse2.scheduler.proxy.unix import Forwarder, ShardedForwarder
 from pulse2.scheduler.proxy.buffer import SendingBuffer
 
 
@@ -45,11 +45,19 @@ class App :
     def setup(self):
         """Setup the forwarding proxy"""
         response_handler = self.xmlrpc_proxy.client_response
-        d = task.deferLater(reactor, 
-                            2, 
-                            Forwarder, 
-                            response_handler,
-                            self.socket_file)
+        if self.config.shards > 1 :
+            # several scheduler workers
+            d = task.deferLater(reactor,
+                                2,
+                                ShardedForwarder,
+                                response_handler,
+                                self.config)
+        else :
+            d = task.deferLater(reactor, 
+                                2, 
+                                Forwarder, 
+                                response_handler,
+                                self.socket_file)
         d.addCallback(self._got_forwarder)
         d.addErrback(self._eb_got_forwarder)
 
@@ -90,7 +98,11 @@ class App :
 
     def start_emitting_buffer(self):
         SendingBuffer().restore_buffer()
-        SendingBuffer().register_sender(self.forwarder.protocol)
+        if self.config.shards > 1 :
+            SendingBuffer().register_senders(self.forwarder.protocols,
+                                             self.forwarder.router)
+        else :
+            SendingBuffer().register_sender(self.forwarder.protocol)
         t = task.LoopingCall(SendingBuffer().send)
         t.start(self.config.proxy_buffer_period)
 
@@ -100,7 +112,7 @@ class App :
         self.logger.info("XMLRPC Proxy: cleaning up...")
         self.logger.info("XMLRPC Proxy: stop the unix socket listening")
 
-        self.forwarder.protocol.transport.loseConnection()
+        self.forwarder.disconnect()
 
         SendingBuffer().backup_buffer()
 
@@ -0,0 +1,175 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Pulse 2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+"""
+Routing of incoming calls between several scheduler workers.
+
+Each worker processes the commands_on_host having id modulo number
+of workers equal to its index (see get_shard).
+"""
+
+import xmlrpclib
+
+from pulse2.scheduler.utils import get_shard
+
+
+class ShardRouter(object):
+    """
+    Resolves the scheduler worker(s) to call.
+
+    - calls related to one commands_on_host go to its owner
+    - lists of commands_on_host are splitted between owners
+    - calls related to commands go to all the workers
+    - all other calls go to the first worker
+
+    Responses of a call splitted between several workers are merged
+    into one response (see merge).
+    """
+    # methods having a commands_on_host id, with its position in arguments
+    coh_methods = {"completed_quick_action": 2,
+                   "completed_push": 2,
+                   "completed_pull": 2,
+                   "completed_execution": 2,
+                   "completed_deletion": 2,
+                   "completed_inventory": 2,
+                   "completed_reboot": 2,
+                   "completed_halt": 2,
+                   "completed_step": 0,
+                   "verify_target": 0,
+                   "start_command": 0,
+                   "stop_command": 0,
+                   }
+    # methods having a list of commands_on_host ids as first argument
+    coh_list_methods = ["start_commands",
+                        "stop_commands",
+                        ]
+    # methods called on all the workers
+    broadcast_methods = ["start_all_commands",
+                         "start_these_commands",
+                         "extend_command",
+                         "tell_slots",
+                         "get_health",
+                         "get_tick_stats",
+                         "get_bulk_progress",
+                         ]
+    # broadcasted methods returning the state of each worker,
+    # responses are keyed by index of worker
+    per_shard_methods = ["get_health",
+                         "get_tick_stats",
+                         ]
+
+    def __init__(self, shards):
+        """
+        @param shards: number of scheduler workers
+        @type shards: int
+        """
+        self.shards = shards
+
+    def shard_of(self, func_name, args):
+        """
+        Worker of a call having at most one commands_on_host.
+
+        @param func_name: name of called method
+        @type func_name: str
+
+        @param args: arguments of called method
+        @type args: tuple
+
+        @return: index of worker
+        @rtype: int
+        """
+        if func_name in self.coh_methods :
+            return get_shard(args[self.coh_methods[func_name]], self.shards)
+        return 0
+
+    def route(self, func_name, args):
+        """
+        Splits a call between the workers.
+
+        @param func_name: name of called method
+        @type func_name: str
+
+        @param args: arguments of called method
+        @type args: tuple
+
+        @return: list of tuples (index of worker, arguments)
+        @rtype: list
+        """
+        if func_name in self.broadcast_methods :
+            return [(shard, args) for shard in range(self.shards)]
+
+        if func_name in self.coh_list_methods and len(args) > 0 :
+            by_shards = {}
+            for id in args[0] :
+                by_shards.setdefault(get_shard(id, self.shards), []).append(id)
+            if len(by_shards) > 0 :
+                return [(shard, (ids,) + tuple(args[1:]))
+                        for (shard, ids) in sorted(by_shards.items())]
+
+        return [(self.shard_of(func_name, args), args)]
+
+    def merge(self, func_name, results):
+        """
+        Merges the responses of a call splitted between several workers.
+
+        - a fault (or a failed call) of any worker is returned
+        - states of workers are returned keyed by index of worker
+        - progress of bulk operations are summed
+        - lists are concatenated
+        - otherwise True if all the workers returned True, the first
+          other response elsewhere
+
+        @param func_name: name of called method
+        @type func_name: str
+
+        @param results: list of tuples (index of worker, response)
+        @type results: list
+
+        @return: merged response
+        @rtype: any
+        """
+        for shard, result in results :
+            if isinstance(result, xmlrpclib.Fault):
+                return result
+
+        if func_name in self.per_shard_methods :
+            return dict([(str(shard), result) for (shard, result) in results])
+
+        if func_name == "get_bulk_progress" :
+            progress = {}
+            for shard, result in results :
+                for name, (processed, total) in result.items():
+                    done = progress.setdefault(name, [0, 0])
+                    done[0] += processed
+                    done[1] += total
+            return progress
+
+        responses = [result for (shard, result) in results]
+        if len(responses) > 0 and all([isinstance(r, list) for r in responses]):
+            merged = []
+            for response in responses :
+                merged.extend(response)
+            return merged
+
+        for response in responses :
+            if response is not True :
+                return response
+        return True
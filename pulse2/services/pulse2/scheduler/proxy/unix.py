@@ -20,12 +20,16 @@
 # MA 02110-1301, USA.
 
 import logging
+import xmlrpclib
 
 from twisted.internet import reactor
+from twisted.internet.defer import Deferred, DeferredList
 from twisted.internet.protocol import Protocol, ClientCreator
+from twisted.web.xmlrpc import XMLRPC
 
 from pulse2.scheduler.utils import PackUtils
 from pulse2.scheduler.proxy.buffer import SendingBuffer
+from pulse2.scheduler.proxy.shards import ShardRouter
 
 
 class Sender(Protocol):
@@ -63,16 +67,30 @@ class Forwarder:
     _protocol = None
     _cached_methods = []
 
+    # attempts to connect and delay between them
+    connect_attempts = 10
+    connect_delay = 2
+
     def __init__(self, response_handler, socket_file):
         """Initiate a connect attempt"""
         self.logger = logging.getLogger()
+        self.socket_file = socket_file
 
         Sender.register_response_handler(response_handler)
+        self._connect(self.connect_attempts)
+
+    def _connect(self, attempts):
+        """
+        Connects to the scheduler, retrying when not yet listening.
+
+        @param attempts: remaining attempts
+        @type attempts: int
+        """
         client = ClientCreator(reactor, Sender)
 
-        d = client.connectUNIX(socket_file)
+        d = client.connectUNIX(self.socket_file)
         d.addCallback(self._got_protocol)
-        d.addErrback(self._eb_got_protocol)
+        d.addErrback(self._eb_got_protocol, attempts - 1)
 
     def append_cached_method(self, name):
         self._cached_methods.append(name)
@@ -94,8 +112,16 @@ class Forwarder:
         self.protocol = protocol
 
 
-    def _eb_got_protocol(self, failure):
-        self.logger.error("UX protocol failed: %s" % failure)
+    def _eb_got_protocol(self, failure, attempts=0):
+        if attempts > 0 :
+            self.logger.debug("UX protocol on %s not ready, retrying" % self.socket_file)
+            reactor.callLater(self.connect_delay, self._connect, attempts)
+        else :
+            self.logger.error("UX protocol failed: %s" % failure)
+
+    def disconnect(self):
+        """ Closes the connection to the scheduler """
+        self.protocol.transport.loseConnection()
 
     def _response_ok(self, result):
         return True
@@ -137,4 +163,98 @@ class Forwarder:
         
 
 
+class ShardRequest(object):
+    """
+    Request of a call forwarded to one of several workers.
+
+    Passed instead of the original request, its deferred fires
+    with the response of the worker.
+    """
+    def __init__(self, shard):
+        self.shard = shard
+        self.deferred = Deferred()
+
+
+class ShardedForwarder(object):
+    """
+    Forwards the calls to several scheduler workers.
+
+    Each worker listens on its own unix socket, calls are splitted
+    by ShardRouter. When a call is splitted, the responses of all
+    the workers are merged before being returned to the caller.
+    """
 
+    def __init__(self, response_handler, config):
+        """
+        @param response_handler: handler of responses from scheduler
+        @type response_handler: callable
+
+        @param config: scheduler's configuration container
+        @type config: SchedulerConfig
+        """
+        self.logger = logging.getLogger()
+        self.response_handler = response_handler
+        self.router = ShardRouter(config.shards)
+        self.forwarders = [Forwarder(self._response,
+                                     config.shard_socket_path(shard))
+                           for shard in range(config.shards)]
+
+    def append_cached_method(self, name):
+        # the cached methods are shared by all forwarders
+        self.forwarders[0].append_cached_method(name)
+
+    @property
+    def protocols(self):
+        """ Protocols of all workers, ordered by index of worker """
+        return [forwarder.protocol for forwarder in self.forwarders]
+
+    def disconnect(self):
+        """ Closes the connections to all the workers """
+        for forwarder in self.forwarders :
+            forwarder.disconnect()
+
+    def _response(self, result, request, func_name, args):
+        """ Handles the responses of all the workers """
+        if isinstance(request, ShardRequest):
+            if not request.deferred.called :
+                request.deferred.callback((request.shard, result))
+        else :
+            return self.response_handler(result, request, func_name, args)
+
+    def _call_shard(self, shard, func_name, args):
+        """
+        Forwards a part of splitted call to a worker.
+
+        @return: deferred fired with tuple (index of worker, response)
+        @rtype: Deferred
+        """
+        request = ShardRequest(shard)
+        forwarder = self.forwarders[shard]
+        try :
+            forwarder.protocol
+        except ValueError :
+            self.logger.warn("UX: worker %d not connected, %s failed" %
+                             (shard, func_name))
+            fault = xmlrpclib.Fault(XMLRPC.FAILURE,
+                                    "Scheduler worker %d not connected" % shard)
+            request.deferred.callback((shard, fault))
+            return request.deferred
+
+        forwarder.call_remote(request, func_name, args)
+        return request.deferred
+
+    def call_remote(self, request, func_name, args):
+        routes = self.router.route(func_name, args)
+        if len(routes) == 1 :
+            shard, shard_args = routes[0]
+            self.forwarders[shard].call_remote(request, func_name, shard_args)
+            return
+
+        dl = DeferredList([self._call_shard(shard, func_name, shard_args)
+                           for (shard, shard_args) in routes])
+
+        @dl.addCallback
+        def _merge(results):
+            responses = [result for (success, result) in results]
+            merged = self.router.merge(func_name, responses)
+            self.response_handler(merged, request, func_name, args)
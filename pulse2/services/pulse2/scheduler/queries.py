@@ -20,12 +20,16 @@
 # MA 02110-1301, USA.
 import logging
 import time
+from datetime import datetime
+from threading import Lock
 
 from sqlalchemy.orm import create_session
 from sqlalchemy import not_, or_, func
 
 
+from pulse2.utils import SingletonN
 from pulse2.database.msc import MscDatabase
+from pulse2.scheduler.timeaxis import LaunchTimeResolver
 
 from pulse2.database.msc.orm.commands import Commands
 from pulse2.database.msc.orm.commands_on_host import CommandsOnHost, CoHManager
@@ -177,12 +181,293 @@ class RefreshedCommands(Refresh, Commands): pass
 class RefreshedTarget(Refresh, Target): pass
 
 
+class StateSnapshot(object):
+    """
+    Per-tick snapshot of CommandsOnHost, Commands, Target and phases records
+    of all live circuits.
+
+    The snapshot is loaded on each awake with one bulk query per table
+    and serves the records to CoHQuery instead of re-querying them
+    one by one for each circuit.
+
+    Each served record is extended by :
+    - refresh() method to re-query the record and replace it in snapshot
+    - flush() method which after the writing marks the record as current
+      in snapshot, so the rows written by scheduler are never served stale.
+
+    Records modified out of these instances (i.e. by CoHManager) must be
+    invalidated.
+    """
+    __metaclass__ = SingletonN
+
+    def __init__(self):
+        self.logger = logging.getLogger()
+        # {id: record}
+        self._cohs = {}
+        self._cmds = {}
+        self._targets = {}
+        # {coh_id: {phase_name: record}}
+        self._phases = {}
+        # records written during a load, overlayed on the loaded ones
+        self._written = []
+        self._lock = Lock()
+        # flush locks of records shared by the circuits (i.e. commands)
+        self._flush_locks = {}
+
+    def load(self, ids):
+        """
+        Bulk loading of records of all live circuits.
+
+        Records of circuits not in ids are dropped.
+
+        @param ids: commands_on_host ids of all live circuits
+        @type ids: list
+        """
+        self._written = []
+        cohs, cmds, targets, phases = self._query_all(set(ids))
+
+        with self._lock :
+            for record in self._written :
+                self._store_into(record, cohs, cmds, targets, phases)
+            self._written = []
+            self._cohs, self._cmds, self._targets, self._phases = cohs, cmds, targets, phases
+
+    def prefetch(self, ids):
+        """
+        Bulk loading of records of circuits missing in snapshot.
+
+        @param ids: commands_on_host ids
+        @type ids: list
+        """
+        missing = set(id for id in ids if id not in self._cohs)
+        if len(missing) == 0 :
+            return
+        cohs, cmds, targets, phases = self._query_all(missing)
+
+        with self._lock :
+            for (records, fetched) in [(self._cohs, cohs),
+                                       (self._cmds, cmds),
+                                       (self._targets, targets),
+                                       (self._phases, phases)]:
+                for id, record in fetched.items():
+                    records.setdefault(id, record)
+
+    def _query_all(self, ids):
+        """
+        Queries the records of circuits with one query per table.
+
+        @param ids: commands_on_host ids
+        @type ids: set
+
+        @return: (cohs, cmds, targets, phases) containers
+        @rtype: tuple
+        """
+        ids = list(ids)
+        cohs, cmds, targets, phases = {}, {}, {}, {}
+
+        if len(ids) > 0 :
+            database = MscDatabase()
+            session = create_session()
+
+            for coh in session.query(CommandsOnHost).filter(
+                    database.commands_on_host.c.id.in_(ids)).all():
+                cohs[coh.id] = self._extend(coh)
+
+            cmd_ids = list(set(coh.fk_commands for coh in cohs.values()))
+            if len(cmd_ids) > 0 :
+                for cmd in session.query(Commands).filter(
+                        database.commands.c.id.in_(cmd_ids)).all():
+                    cmds[cmd.id] = self._extend(cmd)
+
+            target_ids = list(set(coh.fk_target for coh in cohs.values()))
+            if len(target_ids) > 0 :
+                for target in session.query(Target).filter(
+                        database.target.c.id.in_(target_ids)).all():
+                    targets[target.id] = self._extend(target)
+
+            for phase in session.query(CommandsOnHostPhase).filter(
+                    database.commands_on_host_phase.c.fk_commands_on_host.in_(ids)).all():
+                phases.setdefault(phase.fk_commands_on_host, {})[phase.name] = self._extend(phase)
+
+            session.close()
+
+        return cohs, cmds, targets, phases
+
+    def invalidate(self, ids):
+        """
+        Drops the records of selected circuits (commands_on_host and phases).
+
+        Commands and target records are kept, they aren't modified
+        per circuit.
+
+        @param ids: commands_on_host ids
+        @type ids: list
+        """
+        with self._lock :
+            for id in ids :
+                self._cohs.pop(id, None)
+                self._phases.pop(id, None)
+
+    def reload(self, ids, cmd_ids=[]):
+        """
+        Re-queries the records of selected circuits in bulk,
+        typically after a set-based update.
+
+        @param ids: commands_on_host ids
+        @type ids: list
+
+        @param cmd_ids: commands ids
+        @type cmd_ids: list
+        """
+        self.invalidate(ids)
+        self.invalidate_commands(cmd_ids)
+        self.prefetch(ids)
+
+    def invalidate_commands(self, cmd_ids):
+        """
+        Drops the selected commands records.
+
+        @param cmd_ids: commands ids
+        @type cmd_ids: list
+        """
+        with self._lock :
+            for cmd_id in cmd_ids :
+                self._cmds.pop(cmd_id, None)
+
+    def coh(self, id):
+        """
+        @param id: commands_on_host id
+        @type id: int
+
+        @return: CommandsOnHost record
+        @rtype: CommandsOnHost
+        """
+        return self._get(self._cohs, CommandsOnHost, id)
+
+    def cmd(self, id):
+        """
+        @param id: commands id
+        @type id: int
+
+        @return: Commands record
+        @rtype: Commands
+        """
+        return self._get(self._cmds, Commands, id)
+
+    def target(self, id):
+        """
+        @param id: target id
+        @type id: int
+
+        @return: Target record
+        @rtype: Target
+        """
+        return self._get(self._targets, Target, id)
+
+    def phases(self, id):
+        """
+        @param id: commands_on_host id
+        @type id: int
+
+        @return: all phases of circuit sorted by phase_order
+        @rtype: list
+        """
+        phases = self._phases.get(id)
+        if phases is None :
+            database = MscDatabase()
+            session = create_session()
+            query = session.query(CommandsOnHostPhase)
+            query = query.filter(database.commands_on_host_phase.c.fk_commands_on_host == id)
+            phases = dict((phase.name, self._extend(phase)) for phase in query.all())
+            session.close()
+            with self._lock :
+                self._phases[id] = phases
+        return sorted(phases.values(), key=lambda p: p.phase_order)
+
+    def _get(self, records, cls, id):
+        """
+        Gets a record from snapshot or queries it if missing.
+
+        @param records: snapshot container of table
+        @type records: dict
+
+        @param cls: queried table
+        @type cls: SqlAlchemy table
+
+        @param id: table id
+        @type id: int
+        """
+        record = records.get(id)
+        if record is None :
+            with MscQuerySession(cls, id) as q:
+                record = q.query
+            if record is None :
+                return None
+            self._extend(record)
+            self._store(record)
+        return record
+
+    def _extend(self, record):
+        """
+        Extends a record by refresh() and flush() methods.
+
+        @param record: SqlAlchemy record
+        @type record: object
+        """
+        cls = record.__class__
+        key = (cls, record.id)
+
+        def refresh():
+            with MscQuerySession(cls, record.id) as q:
+                fresh = q.query
+            if fresh is not None :
+                self._store(self._extend(fresh))
+            return fresh
+
+        def flush():
+            lock = self._flush_locks.setdefault(key, Lock())
+            with lock :
+                cls.flush(record)
+            self._store(record)
+
+        record.refresh = refresh
+        record.flush = flush
+        return record
+
+    def _store(self, record):
+        """
+        Marks a record as current in snapshot.
+
+        @param record: SqlAlchemy record
+        @type record: object
+        """
+        with self._lock :
+            self._written.append(record)
+            self._store_into(record,
+                             self._cohs,
+                             self._cmds,
+                             self._targets,
+                             self._phases)
+
+    def _store_into(self, record, cohs, cmds, targets, phases):
+        """ Places a record into its table container """
+        if isinstance(record, CommandsOnHost):
+            cohs[record.id] = record
+        elif isinstance(record, Commands):
+            cmds[record.id] = record
+        elif isinstance(record, Target):
+            targets[record.id] = record
+        elif isinstance(record, CommandsOnHostPhase):
+            if record.fk_commands_on_host in phases :
+                phases[record.fk_commands_on_host][record.name] = record
+
+
 class CoHQuery :
     """
     Container keeping CommandsOnHost, Commands and Target records.
 
-    Based on CommandsOnHost id, all related records are initialised
-    by constructor and still in memory.
+    Based on CommandsOnHost id, all related records are served
+    by the per-tick StateSnapshot (and queried only when missing).
     All records are accessibles as properties having a refresh() method
     to re-query...
     """
@@ -192,51 +477,26 @@ class CoHQuery :
         @type id: int
         """
         self._id = id
+        self._snapshot = StateSnapshot()
 
-        # initial queries
-        self._coh = RefreshedCommandsOnHost(self._id).get()
-        self._cmd = RefreshedCommands(self._coh.getIdCommand()).get()
-        self._target = RefreshedTarget(self._coh.getIdTarget()).get()
+        coh = self._snapshot.coh(self._id)
+        self._cmd_id = coh.getIdCommand()
+        self._target_id = coh.getIdTarget()
 
     def get_phase(self, name):
-        database = MscDatabase()
-        session = create_session()
-        phase = session.query(CommandsOnHostPhase)
-        phase = phase.filter(database.commands_on_host_phase.c.fk_commands_on_host == self._id)
-        phase = phase.filter(database.commands_on_host_phase.c.name == name)
-        phase = phase.first()
-        session.close()
-        if isinstance(phase, list):
-            return phase[0]
-        else :
-            return phase
+        for phase in self._snapshot.phases(self._id):
+            if phase.name == name :
+                return phase
+        return None
 
     def get_phases(self):
-        database = MscDatabase()
-        session = create_session()
-        phases = session.query(CommandsOnHostPhase)
-        phases = phases.filter(database.commands_on_host_phase.c.fk_commands_on_host == self._id)
-        phases = phases.filter(database.commands_on_host_phase.c.state != "done")
-        session.close()
-        return [q.name for q in phases.all()]
+        return [q.name for q in self._snapshot.phases(self._id) if q.state != "done"]
 
     def get_all_phases(self):
-        database = MscDatabase()
-        session = create_session()
-        phases = session.query(CommandsOnHostPhase)
-        phases = phases.filter(database.commands_on_host_phase.c.fk_commands_on_host == self._id)
-        session.close()
-        return phases.all()
+        return self._snapshot.phases(self._id)
 
     def get_starting_phase(self):
-        database = MscDatabase()
-        session = create_session()
-        phases = session.query(CommandsOnHostPhase)
-        phases = phases.filter(database.commands_on_host_phase.c.fk_commands_on_host == self._id)
-        phases = phases.filter(database.commands_on_host_phase.c.state != "done")
-        phases = phases.order_by(database.commands_on_host_phase.c.phase_order)
-        session.close()
-        for phase in phases.all():
+        for phase in self.get_all_phases():
             if phase.state in ("ready","running", "failed"):
                 return phase.name
         else :
@@ -251,7 +511,7 @@ class CoHQuery :
         @return: CommandsOnHost instance extended by refresh() method
         @rtype: SqlAlchemy qyery object
         """
-        return self._coh
+        return self._snapshot.coh(self._id)
 
     @property
     def cmd(self):
@@ -261,7 +521,7 @@ class CoHQuery :
         @return: Commands instance extended by refresh() method
         @rtype: SqlAlchemy qyery object
         """
-        return self._cmd
+        return self._snapshot.cmd(self._cmd_id)
 
     @property
     def target(self):
@@ -271,7 +531,7 @@ class CoHQuery :
         @return: Target instance extended by refresh() method
         @rtype: SqlAlchemy qyery object
         """
-        return self._target
+        return self._snapshot.target(self._target_id)
 
 def get_all_phases(id):
     database = MscDatabase()
@@ -288,14 +548,121 @@ def any_failed(id, non_fatal_steps=[]):
     return False
 
 
-def get_ids_to_start(scheduler_name, ids_to_exclude = [], top=None):
+def get_open_deployment_intervals(session, now):
+    """
+    Gets the distinct deployment intervals of valid commands
+    which are matching to now.
+
+    @param session: opened session
+    @type session: SqlAlchemy session
+
+    @param now: checked timestamp
+    @type now: float
+
+    @return: deployment intervals matching to now
+    @rtype: list
+    """
     database = MscDatabase()
-    session = create_session()
+    date = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+    launch_date = datetime.fromtimestamp(now)
 
-    now = time.strftime("%Y-%m-%d %H:%M:%S")
+    query = session.query(database.commands.c.deployment_intervals).distinct()
+    query = query.filter(database.commands.c.end_date > date)
+
+    intervals = []
+    for (interval,) in query.all():
+        if not interval :
+            continue
+        try :
+            if LaunchTimeResolver.in_deployment_interval(interval, launch_date):
+                intervals.append(interval)
+        except ValueError, e:
+            log.warn("Invalid deployment interval '%s': %s" % (interval, str(e)))
+    return sorted(intervals)
+
+def get_ready_commands_watermark(session, now):
+    """
+    Gets the lowest commands id which may become ready since now.
+
+    All the commands having a lower id and still valid are already ready,
+    so their commands_on_host are selectable by next_launch_date.
+
+    @param session: opened session
+    @type session: SqlAlchemy session
+
+    @param now: checked timestamp
+    @type now: float
+
+    @return: lowest id of commands not ready yet
+    @rtype: int
+    """
+    database = MscDatabase()
+    date = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+
+    query = session.query(func.min(database.commands.c.id))
+    query = query.filter(database.commands.c.ready == False)
+    query = query.filter(database.commands.c.end_date > date)
+    watermark = query.scalar()
+    if watermark is None :
+        watermark = (session.query(func.max(database.commands.c.id)).scalar() or 0) + 1
+    return watermark
+
+
+def get_ids_to_start(session,
+                     scheduler_name,
+                     now,
+                     open_intervals,
+                     since=None,
+                     cmd_watermark=None,
+                     shards=1,
+                     shard=0):
+    """
+    Gets the commands_on_host ready to start.
+
+    If since is given, only the commands_on_host which became due after
+    this date or which belong to commands having id >= cmd_watermark
+    are selected. With several scheduler workers, only the commands_on_host
+    owned by the worker are selected (see get_shard).
+
+    @param session: opened session
+    @type session: SqlAlchemy session
+
+    @param scheduler_name: name of scheduler
+    @type scheduler_name: str
+
+    @param now: timestamp of poll
+    @type now: float
+
+    @param open_intervals: deployment intervals matching to now
+    @type open_intervals: list
+
+    @param since: timestamp of previous poll
+    @type since: float
+
+    @param cmd_watermark: lowest id of commands not ready on previous poll
+    @type cmd_watermark: int
+
+    @param shards: number of scheduler workers
+    @type shards: int
+
+    @param shard: index of this worker
+    @type shard: int
+
+    @return: list of tuples (coh_id, order_in_bundle)
+    @rtype: list
+    """
+    database = MscDatabase()
+
+    now = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
     soon = time.strftime("0000-00-00 00:00:00")
 
-    commands_query = session.query(Commands, CommandsOnHost, Target, PullTargets).\
+    in_interval = [database.commands.c.deployment_intervals == None,
+                   database.commands.c.deployment_intervals == '']
+    if len(open_intervals) > 0 :
+        in_interval.append(database.commands.c.deployment_intervals.in_(open_intervals))
+
+    commands_query = session.query(database.commands_on_host.c.id,
+                                   database.commands.c.order_in_bundle).\
                 select_from(database.commands_on_host.join(database.commands).join(database.target).
                     outerjoin(database.pull_targets, Target.target_uuid == database.pull_targets.c.target_uuid)
         ).filter(not_(database.commands_on_host.c.current_state.in_(("failed", "over_timed", "done", "stopped")))
@@ -308,24 +675,161 @@ def get_ids_to_start(scheduler_name, ids_to_exclude = [], top=None):
                      database.commands_on_host.c.scheduler == scheduler_name,
                      database.commands_on_host.c.scheduler == None)
         ).filter(database.pull_targets.c.target_uuid == None
-        ).filter(database.commands.c.ready == True)
-    if len(ids_to_exclude) > 0 :
-        commands_query = commands_query.filter(not_(database.commands_on_host.c.id.in_(ids_to_exclude)))
+        ).filter(database.commands.c.ready == True
+        ).filter(or_(*in_interval))
+    if since is not None :
+        since = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(since))
+        commands_query = commands_query.filter(
+                or_(database.commands_on_host.c.next_launch_date > since,
+                    database.commands.c.id >= cmd_watermark))
+    if shards > 1 :
+        commands_query = commands_query.filter(
+                database.commands_on_host.c.id % shards == shard)
     commands_query = commands_query.order_by(database.commands.c.order_in_bundle.asc(),
                                              database.commands_on_host.c.current_state.desc())
-    if top :
-        commands_query = commands_query.limit(top)
-        # IMPORTANT NOTE : This ordering is not alphabetical!
-        # Field 'current_state' is ENUM type, so decisive condition
-        # is order of element in the declaration of field.
-        # Because this order of elements is suitable on workflow,
-        # using of descending order allows to favouring the commands
-        # which state is approaching to end of worklow.
-
-    commands = commands_query.all()
-    commands_to_perform = [coh.id for (cmd, coh, target, pt) in commands if cmd.inDeploymentInterval()]
-    session.close()
-    return commands_to_perform
+    # IMPORTANT NOTE : This ordering is not alphabetical!
+    # Field 'current_state' is ENUM type, so decisive condition
+    # is order of element in the declaration of field.
+    # Because this order of elements is suitable on workflow,
+    # using of descending order allows to favouring the commands
+    # which state is approaching to end of worklow.
+
+    return commands_query.all()
+
+
+class StartFeed(object):
+    """
+    Incremental feed of commands_on_host to start.
+
+    Instead of re-querying on each awake all the startable commands_on_host
+    while excluding all the ids already in the container, only
+    the commands_on_host which became due since the previous poll
+    (high-water mark of next_launch_date), or which belong to newly
+    ready commands, are queried. Found ids are pending until they
+    appear in the container.
+
+    A full rescan is processed periodically, when the set of opened
+    deployment intervals changes or when requested by reset()
+    (i.e. a command re-scheduled from exterior).
+    """
+
+    def __init__(self, scheduler_name, rescan_period, margin, shards=1, shard=0):
+        """
+        @param scheduler_name: name of scheduler
+        @type scheduler_name: str
+
+        @param rescan_period: delay between two full rescans (in seconds)
+        @type rescan_period: int
+
+        @param margin: overlap of polls to cover uncommited writes (in seconds)
+        @type margin: int
+
+        @param shards: number of scheduler workers
+        @type shards: int
+
+        @param shard: index of this worker
+        @type shard: int
+        """
+        self.scheduler_name = scheduler_name
+        self.rescan_period = rescan_period
+        self.margin = margin
+        self.shards = shards
+        self.shard = shard
+        self.logger = logging.getLogger()
+
+        # {coh_id: (order_in_bundle, sequence)}
+        self._pending = {}
+        self._sequence = 0
+        self._last_poll = None
+        self._last_rescan = None
+        self._cmd_watermark = None
+        self._open_intervals = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def reset(self):
+        """ Next poll will be a full rescan """
+        self._last_rescan = None
+
+    def discard(self, ids):
+        """
+        Removes the pending ids (i.e. stopped commands_on_host).
+
+        @param ids: commands_on_host ids
+        @type ids: list
+        """
+        for id in ids :
+            self._pending.pop(id, None)
+
+    def poll(self):
+        """ Looks for new commands_on_host to start """
+        now = time.time()
+        full = self._last_rescan is None \
+                or now - self._last_rescan >= self.rescan_period
+
+        session = create_session()
+        open_intervals = get_open_deployment_intervals(session, now)
+        if open_intervals != self._open_intervals :
+            full = True
+        cmd_watermark = get_ready_commands_watermark(session, now)
+
+        if full :
+            rows = get_ids_to_start(session,
+                                    self.scheduler_name,
+                                    now,
+                                    open_intervals,
+                                    shards=self.shards,
+                                    shard=self.shard)
+            self._pending = {}
+            self._last_rescan = now
+        else :
+            rows = get_ids_to_start(session,
+                                    self.scheduler_name,
+                                    now,
+                                    open_intervals,
+                                    self._last_poll - self.margin,
+                                    self._cmd_watermark,
+                                    self.shards,
+                                    self.shard)
+        session.close()
+
+        for (id, order_in_bundle) in rows :
+            if id not in self._pending :
+                self._sequence += 1
+                self._pending[id] = (order_in_bundle or 0, self._sequence)
+
+        self._last_poll = now
+        self._cmd_watermark = cmd_watermark
+        self._open_intervals = open_intervals
+
+        self.logger.debug("Start feed: %d new, %d pending (full rescan: %s)" %
+                (len(rows), len(self._pending), full))
+
+    def take(self, top, is_known):
+        """
+        Gets the ids to start.
+
+        @param top: max number of ids
+        @type top: int
+
+        @param is_known: returns True if the id is already in the container
+        @type is_known: callable
+
+        @return: commands_on_host ids to start
+        @rtype: list
+        """
+        self.poll()
+
+        ids = []
+        for id in sorted(self._pending, key=self._pending.get):
+            if is_known(id):
+                del self._pending[id]
+                continue
+            ids.append(id)
+            if top and len(ids) == top :
+                break
+        return ids
 
 def get_pull_targets(scheduler_name, uuids):
     database = MscDatabase()
@@ -446,7 +950,18 @@ def verify_target(coh_id, hostname, mac):
 
 
 
-def process_non_valid(scheduler_name, non_fatal_steps, ids_to_exclude = []):
+def process_non_valid(scheduler_name, non_fatal_steps, ids_to_exclude = [],
+                      shards=1, shard=0):
+    """
+    Switches the commands_on_host of expired commands to failed
+    or over_timed state.
+
+    With several scheduler workers, only the commands_on_host
+    owned by the worker are switched (see get_shard).
+
+    @return: ids of switched commands_on_host
+    @rtype: list
+    """
     database = MscDatabase()
     session = create_session()
 
@@ -463,6 +978,9 @@ def process_non_valid(scheduler_name, non_fatal_steps, ids_to_exclude = []):
     #commands_query = commands_query.limit(top)
     if len(ids_to_exclude) > 0 :
         commands_query = commands_query.filter(not_(database.commands_on_host.c.id.in_(ids_to_exclude)))
+    if shards > 1 :
+        commands_query = commands_query.filter(
+                database.commands_on_host.c.id % shards == shard)
     fls = []
     otd = []
 
@@ -482,6 +1000,8 @@ def process_non_valid(scheduler_name, non_fatal_steps, ids_to_exclude = []):
     if len(fls) > 0 :
         logging.getLogger().info("Switching %d circuits to failed" % len(fls))
         CoHManager.setCoHsStateFailed(fls)
+    StateSnapshot().invalidate(otd + fls)
+    return otd + fls
 
 
 def get_cohs_with_failed_phase(id, phase_name):
@@ -519,11 +1039,88 @@ def is_command_finished(scheduler_name, id):
     else :
         return True
 
-def switch_commands_to_stop(cohs):
-    CoHManager.setCoHsStateStopped(cohs)
+def get_restorable_cohs(scheduler_name, ids):
+    """
+    Filters the commands_on_host which are still to process.
+
+    @param scheduler_name: name of scheduler
+    @type scheduler_name: str
+
+    @param ids: commands_on_host ids
+    @type ids: list
+
+    @return: ids of commands_on_host not finished and not expired
+    @rtype: list
+    """
+    if len(ids) == 0 :
+        return []
+
+    database = MscDatabase()
+    session = create_session()
+
+    now = time.strftime("%Y-%m-%d %H:%M:%S")
+    soon = time.strftime("0000-00-00 00:00:00")
+
+    query = session.query(database.commands_on_host.c.id).\
+            select_from(database.commands_on_host.join(database.commands)
+        ).filter(database.commands_on_host.c.id.in_(ids)
+        ).filter(not_(database.commands_on_host.c.current_state.in_(("failed", "over_timed", "done", "stopped")))
+        ).filter(or_(database.commands.c.end_date == soon,
+                     database.commands.c.end_date > now)
+        ).filter(or_(database.commands_on_host.c.scheduler == '',
+                     database.commands_on_host.c.scheduler == scheduler_name,
+                     database.commands_on_host.c.scheduler == None))
+    restorable = [q[0] for q in query.all()]
+    session.close()
+
+    return restorable
+
+
+def get_stopped_cohs(scheduler_name, ids):
+    """
+    Filters the commands_on_host which are still stopped.
+
+    @param scheduler_name: name of scheduler
+    @type scheduler_name: str
+
+    @param ids: commands_on_host ids
+    @type ids: list
+
+    @return: ids of stopped commands_on_host of existing commands
+    @rtype: list
+    """
+    if len(ids) == 0 :
+        return []
+
+    database = MscDatabase()
+    session = create_session()
+
+    query = session.query(database.commands_on_host.c.id).\
+            select_from(database.commands_on_host.join(database.commands)
+        ).filter(database.commands_on_host.c.id.in_(ids)
+        ).filter(database.commands_on_host.c.current_state == "stopped"
+        ).filter(or_(database.commands_on_host.c.scheduler == '',
+                     database.commands_on_host.c.scheduler == scheduler_name,
+                     database.commands_on_host.c.scheduler == None))
+    stopped = [q[0] for q in query.all()]
+    session.close()
+
+    return stopped
+
+
+def switch_commands_to_stop(cohs, progress=None):
+    groups = CoHManager.setCoHsStateStopped(cohs, progress)
+    StateSnapshot().invalidate(cohs)
+    return groups
+
+def switch_commands_to_start(cohs, progress=None):
+    started = CoHManager.setCoHsStateScheduled(cohs, progress)
+    StateSnapshot().invalidate(cohs)
+    return started
 
-def switch_commands_to_start(cohs):
-    CoHManager.setCoHsStateScheduled(cohs)
+def reschedule_commands_now(cohs):
+    CoHManager.setCoHsNextLaunchDate(cohs, 0)
+    StateSnapshot().invalidate(cohs)
 
 def get_commands_stats(scheduler_name, cmd_id=None):
     database = MscDatabase()
@@ -561,6 +1158,7 @@ def update_commands_stats(cmd_id, stats):
     session.add(cmd)
     session.flush()
     session.close()
+    StateSnapshot().invalidate_commands([cmd_id])
 
 def get_history_stdout(coh_id, phase):
 
@@ -72,6 +72,7 @@ class LoopingStarter(object):
         def cb(reason):
 	    """ Thread start callback """
             self.dispatcher._circuits.append(circuit)
+            self.dispatcher.tick_stats.started()
 
         return d
 
@@ -19,9 +19,22 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
 # MA 02110-1301, USA.
 
+import os
+import json
+import time
 import logging
+from threading import Lock
 
 from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+
+try:
+    from sqlalchemy import event
+except ImportError:
+    # SqlAlchemy < 0.7, queries are not counted
+    event = None
+
+from pulse2.database.msc import MscDatabase
 
 from pulse2.scheduler.queries import get_commands_stats, update_commands_stats
 from pulse2.scheduler.queries import process_non_valid
@@ -49,8 +62,16 @@ class StatisticsProcessing :
     previous = []
     
 
-    def __init__(self, config):
+    def __init__(self, config, start_feed=None):
+        """
+        @param config: scheduler's configuration container
+        @type config: SchedulerConfig
+
+        @param start_feed: feed of commands_on_host to start
+        @type start_feed: StartFeed
+        """
         self.config = config
+        self.start_feed = start_feed
         self.logger = logging.getLogger()
 
     def update(self, cmd_id=None):
@@ -105,8 +126,13 @@ class StatisticsProcessing :
         @type cmd_id: int
         """
         try:
-            process_non_valid(self.config.name,
-                              self.config.non_fatal_steps)
+            non_valid = process_non_valid(self.config.name,
+                                          self.config.non_fatal_steps,
+                                          shards=self.config.shards,
+                                          shard=self.config.shard)
+            # failed or over_timed, not to start anymore
+            if self.start_feed is not None :
+                self.start_feed.discard(non_valid)
  
             all_stats = self._get_stats(cmd_id)
             stats = all_stats[cmd_id]
@@ -137,3 +163,228 @@ class StatisticsProcessing :
         self.wdogs[cmd_id] = call_id
  
 
+
+
+class TickStatistics :
+    """
+    Collects the timings and counters of scheduler's mainloop awakes.
+
+    Each awake (tick) records its duration, the number of DB queries
+    issued meanwhile (all threads included), the rate of started circuits
+    and the slot utilisation per launcher. Stages of the start workflow
+    are timed by wrapping them (see timed), a stage returning a deferred
+    is measured until its firing.
+
+    The collected values are available through get_stats() and can be
+    periodically dumped into a file (JSON).
+    """
+    # number of completed ticks
+    ticks = 0
+    # {name: [last, total, max, count]}
+    timings = {}
+    # values of the last completed tick
+    last_tick = {}
+    # {launcher: {"total": n, "used": n, "utilisation": f}}
+    slots_usage = {}
+
+    def __init__(self, config):
+        self.config = config
+        self.logger = logging.getLogger()
+
+        self._lock = Lock()
+        self._queries = 0
+        self._started = 0
+
+        self._tick_start = None
+        self._tick_queries = 0
+        self._tick_started = 0
+        self._previous_start = None
+
+        self._last_dump = time.time()
+
+        self._install_query_counter()
+
+    def _install_query_counter(self):
+        """ Counts all the executed statements on the msc database engine """
+        if event is None :
+            self.logger.debug("Tick statistics: queries not counted (SqlAlchemy < 0.7)")
+            return
+        try:
+            engine = MscDatabase().db
+            event.listen(engine, "before_cursor_execute", self._count_query)
+        except Exception, e:
+            self.logger.warn("Tick statistics: queries counting disabled: %s" % str(e))
+
+    def _count_query(self, *args, **kwargs):
+        """ Engine listener, called from any thread """
+        with self._lock :
+            self._queries += 1
+
+    def started(self, count=1):
+        """
+        Counts the started circuits.
+
+        @param count: number of started circuits
+        @type count: int
+        """
+        with self._lock :
+            self._started += count
+
+    def record(self, name, duration):
+        """
+        Records the duration of a stage.
+
+        @param name: name of stage
+        @type name: str
+
+        @param duration: elapsed time in seconds
+        @type duration: float
+        """
+        if name in self.timings :
+            timing = self.timings[name]
+            timing[0] = duration
+            timing[1] += duration
+            timing[2] = max(timing[2], duration)
+            timing[3] += 1
+        else :
+            self.timings[name] = [duration, duration, duration, 1]
+
+    def timed(self, name, method):
+        """
+        Wraps a method to record its duration.
+
+        @param name: name of stage
+        @type name: str
+
+        @param method: method to measure
+        @type method: callable
+
+        @return: wrapped method
+        @rtype: callable
+        """
+        def wrapped(*args, **kwargs):
+            start = time.time()
+            result = method(*args, **kwargs)
+            if isinstance(result, Deferred):
+                @result.addBoth
+                def _record(res):
+                    self.record(name, time.time() - start)
+                    return res
+            else :
+                self.record(name, time.time() - start)
+            return result
+        return wrapped
+
+    def tick_begin(self):
+        """ Marks the begin of mainloop awake """
+        self._tick_start = time.time()
+        with self._lock :
+            self._tick_queries = self._queries
+            self._tick_started = self._started
+            self._started = 0
+
+    def tick_end(self, slots, used_slots, running, waiting):
+        """
+        Closes the mainloop awake and summarizes its values.
+
+        @param slots: total of slots per launcher
+        @type slots: dict
+
+        @param used_slots: active circuits per launcher
+        @type used_slots: dict
+
+        @param running: number of active circuits
+        @type running: int
+
+        @param waiting: number of waiting circuits
+        @type waiting: int
+        """
+        if self._tick_start is None :
+            return
+        now = time.time()
+        duration = now - self._tick_start
+        self.record("tick", duration)
+
+        with self._lock :
+            queries = self._queries - self._tick_queries
+
+        # started circuits since the previous awake
+        if self._previous_start is not None :
+            period = self._tick_start - self._previous_start
+        else :
+            period = 0
+        if period > 0 :
+            started_per_sec = self._tick_started / period
+        else :
+            started_per_sec = 0.0
+        self._previous_start = self._tick_start
+        self._tick_start = None
+
+        usage = {}
+        for launcher, total in slots.items():
+            used = used_slots.get(launcher, 0)
+            if total > 0 :
+                utilisation = float(used) / total
+            else :
+                utilisation = 0.0
+            usage[launcher] = {"total": total,
+                               "used": used,
+                               "utilisation": utilisation,
+                               }
+        self.slots_usage = usage
+
+        self.ticks += 1
+        self.last_tick = {"time": now,
+                          "duration": duration,
+                          "started": self._tick_started,
+                          "started_per_sec": started_per_sec,
+                          "running": running,
+                          "waiting": waiting,
+                          }
+        if event is not None :
+            self.last_tick["queries"] = queries
+
+        self.logger.debug("Tick statistics: %s" % str(self.last_tick))
+
+        if self.config.tick_stats_dump :
+            if now - self._last_dump >= self.config.tick_stats_dump_period :
+                self._last_dump = now
+                self.dump(self.config.tick_stats_dump)
+
+    def get_stats(self):
+        """
+        Summary of collected statistics.
+
+        @return: last tick values, stages timings and slots usage
+        @rtype: dict
+        """
+        timings = {}
+        for name, (last, total, maximum, count) in self.timings.items():
+            timings[name] = {"last": last,
+                             "avg": total / count,
+                             "max": maximum,
+                             "count": count,
+                             }
+        return {"ticks": self.ticks,
+                "last_tick": self.last_tick,
+                "timings": timings,
+                "slots": self.slots_usage,
+                }
+
+    def dump(self, path):
+        """
+        Writes the collected statistics into a file.
+
+        @param path: path of dump file
+        @type path: str
+        """
+        tmp_path = "%s.tmp" % path
+        try:
+            f = open(tmp_path, "w")
+            try:
+                json.dump(self.get_stats(), f, indent=2)
+            finally:
+                f.close()
+            os.rename(tmp_path, path)
+        except (IOError, OSError), e:
+            self.logger.warn("Tick statistics: dump to %s failed: %s" % (path, str(e)))
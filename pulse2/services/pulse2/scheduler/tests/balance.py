@@ -25,6 +25,7 @@ Test module for the scheduler balance module - part of advanced scheduling
 import unittest
 import random
 import datetime
+import time
 
 from pulse2.scheduler import balance
 
@@ -129,6 +130,182 @@ class class02BalanceTest(unittest.TestCase):
 
         self.assertEqual(is_correct, True)
 
+
+def select_balanced_loop (groups, running, waiting, slots):
+    """
+    Previous one-by-one equalizing (rebuilds the stats on each step),
+    kept as reference of allocateByWeights.
+    """
+    waiting = dict(waiting)
+    to_add = dict((group, 0) for group in groups)
+
+    zero_blacklist = []
+    while True :
+        masked = [(group, running[group] + to_add[group])
+                   for group in groups if group not in zero_blacklist]
+        # group having minimum circuits
+        min_key = min(masked, key=lambda (g, v): v)[0]
+        if waiting[min_key] > 0 :
+            to_add[min_key] += 1
+            waiting[min_key] -= 1
+        else :
+            zero_blacklist.append(min_key)
+
+        if sum(to_add.values()) == slots :
+            break
+    return to_add
+
+
+class class03AllocationTest(unittest.TestCase):
+    """Test of fair-share allocation of free slots between networks"""
+
+    NBR_GROUPS = 200
+    NBR_CIRCUITS = 10000
+
+    def setUp(self):
+        self.groups = ["10.0.%d.0" % i for i in range(self.NBR_GROUPS)]
+        self.running = dict((g, random.choice(range(20))) for g in self.groups)
+        self.waiting = dict((g, 0) for g in self.groups)
+        for i in range(self.NBR_CIRCUITS):
+            self.waiting[random.choice(self.groups)] += 1
+        self.slots = self.NBR_CIRCUITS / 2
+
+    def test01_same_result(self):
+        """heap allocation equalizes like the previous loop"""
+        expected = select_balanced_loop(self.groups[:20],
+                                        self.running,
+                                        self.waiting,
+                                        500)
+        result = balance.allocateByWeights(self.groups[:20],
+                                           self.running,
+                                           self.waiting,
+                                           500)
+        self.assertEqual(result, expected)
+
+    def test02_weights(self):
+        """a double weighted network gets twice more slots"""
+        result = balance.allocateByWeights(["a", "b"],
+                                           {"a": 0, "b": 0},
+                                           {"a": 100, "b": 100},
+                                           9,
+                                           {"a": 2})
+        self.assertEqual(result, {"a": 6, "b": 3})
+
+    def test03_not_enough_waiting(self):
+        """a network without waiting circuits gets nothing"""
+        result = balance.allocateByWeights(["a", "b", "c"],
+                                           {"a": 0, "b": 5, "c": 10},
+                                           {"a": 2, "b": 0, "c": 10},
+                                           10)
+        self.assertEqual(result, {"a": 2, "b": 0, "c": 8})
+
+    def test04_benchmark(self):
+        """heap allocation faster than the previous loop"""
+        start = time.time()
+        expected = select_balanced_loop(self.groups,
+                                        self.running,
+                                        self.waiting,
+                                        self.slots)
+        loop_time = time.time() - start
+
+        start = time.time()
+        result = balance.allocateByWeights(self.groups,
+                                           self.running,
+                                           self.waiting,
+                                           self.slots)
+        heap_time = time.time() - start
+
+        print "\n%d circuits, %d networks: loop %.3fs, heap %.3fs" % \
+                (self.NBR_CIRCUITS, self.NBR_GROUPS, loop_time, heap_time)
+        self.assertEqual(result, expected)
+        self.assertTrue(heap_time < loop_time)
+
+
+
+def random_list_by_balance_loop (balances, limit):
+    """
+    Previous drawing (sorts and draws one by one on each attempt),
+    kept as reference of randomListByBalance.
+    """
+    if len(balances) <= limit :
+        return balances.keys()
+    while True :
+        sorted_keys = sorted(balances, key=balances.get, reverse=True)
+        drw_coh = random.choice(sorted_keys)
+        treshold_idx = sorted_keys.index(drw_coh)
+        sorted_keys = sorted_keys[-treshold_idx:]
+
+        count = 0
+        selected = []
+        while True :
+            if count >= limit :
+                break
+            if count >= len(sorted_keys) :
+                break
+            drw_coh = random.choice(sorted_keys)
+            if drw_coh not in selected :
+                selected.append(drw_coh)
+                count += 1
+        if len(selected) / limit > 0.8 :
+            return selected
+
+
+class class04SamplingTest(unittest.TestCase):
+    """Test of weighted sampling of CoHs to re-schedule"""
+
+    NBR_CANDIDATES = 100000
+    LIMIT = 1000
+
+    def setUp(self):
+        start = datetime.datetime.now()
+        self.balances = {}
+        for id in range(self.NBR_CANDIDATES) :
+            end = start + datetime.timedelta(hours=random.choice(range(1, 100)))
+            attempts_failed = random.choice(range(100))
+            self.balances[id] = balance.getBalanceByAttempts(start, end, attempts_failed)
+
+    def test01_distinct(self):
+        """drawn ids are distinct and limited"""
+        selected = balance.randomListByBalance(self.balances, self.LIMIT)
+        self.assertEqual(len(selected), self.LIMIT)
+        self.assertEqual(len(set(selected)), self.LIMIT)
+
+    def test02_weighted(self):
+        """ids having the bigger balance are drawn more often"""
+        sampler = balance.WeightedSampler({"heavy": 9.0, "light": 1.0, "null": 0})
+        drawn = [sampler.draw() for i in range(10000)]
+        self.assertTrue(drawn.count("heavy") > 5 * drawn.count("light"))
+        self.assertEqual(drawn.count("null"), 0)
+
+        firsts = [sampler.sample(1)[0] for i in range(1000)]
+        self.assertTrue(firsts.count("heavy") > 5 * firsts.count("light"))
+        self.assertEqual(sampler.sample(3)[2], "null")
+
+    def test03_memoised(self):
+        """memoised balance equals to the computed one"""
+        start = datetime.datetime.now()
+        end = start + datetime.timedelta(hours=10)
+        first = balance.getBalanceByAttempts(start, end, 3)
+        second = balance.getBalanceByAttempts(start, end, 3)
+        self.assertAlmostEqual(first, second, 5)
+
+    def test04_benchmark(self):
+        """one pass sampling faster than the previous drawing"""
+        RUNS = 5
+        start = time.time()
+        for i in range(RUNS) :
+            random_list_by_balance_loop(self.balances, self.LIMIT)
+        loop_time = (time.time() - start) / RUNS
+
+        start = time.time()
+        for i in range(RUNS) :
+            balance.randomListByBalance(self.balances, self.LIMIT)
+        sample_time = (time.time() - start) / RUNS
+
+        print "\n%d candidates, %d drawn: loop %.3fs, sampling %.3fs" % \
+                (self.NBR_CANDIDATES, self.LIMIT, loop_time, sample_time)
+        self.assertTrue(sample_time < loop_time)
+
  
 if __name__ == "__main__" :
     unittest.main()
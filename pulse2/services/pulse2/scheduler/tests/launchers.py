@@ -0,0 +1,116 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Pulse 2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+"""Test module for the launchers capacity table and the WOL batches."""
+
+import time
+
+from twisted.trial import unittest
+from twisted.internet.defer import succeed
+from twisted.internet.task import Clock
+
+from pulse2.scheduler import launchers_driving
+from pulse2.scheduler.launchers_driving import LaunchersCapacity, WOLBatch
+
+
+class Test00_LaunchersCapacity(unittest.TestCase):
+
+    def setUp(self):
+        LaunchersCapacity.table = {}
+        self.capacity = LaunchersCapacity()
+        self.capacity.update("launcher_01", 10, 8)
+        self.capacity.update("launcher_02", 10, 5)
+
+    def test01_fresh(self):
+        """ Table is fresh only when all launchers are known and recent """
+        self.assertTrue(self.capacity.is_fresh(["launcher_01", "launcher_02"]))
+        self.assertFalse(self.capacity.is_fresh(["launcher_01", "launcher_03"]))
+
+        self.capacity.table["launcher_02"][2] = time.time() - 3600
+        self.assertFalse(self.capacity.is_fresh(["launcher_01", "launcher_02"]))
+
+    def test02_best_candidate(self):
+        """ Launcher with the most free slots, counting the reservations """
+        launchers = ["launcher_01", "launcher_02"]
+        self.assertEqual(self.capacity.best_candidate(launchers), "launcher_02")
+
+        for i in range(3):
+            self.capacity.reserve("launcher_02")
+        self.assertEqual(self.capacity.best_candidate(launchers), "launcher_01")
+
+        self.capacity.reserve("launcher_01")
+        self.capacity.reserve("launcher_01")
+        self.capacity.reserve("launcher_02")
+        self.capacity.reserve("launcher_02")
+        self.assertEqual(self.capacity.best_candidate(launchers), None)
+
+        # pushed by launcher
+        self.capacity.update("launcher_01", 10, 0)
+        self.assertEqual(self.capacity.best_candidate(launchers), "launcher_01")
+
+
+class FakeProvider(object):
+    """ Records the calls to launchers """
+
+    def __init__(self, results):
+        self.results = results
+        self.calls = []
+
+    def call_method(self, method, *args):
+        self.calls.append((method, args))
+        return succeed(self.results)
+
+
+class Test01_WOLBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.patch(launchers_driving, "reactor", self.clock)
+        WOLBatch.networks = {}
+        WOLBatch.waiting = []
+        WOLBatch.flush_call = None
+        self.batch = WOLBatch()
+
+    def test01_one_call(self):
+        """ Requests of targets are sent in one call, grouped by network """
+        provider = FakeProvider({"10.0.1.255": True, "": True})
+        results = []
+        self.batch.add(provider, ["00:00:00:00:00:01"], ["10.0.1.255"]).addCallback(results.append)
+        self.batch.add(provider, ["00:00:00:00:00:02", ""], ["10.0.1.255", ""]).addCallback(results.append)
+        self.batch.add(provider, ["00:00:00:00:00:03"], [""]).addCallback(results.append)
+        self.assertEqual(provider.calls, [])
+
+        self.clock.advance(launchers_driving.SchedulerConfig().wol_batch_delay)
+        self.assertEqual(len(provider.calls), 1)
+        method, (networks,) = provider.calls[0]
+        self.assertEqual(method, "wol_batch")
+        self.assertEqual(sorted(networks["10.0.1.255"]), ["00:00:00:00:00:01", "00:00:00:00:00:02"])
+        self.assertEqual(networks[""], ["00:00:00:00:00:03"])
+        self.assertEqual([r[0] for r in results], [True, True, True])
+
+    def test02_failed_network(self):
+        """ Only the targets of a failed network get a failure """
+        provider = FakeProvider({"10.0.1.255": True, "10.0.2.255": False})
+        results = []
+        self.batch.add(provider, ["00:00:00:00:00:01"], ["10.0.1.255"]).addCallback(results.append)
+        self.batch.add(provider, ["00:00:00:00:00:02"], ["10.0.2.255"]).addCallback(results.append)
+        self.clock.advance(launchers_driving.SchedulerConfig().wol_batch_delay)
+        self.assertEqual([r[0] for r in results], [True, False])
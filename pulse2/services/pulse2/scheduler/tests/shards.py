@@ -0,0 +1,131 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Pulse 2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+"""Test module for the routing of calls between scheduler workers."""
+
+import logging
+import xmlrpclib
+
+from twisted.trial import unittest
+
+from pulse2.scheduler.proxy.shards import ShardRouter
+from pulse2.scheduler.proxy.unix import ShardedForwarder
+
+
+class Test00_ShardRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.router = ShardRouter(3)
+
+    def test01_coh_methods(self):
+        """ Calls related to one commands_on_host go to its owner """
+        self.assertEqual(self.router.route("start_command", (7,)), [(1, (7,))])
+        args = ("uuid", "client", 11, (0, "out", "err"))
+        self.assertEqual(self.router.route("completed_push", args), [(2, args)])
+
+    def test02_coh_list_methods(self):
+        """ Lists of commands_on_host are splitted between owners """
+        routed = self.router.route("stop_commands", ([1, 2, 3, 4, 6],))
+        self.assertEqual(routed, [(0, ([3, 6],)),
+                                  (1, ([1, 4],)),
+                                  (2, ([2],)),
+                                  ])
+
+    def test03_other_methods(self):
+        """ Broadcasted and default calls """
+        self.assertEqual(self.router.route("start_all_commands", ()),
+                         [(0, ()), (1, ()), (2, ())])
+        self.assertEqual(self.router.route("get_health", ()),
+                         [(0, ()), (1, ()), (2, ())])
+        self.assertEqual(self.router.route("ping", ()), [(0, ())])
+        self.assertEqual(self.router.route("start_commands", ([],)), [(0, ([],))])
+
+    def test04_merge(self):
+        """ Responses of all the workers are merged """
+        self.assertEqual(self.router.merge("start_commands",
+                                           [(0, True), (1, True)]), True)
+        self.assertEqual(self.router.merge("stop_commands",
+                                           [(0, True), (1, False)]), False)
+        self.assertEqual(self.router.merge("get_bulk_progress",
+                                           [(0, {"start": [1, 2]}),
+                                            (1, {"start": [3, 4],
+                                                 "stop": [1, 1]})]),
+                         {"start": [4, 6], "stop": [1, 1]})
+        self.assertEqual(self.router.merge("get_health",
+                                           [(0, {"fd": 1}), (1, {"fd": 2})]),
+                         {"0": {"fd": 1}, "1": {"fd": 2}})
+        fault = xmlrpclib.Fault(8002, "failed")
+        self.assertEqual(self.router.merge("get_health",
+                                           [(0, {"fd": 1}), (1, fault)]),
+                         fault)
+
+
+class FakeForwarder(object):
+    """ Responds immediately with a fixed response """
+
+    def __init__(self, sharded, response):
+        self.sharded = sharded
+        self.response = response
+        self.calls = []
+
+    @property
+    def protocol(self):
+        if self.response is None :
+            raise ValueError
+        return self
+
+    def call_remote(self, request, func_name, args):
+        self.calls.append((func_name, args))
+        self.sharded._response(self.response, request, func_name, args)
+
+
+class Test01_ShardedForwarder(unittest.TestCase):
+
+    def setUp(self):
+        self.responses = []
+        def handler(result, request, func_name, args):
+            self.responses.append((result, request))
+
+        self.forwarder = ShardedForwarder.__new__(ShardedForwarder)
+        self.forwarder.logger = logging.getLogger()
+        self.forwarder.response_handler = handler
+        self.forwarder.router = ShardRouter(2)
+
+    def test01_merged_response(self):
+        """ The caller gets one response merged from all the workers """
+        self.forwarder.forwarders = [FakeForwarder(self.forwarder, True),
+                                     FakeForwarder(self.forwarder, False)]
+        self.forwarder.call_remote("request", "stop_commands", ([1, 2],))
+        self.assertEqual(self.forwarder.forwarders[0].calls,
+                         [("stop_commands", ([2],))])
+        self.assertEqual(self.forwarder.forwarders[1].calls,
+                         [("stop_commands", ([1],))])
+        self.assertEqual(self.responses, [(False, "request")])
+
+    def test02_not_connected(self):
+        """ A worker not connected fails the call """
+        self.forwarder.forwarders = [FakeForwarder(self.forwarder, {}),
+                                     FakeForwarder(self.forwarder, None)]
+        self.forwarder.call_remote("request", "get_bulk_progress", ())
+        self.assertEqual(len(self.responses), 1)
+        result, request = self.responses[0]
+        self.assertTrue(isinstance(result, xmlrpclib.Fault))
+        self.assertEqual(request, "request")
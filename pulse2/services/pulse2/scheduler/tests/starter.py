@@ -49,9 +49,15 @@ class Test00_LoopingStart(unittest.TestCase):
 
     def setUp(self):
 	self.logger = logging.getLogger()
+        tick_stats = type("TickStatistics",
+                          (object,),
+                          {"started": lambda self, count=1: None}
+                          )
         self.dispatcher = type("MscDispatcher", 
 			      (object,),
-			      {"_circuits": []}
+			      {"_circuits": [],
+                               "tick_stats": tick_stats(),
+                               }
 			       )
 	self.circuits = []
 	for id in xrange(10):
@@ -0,0 +1,134 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Pulse 2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+"""Test module for the mainloop timings and counters."""
+
+import os
+import json
+import logging
+logging.basicConfig()
+
+from tempfile import mkstemp
+
+from twisted.trial import unittest
+from twisted.internet.defer import Deferred
+
+from pulse2.scheduler import stats
+from pulse2.scheduler.stats import TickStatistics, StatisticsProcessing
+from pulse2.scheduler.queries import StartFeed
+
+
+class Config (object):
+    """A minimal scheduler's config"""
+    name = "scheduler_01"
+    non_fatal_steps = []
+    shards = 1
+    shard = 0
+    tick_stats_dump = ''
+    tick_stats_dump_period = 0
+
+
+class Test00_TickStatistics(unittest.TestCase):
+
+    def setUp(self):
+        TickStatistics.ticks = 0
+        TickStatistics.timings = {}
+        TickStatistics.last_tick = {}
+        TickStatistics.slots_usage = {}
+        self.stats = TickStatistics(Config())
+
+    def test01_timed(self):
+        """ Timings of plain and deferred stages """
+        method = self.stats.timed("plain", lambda x: x + 1)
+        self.assertEqual(method(1), 2)
+        self.assertEqual(method(2), 3)
+
+        d = Deferred()
+        self.stats.timed("deferred", lambda : d)()
+        self.assertFalse("deferred" in self.stats.timings)
+        d.callback(None)
+
+        timings = self.stats.get_stats()["timings"]
+        self.assertEqual(timings["plain"]["count"], 2)
+        self.assertEqual(timings["deferred"]["count"], 1)
+
+    def test02_tick(self):
+        """ Started circuits and slots usage of closed awake """
+        self.stats.tick_begin()
+        self.stats.tick_end({}, {}, 0, 0)
+
+        self.stats.started()
+        self.stats.started(4)
+        self.stats.tick_begin()
+        self.stats.tick_end({"launcher_01": 10, "launcher_02": 0},
+                            {"launcher_01": 5},
+                            5,
+                            2)
+        result = self.stats.get_stats()
+        self.assertEqual(result["ticks"], 2)
+        self.assertEqual(result["last_tick"]["started"], 5)
+        self.assertEqual(result["last_tick"]["waiting"], 2)
+        self.assertEqual(result["slots"]["launcher_01"]["utilisation"], 0.5)
+        self.assertEqual(result["slots"]["launcher_02"]["used"], 0)
+
+    def test03_dump(self):
+        """ Periodic dump into the file """
+        fd, path = mkstemp()
+        os.close(fd)
+        self.stats.config.tick_stats_dump = path
+
+        self.stats.tick_begin()
+        self.stats.tick_end({}, {}, 0, 0)
+
+        f = open(path)
+        content = json.load(f)
+        f.close()
+        os.unlink(path)
+        self.assertEqual(content["ticks"], 1)
+
+
+class Test01_StatisticsProcessing(unittest.TestCase):
+
+    def setUp(self):
+        self._process_non_valid = stats.process_non_valid
+        self._get_commands_stats = stats.get_commands_stats
+        self._update_commands_stats = stats.update_commands_stats
+        # commands_on_host 2 and 3 are expired
+        stats.process_non_valid = lambda name, steps, shards, shard: [2, 3]
+        stats.get_commands_stats = lambda name, cmd_id: [(cmd_id, "done", 1)]
+        stats.update_commands_stats = lambda cmd_id, all_stats: None
+
+    def tearDown(self):
+        stats.process_non_valid = self._process_non_valid
+        stats.get_commands_stats = self._get_commands_stats
+        stats.update_commands_stats = self._update_commands_stats
+
+    def test01_non_valid_discarded(self):
+        """ Expired commands_on_host are not started anymore """
+        start_feed = StartFeed("scheduler_01", 300, 10)
+        start_feed._pending = {1: (0, 1), 2: (0, 2), 4: (0, 3)}
+
+        statistics = StatisticsProcessing(Config(), start_feed)
+        statistics.wdogs = {10: None}
+        statistics._update_for(10)
+
+        self.assertEqual(sorted(start_feed._pending.keys()), [1, 4])
+        self.assertEqual(statistics.wdogs, {})
@@ -26,6 +26,32 @@ import random
 import unittest
 
 from pulse2.scheduler.tracking.circuits import Tracker, TimedTracker
+from pulse2.scheduler.tracking.circuits import CircuitsRegistry
+
+ACTIVE, WAITING = 0, 1
+GROUPS = ["192.168.1.0", "192.168.2.0", "10.0.0.0"]
+
+class FakeCircuit(object):
+    """ Simulates the status transitions of Circuit """
+
+    status_listener = None
+
+    def __init__(self, id, status, network_address, target_uuid):
+        self.id = id
+        self._status = status
+        self.network_address = network_address
+        self.target_uuid = target_uuid
+
+    @property
+    def status(self):
+        return self._status
+
+    @status.setter
+    def status(self, value):
+        previous = self._status
+        self._status = value
+        if self.status_listener and previous != value :
+            self.status_listener(self, previous)
 
 class Test01_Tracker(unittest.TestCase):
 
@@ -85,6 +111,70 @@ class Test02_TimedTracker(unittest.TestCase):
 	for id in not_expired:
 	    self.assertNotIn(id, tracker.get_expired())
 
+class Test03_CircuitsRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = CircuitsRegistry()
+        self.circuits = [FakeCircuit(id,
+                                     random.choice([ACTIVE, WAITING]),
+                                     random.choice(GROUPS),
+                                     "UUID%d" % (id % 100))
+                         for id in xrange(1000)]
+        self.registry.extend(self.circuits)
+
+    def _count(self, status, group=None):
+        return len([c for c in self.circuits
+                      if c.status == status
+                      and (group is None or c.network_address == group)])
+
+    def test_01_get(self):
+        circuit = random.choice(self.circuits)
+        self.assertIs(self.registry.get(circuit.id), circuit)
+        self.assertIn(circuit.id, self.registry)
+        self.assertIsNone(self.registry.get(1000))
+
+    def test_02_counts(self):
+        for status in (ACTIVE, WAITING):
+            self.assertEqual(self.registry.count(status), self._count(status))
+            for group in GROUPS :
+                self.assertEqual(self.registry.count(status, group),
+                                 self._count(status, group))
+
+    def test_03_status_transition(self):
+        for circuit in random.sample(self.circuits, 200):
+            circuit.status = WAITING if circuit.status == ACTIVE else ACTIVE
+
+        counts = self.registry.count_by_groups(ACTIVE, GROUPS)
+        for group in GROUPS :
+            self.assertEqual(counts[group], self._count(ACTIVE, group))
+        self.assertEqual(len(self.registry.by_status(WAITING)),
+                         self._count(WAITING))
+
+    def test_04_remove(self):
+        circuit = random.choice(self.circuits)
+        self.registry.remove(circuit)
+        self.circuits.remove(circuit)
+
+        self.assertNotIn(circuit.id, self.registry)
+        self.assertEqual(len(self.registry), 999)
+        self.assertEqual(self.registry.count(circuit.status),
+                         self._count(circuit.status))
+        # released circuit is no more tracked
+        circuit.status = WAITING if circuit.status == ACTIVE else ACTIVE
+        self.assertEqual(self.registry.count(circuit.status),
+                         self._count(circuit.status))
+
+    def test_05_target(self):
+        circuit = FakeCircuit(1000, WAITING, GROUPS[0], "UUID-NEW")
+        self.registry.append(circuit)
+        self.assertFalse(self.registry.has_target("UUID-NEW", ACTIVE))
+
+        circuit.status = ACTIVE
+        self.assertTrue(self.registry.has_target("UUID-NEW", ACTIVE))
+
+        self.registry.remove(circuit)
+        self.assertFalse(self.registry.has_target("UUID-NEW", ACTIVE))
+
 
 if __name__ == "__main__":
     unittest.main()
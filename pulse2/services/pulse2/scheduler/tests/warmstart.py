@@ -0,0 +1,156 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Pulse 2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+""" Unit test of save and restore of circuits container """
+
+import os
+import time
+import unittest
+
+from tempfile import mkstemp
+
+from pulse2.scheduler import warmstart
+from pulse2.scheduler.warmstart import WarmStart
+from pulse2.scheduler.bundles import BundleElement
+
+
+class Config (object):
+    """A minimal scheduler's config"""
+    name = "scheduler_01"
+    warm_restart_file = ''
+    warm_restart_period = 60
+    warm_restart_max_age = 3600
+
+
+class FakeCircuit(object):
+    """ A circuit having the networking info """
+
+    initialized = True
+
+    def __init__(self, id, host, network_address):
+        self.id = id
+        self.host = host
+        self.network_address = network_address
+
+
+class FakeTracker(object):
+    """ Tracker having its own container """
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def add(self, ids):
+        self.ids.extend(ids)
+
+
+class FakeBundles(object):
+    """ Bundle references having its own container """
+
+    def __init__(self, content):
+        self.content = content
+
+    def get(self, coh_id):
+        return [b for b in self.content if b.coh_id == coh_id]
+
+
+class FakeContainer(object):
+    """ Circuits container """
+
+    def __init__(self, circuits, bundles, stopped, started):
+        self._circuits = circuits
+        self.bundles = FakeBundles(bundles)
+        self.stopped_track = FakeTracker(stopped)
+        self.started_track = FakeTracker(started)
+
+
+class Test01_WarmStart(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = mkstemp()
+        os.close(fd)
+        self.config = Config()
+        self.config.warm_restart_file = self.path
+
+        # only even ids are still to process
+        self._get_restorable_cohs = warmstart.get_restorable_cohs
+        warmstart.get_restorable_cohs = lambda name, ids: [id for id in ids if id % 2 == 0]
+        # and only the multiples of 5 are still stopped
+        self._get_stopped_cohs = warmstart.get_stopped_cohs
+        warmstart.get_stopped_cohs = lambda name, ids: [id for id in ids if id % 5 == 0]
+
+        circuits = [FakeCircuit(id, "10.0.0.%d" % id, "10.0.0.0") for id in range(1, 7)]
+        finished = BundleElement(1, 10, 1, 1, "UUID1")
+        finished.finished = True
+        bundles = [finished, BundleElement(1, 11, 2, 2, "UUID1")]
+        started = {2: time.time() - 100, 3: time.time()}
+
+        self.container = FakeContainer(circuits, bundles, [4, 5], started)
+
+    def tearDown(self):
+        warmstart.get_restorable_cohs = self._get_restorable_cohs
+        warmstart.get_stopped_cohs = self._get_stopped_cohs
+        os.unlink(self.path)
+
+    def test01_restore(self):
+        """ Only valid circuits are restored """
+        WarmStart(self.config).save(self.container)
+
+        container = FakeContainer([], [], [], {})
+        warm_start = WarmStart(self.config)
+        self.assertEqual(warm_start.restore(container), 3)
+
+        self.assertEqual(warm_start.restored(4), ("10.0.0.4", "10.0.0.0"))
+        self.assertEqual(warm_start.restored(4), None)
+        self.assertEqual(warm_start.restored(5), None)
+
+        self.assertEqual(container.stopped_track.ids, [5])
+        self.assertEqual(container.started_track.ids.keys(), [2])
+        # finished bundle element kept to release the next one
+        self.assertEqual(sorted([b.coh_id for b in container.bundles.content]), [1, 2])
+
+    def test02_too_old(self):
+        """ Saved state older than max_age is ignored """
+        WarmStart(self.config).save(self.container)
+
+        self.config.warm_restart_max_age = -1
+        container = FakeContainer([], [], [], {})
+        self.assertEqual(WarmStart(self.config).restore(container), 0)
+
+    def test03_disabled(self):
+        """ Nothing is saved without file """
+        os.unlink(self.path)
+        self.config.warm_restart_file = ''
+        WarmStart(self.config).save(self.container)
+        self.assertFalse(os.path.exists(self.path))
+        open(self.path, "w").close()
+
+    def test04_stopped(self):
+        """ Stopped circuits are tracked again after restart """
+        self.container.stopped_track.ids = [10, 15, 16]
+        WarmStart(self.config).save(self.container)
+
+        container = FakeContainer([], [], [], {})
+        WarmStart(self.config).restore(container)
+        self.assertEqual(container.stopped_track.ids, [10, 15])
+
+
+if __name__ == "__main__":
+    unittest.main()
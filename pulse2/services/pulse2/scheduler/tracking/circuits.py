@@ -22,6 +22,7 @@
 """ Common id trackers related to circuits controled by MscDispatcher """
 
 import time
+from collections import OrderedDict
 
 class _Tracker(object):
     """ Abstract frame for trackers """
@@ -130,4 +131,198 @@ class StartedTracker(TimedTracker):
  
 
 
+class CircuitsRegistry(object):
+    """
+    Indexed container of circuits controled by MscDispatcher.
+
+    Circuits are keyed by their commands_on_host id. Secondary indexes
+    (by status, by status and network group, by target) are maintained
+    on each insert, removal and status transition of a registered circuit,
+    so the lookups and per-group counts used on each awake don't need
+    to scan the whole container.
+
+    This container keeps the list-like interface (append, extend, remove,
+    iteration) of the plain list used before.
+    """
+
+    def __init__(self):
+        # id -> circuit, in insertion order
+        self._circuits = OrderedDict()
+        # status -> OrderedDict(id -> circuit)
+        self._by_status = {}
+        # (status, group) -> OrderedDict(id -> circuit)
+        self._by_group = {}
+        # target uuid -> {status: set of ids}
+        self._by_target = {}
+        # id -> (status, group, target) as indexed
+        self._keys = {}
 
+    def __len__(self):
+        return len(self._circuits)
+
+    def __iter__(self):
+        # a copy to allow the removing while iterating
+        return iter(self._circuits.values())
+
+    def __contains__(self, id):
+        return id in self._circuits
+
+    def get(self, id):
+        """
+        Gets a registered circuit.
+
+        @param id: commands_on_host id
+        @type id: int
+
+        @return: circuit or None if not registered
+        @rtype: Circuit
+        """
+        return self._circuits.get(id)
+
+    def append(self, circuit):
+        """
+        Registers a circuit (replaces the circuit having the same id).
+
+        @param circuit: circuit to register
+        @type circuit: Circuit
+        """
+        if circuit.id in self._circuits :
+            self.remove(self._circuits[circuit.id])
+
+        self._circuits[circuit.id] = circuit
+        self._index(circuit)
+        circuit.status_listener = self._status_changed
+
+    def extend(self, circuits):
+        """
+        Registers a list of circuits.
+
+        @param circuits: circuits to register
+        @type circuits: list
+        """
+        for circuit in circuits :
+            self.append(circuit)
+
+    def remove(self, circuit):
+        """
+        Unregisters a circuit.
+
+        @param circuit: circuit to remove
+        @type circuit: Circuit
+        """
+        if self._circuits.get(circuit.id) is not circuit :
+            return
+        self._unindex(circuit.id)
+        del self._circuits[circuit.id]
+        circuit.status_listener = None
+
+    def by_status(self, status):
+        """
+        @param status: status of circuits
+        @type status: int
+
+        @return: all circuits having the status
+        @rtype: list
+        """
+        return self._by_status.get(status, {}).values()
+
+    def by_group(self, status, group):
+        """
+        @param status: status of circuits
+        @type status: int
+
+        @param group: network address
+        @type group: str
+
+        @return: all circuits having the status and assigned to the network
+        @rtype: list
+        """
+        return self._by_group.get((status, group), {}).values()
+
+    def count(self, status, group=None):
+        """
+        Number of circuits having the status (and assigned to the network).
+
+        @param status: status of circuits
+        @type status: int
+
+        @param group: network address
+        @type group: str
+
+        @rtype: int
+        """
+        if group is None :
+            return len(self._by_status.get(status, {}))
+        return len(self._by_group.get((status, group), {}))
+
+    def count_by_groups(self, status, groups):
+        """
+        Counts the circuits having the status by network.
+
+        @param status: status of circuits
+        @type status: int
+
+        @param groups: network addresses
+        @type groups: list
+
+        @return: grouped counts of circuits by network
+        @rtype: dict
+        """
+        return dict((group, self.count(status, group)) for group in groups)
+
+    def has_target(self, uuid, status):
+        """
+        Checks if a circuit having the status is destinated to the target.
+
+        @param uuid: target uuid
+        @type uuid: str
+
+        @param status: status of circuits
+        @type status: int
+
+        @rtype: bool
+        """
+        return len(self._by_target.get(uuid, {}).get(status, ())) > 0
+
+    def _index(self, circuit):
+        """ Inserts a circuit into all the secondary indexes """
+        keys = (circuit.status,
+                circuit.network_address,
+                getattr(circuit, "target_uuid", None))
+        status, group, target = keys
+
+        self._by_status.setdefault(status, OrderedDict())[circuit.id] = circuit
+        self._by_group.setdefault((status, group), OrderedDict())[circuit.id] = circuit
+        self._by_target.setdefault(target, {}).setdefault(status, set()).add(circuit.id)
+
+        self._keys[circuit.id] = keys
+
+    def _unindex(self, id):
+        """ Removes a circuit from all the secondary indexes """
+        status, group, target = self._keys.pop(id)
+
+        del self._by_status[status][id]
+        del self._by_group[(status, group)][id]
+        if len(self._by_group[(status, group)]) == 0 :
+            del self._by_group[(status, group)]
+
+        self._by_target[target][status].discard(id)
+        if len(self._by_target[target][status]) == 0 :
+            del self._by_target[target][status]
+            if len(self._by_target[target]) == 0 :
+                del self._by_target[target]
+
+    def _status_changed(self, circuit, previous):
+        """
+        Status transition listener of registered circuits.
+
+        @param circuit: circuit which status changed
+        @type circuit: Circuit
+
+        @param previous: previous status
+        @type previous: int
+        """
+        if self._circuits.get(circuit.id) is not circuit :
+            return
+        self._unindex(circuit.id)
+        self._index(circuit)
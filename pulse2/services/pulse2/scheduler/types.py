@@ -50,16 +50,18 @@ from twisted.internet.defer import Deferred, maybeDeferred, DeferredLock
 from pulse2.consts import PULSE2_SUCCESS_ERROR
 from pulse2.utils import SingletonN, extractExceptionMessage
 from pulse2.network import NetUtils
-from pulse2.scheduler.queries import CoHQuery, any_failed
+from pulse2.scheduler.queries import CoHQuery, StartFeed, any_failed
 from pulse2.scheduler.utils import chooseClientInfo
 from pulse2.scheduler.launchers_driving import RemoteCallProxy
 from pulse2.scheduler.checks import getAnnounceCheck
-from pulse2.scheduler.utils import getClientCheck, getServerCheck
-from pulse2.scheduler.stats import StatisticsProcessing
+from pulse2.scheduler.utils import getClientCheck, getServerCheck, get_shard
+from pulse2.scheduler.stats import StatisticsProcessing, TickStatistics
 from pulse2.scheduler.bundles import BundleReferences
 from pulse2.scheduler.timeaxis import LaunchTimeResolver
 from pulse2.scheduler.tracking.circuits import StoppedTracker, StartedTracker
+from pulse2.scheduler.tracking.circuits import CircuitsRegistry
 from pulse2.scheduler.starter import LoopingStarter
+from pulse2.scheduler.warmstart import WarmStart
 
 
 from pulse2.database.msc.orm.commands_history import CommandsHistory
@@ -494,7 +496,9 @@ class CircuitBase(object):
 
 
 
-    status = CC_STATUS.ACTIVE
+    _status = CC_STATUS.ACTIVE
+    # A callable notified on each status transition (see CircuitsRegistry)
+    status_listener = None
 
     # methods called by scheduler-proxy
     _proxy_methods = {}
@@ -551,6 +555,23 @@ class CircuitBase(object):
     def is_running(self):
         return isinstance(self.running_phase, Phase)
 
+    @property
+    def status(self):
+        """ Status of circuit (see CC_STATUS) """
+        return self._status
+
+    @status.setter
+    def status(self, value):
+        previous = self._status
+        self._status = value
+        if self.status_listener and previous != value :
+            self.status_listener(self, previous)
+
+    @property
+    def target_uuid(self):
+        """ UUID of target machine """
+        return self.cohq.target.target_uuid
+
     def setup(self, recurrent=False):
         """
         Post-init - detecting the networking info of target.
@@ -564,9 +585,13 @@ class CircuitBase(object):
             d = maybeDeferred(self._flow_create)
 
             if not recurrent :
-                d.addCallback(self._chooseClientNetwork)
-                d.addCallback(self._host_detect)
-                d.addCallback(self._network_detect)
+                restored = self.dispatcher.warm_start.restored(self.id)
+                if restored :
+                    d.addCallback(self._networking_restore, restored)
+                else :
+                    d.addCallback(self._chooseClientNetwork)
+                    d.addCallback(self._host_detect)
+                    d.addCallback(self._network_detect)
 
             d.addCallback(self._init_end)
             d.addErrback(self._init_failed)
@@ -770,6 +795,24 @@ class CircuitBase(object):
 
         return True
 
+    def _networking_restore(self, reason, (host, network_address)):
+        """
+        Reuses the networking info saved on previous run (see WarmStart).
+
+        @param reason: void parameter, used as twisted callback reason
+        @type reason: twisted callback reason
+
+        @param host: IP address
+        @type host: str
+
+        @param network_address: network address
+        @type network_address: str
+        """
+        self.logger.debug("Circuit #%s: networking info restored" % (self.id))
+        self.host = host
+        self.network_address = network_address
+        return True
+
     def _init_end(self, reason):
         """
         The final callback of initialization of circuit.
@@ -1000,7 +1043,7 @@ class MscContainer (object):
     slots = {}
 
     # All the workflow circuits are stocked here
-    _circuits = []
+    _circuits = CircuitsRegistry()
 
     # A lookup to refer all phases to use
     installed_phases = []
@@ -1018,6 +1061,10 @@ class MscContainer (object):
 
     # a provider to collect the commands statistics
     statistics = None
+    # a collector of mainloop timings
+    tick_stats = None
+    # saved state of container for the next start
+    warm_start = None
 
     kill_all = False
 
@@ -1048,11 +1095,11 @@ class MscContainer (object):
     @property
     def circuits(self):
         """Shortcut to all active circuits"""
-        return [c for c in self._circuits if c.status == CC_STATUS.ACTIVE]
+        return self._circuits.by_status(CC_STATUS.ACTIVE)
     @property
     def waiting_circuits(self):
         """Shortcut to all waiting circuits"""
-        return [c for c in self._circuits if c.status == CC_STATUS.WAITING]
+        return self._circuits.by_status(CC_STATUS.WAITING)
 
     def remove_circuit(self, circuit):
         """
@@ -1070,6 +1117,7 @@ class MscContainer (object):
         self.logger.info("Stopping the dispatcher...")
         self.loop_starter.cancel()
         self.kill_all = True
+        self.warm_start.save(self)
 
     @property
     def max_slots(self):
@@ -1079,7 +1127,7 @@ class MscContainer (object):
     @property
     def free_slots(self):
         """ Free slots to use """
-        return self.max_slots - len(self.get_running_circuits())
+        return self.max_slots - self._circuits.count(CC_STATUS.ACTIVE)
 
     def has_unstarted_circuits(self):
 	"""Checks the unstarted circuits to avoid a next heavy query execution"""
@@ -1095,7 +1143,8 @@ class MscContainer (object):
         @return: True if command_on_host in container
         @rtype: bool
         """
-        return id in [wf.id for wf in self.waiting_circuits]
+        circuit = self._circuits.get(id)
+        return circuit is not None and circuit.status == CC_STATUS.WAITING
 
     def __contains__(self, id):
         """
@@ -1108,15 +1157,25 @@ class MscContainer (object):
         @return: True if command_on_host in container
         @rtype: bool
         """
-        return id in [wf.id for wf in self.circuits]
+        circuit = self._circuits.get(id)
+        return circuit is not None and circuit.status == CC_STATUS.ACTIVE
 
     def initialize(self, config):
         """ Initial setup """
         self.logger = logging.getLogger()
         self.config = config
 
+        # incremental feed of commands_on_host to start
+        self.start_feed = StartFeed(config.name,
+                                    config.start_feed_rescan_period,
+                                    config.awake_time,
+                                    config.shards,
+                                    config.shard)
+
         # provides the global statistics
-        self.statistics = StatisticsProcessing(config)
+        self.statistics = StatisticsProcessing(config, self.start_feed)
+        # timings and counters of mainloop awakes
+        self.tick_stats = TickStatistics(config)
 
         # stopped circuits tracker
         self.stopped_track = StoppedTracker()
@@ -1129,6 +1188,10 @@ class MscContainer (object):
         # bundles tracking container
         self.bundles = BundleReferences(config)
 
+        # networking info and trackers saved on previous run
+        self.warm_start = WarmStart(config)
+        self.warm_start.restore(self)
+
         # dispatching the batchs of start
 	self.loop_starter = LoopingStarter(dispatcher=self,
 			                   emitting_period=config.emitting_period)
@@ -1173,9 +1236,16 @@ class MscContainer (object):
         """
         Sets the detected slots from launchers
 
+        With several scheduler workers, each of them uses its share
+        of slots of each launcher, the first workers getting the remainders.
+
         @param slots: total of slots per launcher
         @type slots: dict
         """
+        shards, shard = self.config.shards, self.config.shard
+        if shards > 1 :
+            slots = dict((launcher, total // shards + int(shard < total % shards))
+                          for (launcher, total) in slots.items())
         self.slots = slots
         return slots
 
@@ -1184,9 +1254,33 @@ class MscContainer (object):
         self.logger.info("Detected slots SUM from all launchers: %d" % self.max_slots)
         return result
 
+    def used_slots(self):
+        """
+        Number of active circuits per assigned launcher.
+
+        @return: active circuits per launcher
+        @rtype: dict
+        """
+        used = {}
+        for circuit in self._circuits.by_status(CC_STATUS.ACTIVE):
+            if circuit.launcher :
+                used[circuit.launcher] = used.get(circuit.launcher, 0) + 1
+        return used
+
+    def owns(self, id):
+        """
+        Checks if the commands_on_host is processed by this scheduler worker.
+
+        @param id: commands_on_host id
+        @type id: int
+
+        @rtype: bool
+        """
+        return get_shard(id, self.config.shards) == self.config.shard
+
     def has_free_slots(self):
         """ Checks if at least one slot is free"""
-        return len(self.get_running_circuits()) < self.max_slots
+        return self._circuits.count(CC_STATUS.ACTIVE) < self.max_slots
 
     def get(self, id):
         """
@@ -1198,12 +1292,10 @@ class MscContainer (object):
         @return: requested circuit
         @rtype: Circuit object
         """
-        matches = [wf for wf in self._circuits if wf.id == id]
-        if len(matches) > 0 :
-            return matches[0]
-        else :
+        circuit = self._circuits.get(id)
+        if circuit is None :
             self.logger.debug("Circuit #%s: not exists" % id)
-            return None
+        return circuit
 
     def _release(self, id, suspend_to_waitings=False):
         """
@@ -1216,16 +1308,18 @@ class MscContainer (object):
         @param id: commands_on_host id
         @type id: int
         """
-        if any([True for c in self._circuits if c.id == id]):
+        circuit = self._circuits.get(id)
+        if circuit :
             self.logger.debug("circuit #%d finished" % id)
-            circuit = self.get(id)
             if suspend_to_waitings :
                 circuit.status = CC_STATUS.WAITING
                 self.logger.info("Circuit #%d: failed and queued" % id)
             else :
                 self.remove_circuit(circuit)
                 self.stopped_track.remove(circuit.id)
-            self.logger.info("Remaining content: %d circuits (+%d waitings)" % ((len(self.circuits)),len(self.waiting_circuits)))
+            self.logger.info("Remaining content: %d circuits (+%d waitings)" %
+                    (self._circuits.count(CC_STATUS.ACTIVE),
+                     self._circuits.count(CC_STATUS.WAITING)))
             return True
 
         return False
@@ -65,6 +65,21 @@ class PackUtils :
             logging.getLogger().warn("Losing a packet from scheduler-proxy: %s" % str(e))
             return None
 
+def get_shard(id, shards):
+    """
+    Index of scheduler worker owning a commands_on_host.
+
+    @param id: commands_on_host id
+    @type id: int
+
+    @param shards: number of scheduler workers
+    @type shards: int
+
+    @return: index of worker
+    @rtype: int
+    """
+    return int(id) % shards
+
 def getClientCheck(target):
     return getCheck(SchedulerConfig().client_check, {
         'uuid': target.getUUID(),
@@ -0,0 +1,226 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Pulse 2; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+# MA 02110-1301, USA.
+
+"""
+Warm restart of scheduler.
+
+State of the circuits container is periodically saved into a file
+and on shutdown. On the next start, the saved state is validated against
+the database and the detected networking info of circuits are reused,
+so the restarted circuits don't need to probe their targets again.
+
+Saved state:
+ - circuits: id, detected IP address and network
+ - bundle references
+ - stopped and started trackers
+
+The workflow of each circuit resumes from its phases states stored
+in the database, so the running phase is not saved.
+"""
+
+import os
+import json
+import time
+import logging
+
+from pulse2.scheduler.bundles import BundleElement
+from pulse2.scheduler.queries import get_restorable_cohs, get_stopped_cohs
+
+
+class WarmStart :
+    """
+    Saves and restores the state of circuits container.
+    """
+    # version of file format
+    VERSION = 1
+
+    def __init__(self, config):
+        """
+        @param config: scheduler's configuration container
+        @type config: SchedulerConfig
+        """
+        self.config = config
+        self.logger = logging.getLogger()
+
+        # {coh_id: (host, network_address)}
+        self.detected = {}
+        self._last_save = time.time()
+
+    @property
+    def enabled(self):
+        return len(self.config.warm_restart_file) > 0
+
+    def dump(self, container):
+        """
+        Extracts the state of container.
+
+        @param container: circuits container
+        @type container: MscContainer
+
+        @return: serializable state
+        @rtype: dict
+        """
+        circuits = []
+        for circuit in container._circuits :
+            if not circuit.initialized or circuit.network_address is None :
+                continue
+            circuits.append([circuit.id,
+                             circuit.host,
+                             circuit.network_address])
+
+        bundles = [[b.id, b.cmd_id, b.coh_id, b.order, b.target_uuid, b.finished]
+                    for b in container.bundles.content]
+
+        return {"version": self.VERSION,
+                "scheduler": self.config.name,
+                "time": time.time(),
+                "circuits": circuits,
+                "bundles": bundles,
+                "stopped": list(container.stopped_track.ids),
+                "started": container.started_track.ids.items(),
+                }
+
+    def save(self, container):
+        """
+        Writes the state of container into the file.
+
+        @param container: circuits container
+        @type container: MscContainer
+        """
+        if not self.enabled :
+            return
+        path = self.config.warm_restart_file
+        tmp_path = "%s.tmp" % path
+        try:
+            state = self.dump(container)
+            f = open(tmp_path, "w")
+            try:
+                json.dump(state, f)
+            finally:
+                f.close()
+            os.rename(tmp_path, path)
+            self.logger.debug("Warm restart: %d circuits saved" % len(state["circuits"]))
+        except Exception, e:
+            self.logger.warn("Warm restart: state save failed: %s" % str(e))
+
+        self._last_save = time.time()
+
+    def save_periodically(self, container):
+        """
+        Writes the state of container if the saving period elapsed.
+
+        @param container: circuits container
+        @type container: MscContainer
+        """
+        if time.time() - self._last_save >= self.config.warm_restart_period :
+            self.save(container)
+
+    def load(self):
+        """
+        Reads the saved state.
+
+        @return: saved state, or None if missing, invalid or too old
+        @rtype: dict
+        """
+        path = self.config.warm_restart_file
+        if not os.path.exists(path):
+            return None
+        try:
+            f = open(path)
+            try:
+                state = json.load(f)
+            finally:
+                f.close()
+        except Exception, e:
+            self.logger.warn("Warm restart: state load failed: %s" % str(e))
+            return None
+
+        if state.get("version") != self.VERSION :
+            self.logger.info("Warm restart: unknown format of saved state, ignored")
+            return None
+        if state.get("scheduler") != self.config.name :
+            self.logger.info("Warm restart: saved state of another scheduler, ignored")
+            return None
+        if time.time() - state["time"] > self.config.warm_restart_max_age :
+            self.logger.info("Warm restart: saved state too old, ignored")
+            return None
+        return state
+
+    def restore(self, container):
+        """
+        Restores the saved state into the container.
+
+        Only the circuits still to process (checked in one query)
+        and the still stopped circuits are restored. Circuits are not rebuilt here, they are started
+        through the usual start workflow, reusing the detected
+        networking info (see restored).
+
+        @param container: circuits container
+        @type container: MscContainer
+
+        @return: number of restored circuits
+        @rtype: int
+        """
+        if not self.enabled :
+            return 0
+        state = self.load()
+        if not state :
+            return 0
+
+        ids = [c[0] for c in state["circuits"]]
+        ids.extend([b[2] for b in state["bundles"]])
+        valid = set(get_restorable_cohs(self.config.name, list(set(ids))))
+
+        for id, host, network_address in state["circuits"] :
+            if id in valid :
+                self.detected[id] = (host, network_address)
+
+        for id, cmd_id, coh_id, order, target_uuid, finished in state["bundles"] :
+            # finished elements are kept to release the next ones in order
+            if not (finished or coh_id in valid) :
+                continue
+            if len(container.bundles.get(coh_id=coh_id)) == 0 :
+                bundle = BundleElement(id, cmd_id, coh_id, order, target_uuid)
+                bundle.finished = finished
+                container.bundles.content.append(bundle)
+
+        # stopped circuits are not to process, checked apart
+        stopped = get_stopped_cohs(self.config.name, state["stopped"])
+        container.stopped_track.add(stopped)
+        for id, timestamp in state["started"] :
+            if id in valid :
+                container.started_track.ids[id] = timestamp
+
+        self.logger.info("Warm restart: %d of %d saved circuits restored" %
+                (len(self.detected), len(state["circuits"])))
+        return len(self.detected)
+
+    def restored(self, id):
+        """
+        Gets (only once) the restored networking info of a circuit.
+
+        @param id: commands_on_host id
+        @type id: int
+
+        @return: detected IP address and network, None if not restored
+        @rtype: tuple
+        """
+        return self.detected.pop(id, None)
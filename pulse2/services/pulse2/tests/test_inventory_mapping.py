@@ -0,0 +1,117 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# $Id$
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+
+"""
+Tests for pulse2.database.inventory.mapping
+"""
+
+import os
+import tempfile
+import unittest
+
+from pulse2.database.inventory.mapping import OcsMapping
+
+MAPPING = """<?xml version="1.0" encoding="utf-8"?>
+<Mapping>
+    <MappedObject name="HARDWARE" class="Hardware">
+        <MappedField from="NAME" to="Name"/>
+        <MappedField from="OSNAME" to="OperatingSystem" type="nomenclature"/>
+        <MappedField from="WORKGROUP" to="Workgroup"/>
+    </MappedObject>
+    <MappedObject name="NETWORKS" class="Network">
+        <MappedField from="MACADDR" to="MACAddress"/>
+    </MappedObject>
+    <MappedObject name="SOFTWARES" class="Software">
+        <MappedField from="NAME" to="ProductName"/>
+    </MappedObject>
+    <MappedObject name="DEVICEID" class="Null">
+    </MappedObject>
+</Mapping>
+"""
+
+REQUEST = """<?xml version="1.0" encoding="%s" ?>
+<REQUEST>
+  <CONTENT>
+    <HARDWARE><NAME>host</NAME><OSNAME>Linux &amp; co</OSNAME><WORKGROUP/></HARDWARE>
+    <ACCESSLOG><LOGDATE>2014-01-02 03:04:05</LOGDATE></ACCESSLOG>
+    <NETWORKS><DESCRIPTION>lo</DESCRIPTION><MACADDR>00:00:00:00:00:00</MACADDR></NETWORKS>
+    <NETWORKS><DESCRIPTION>eth0</DESCRIPTION><IPADDRESS>10.0.0.2</IPADDRESS><MACADDR>00:11:22:33:44:55</MACADDR></NETWORKS>
+    <DOWNLOAD><HISTORY><SOFTWARES><NAME>%s</NAME></SOFTWARES></HISTORY></DOWNLOAD>
+    <SOFTWARES><NAME>editor</NAME></SOFTWARES>
+  </CONTENT>
+  <DEVICEID>host-2014-01-01-00-00-00</DEVICEID>
+  <TAG>entity</TAG>
+</REQUEST>
+"""
+
+class OcsMappingTests(unittest.TestCase):
+    """ Test of the streaming parse of inventories """
+
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp(suffix = '.xml')
+        os.write(fd, MAPPING)
+        os.close(fd)
+        OcsMapping().initialize(self.filename)
+
+    def tearDown(self):
+        os.unlink(self.filename)
+
+    def test_ParseRequest(self):
+        """ mapped fields, LOGDATE and TAG of a request """
+        inventory, date, tag = OcsMapping().parseRequest(REQUEST % ('UTF-8', 'caf\xc3\xa9'))
+        self.assertEqual(date, u'2014-01-02 03:04:05')
+        self.assertEqual(tag, u'entity')
+        self.assertEqual(inventory['Hardware'],
+                         [{'Name': u'host',
+                           ('nomHardwareOperatingSystem', 'OperatingSystem'): u'Linux & co'}])
+        # lo interface skipped
+        self.assertEqual(inventory['Network'], [{'MACAddress': u'00:11:22:33:44:55'}])
+        self.assertEqual(inventory['Software'],
+                         [{'ProductName': u'caf\xe9'}, {'ProductName': u'editor'}])
+        self.assertFalse('Null' in inventory)
+
+    def test_ParseRequestWithoutContent(self):
+        """ request without CONTENT section """
+        inventory, date, tag = OcsMapping().parseRequest('<REQUEST><TAG>entity</TAG></REQUEST>')
+        self.assertEqual(inventory, None)
+        self.assertEqual(date, None)
+        self.assertEqual(tag, u'entity')
+
+    def test_ParseWrongEncoding(self):
+        """ inventory not matching its declared encoding """
+        inventory = OcsMapping().parseRequest(REQUEST % ('UTF-8', 'caf\xe9'))[0]
+        self.assertEqual(inventory['Software'][0], {'ProductName': u'caf\xe9'})
+
+    def test_ParseInventory(self):
+        """ fixed inventory, rebuilt from the CONTENT section """
+        xml = '<?xml version="1.0" encoding="UTF-8" ?><Inventory>' \
+              '<HARDWARE><NAME>host<!-- c --></NAME><WORKGROUP><X/>wg</WORKGROUP></HARDWARE>' \
+              '<SOFTWARES><NAME></NAME></SOFTWARES></Inventory>'
+        inventory = OcsMapping().parse(xml)
+        self.assertEqual(inventory['Hardware'], [{'Name': u'host', 'Workgroup': None}])
+        self.assertEqual(inventory['Software'], [{}])
+        self.assertEqual(inventory['Network'], [])
+
+    def test_ParseMalformed(self):
+        """ malformed inventory """
+        self.assertRaises(Exception, OcsMapping().parse, '<Inventory><HARDWARE></Inventory>')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# $Id$
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+
+"""
+Tests for pulse2.database.inventory.rows
+"""
+
+import unittest
+
+from pulse2.database.inventory.rows import RowCache, rowKey
+
+class RowKeyTests(unittest.TestCase):
+
+    def test_Normalization(self):
+        """ case and trailing spaces are not significant """
+        self.assertEqual(rowKey({'Name': u'Firefox ', 'Size': 512}),
+                         rowKey({'Size': '512', 'Name': 'FIREFOX'}))
+        self.assertEqual(rowKey({'Name': 'caf\xc3\xa9'}), rowKey({'Name': u'CAF\xc9'}))
+        self.assertNotEqual(rowKey({'Name': u'Firefox'}), rowKey({'Name': u' Firefox'}))
+
+    def test_Null(self):
+        """ NULL differs from an empty string """
+        self.assertNotEqual(rowKey({'Name': None}), rowKey({'Name': u''}))
+
+    def test_Columns(self):
+        """ key restricted to some columns """
+        row = {'id': 3, 'Name': u'Firefox', 'Version': u'24'}
+        self.assertEqual(rowKey(row, ('Name',)), rowKey({'Name': u'firefox'}))
+        self.assertEqual(rowKey({'Name': u'Firefox'}, ('Name', 'Version')),
+                         rowKey({'Name': u'Firefox', 'Version': None}))
+
+class RowCacheTests(unittest.TestCase):
+
+    def test_LeastRecentlyUsed(self):
+        cache = RowCache(2)
+        cache.set('Software', 'a', 1)
+        cache.set('Software', 'b', 2)
+        self.assertEqual(cache.get('Software', 'a'), 1)
+        cache.set('Software', 'c', 3)
+        # 'b' was the least recently used
+        self.assertEqual(cache.get('Software', 'b'), None)
+        self.assertEqual(cache.get('Software', 'a'), 1)
+        self.assertEqual(cache.get('Software', 'c'), 3)
+        self.assertEqual(cache.get('Bios', 'a'), None)
+        self.assertEqual(cache.getStatistics(), {'size': 2, 'hits': 3, 'misses': 2})
+
+    def test_Disabled(self):
+        cache = RowCache(0)
+        cache.set('Software', 'a', 1)
+        self.assertEqual(cache.get('Software', 'a'), None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# $Id$
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+
+
+
+
+"""
+Tests for pulse2.inventoryserver.spool
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from threading import Thread
+
+from pulse2.inventoryserver.spool import InventorySpool
+
+class Config(object):
+    """ Inventory server configuration """
+
+    def __init__(self, directory):
+        self.inventory_spool_dir = directory
+        self.inventory_queue_max = 3
+
+class InventorySpoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.config = Config(os.path.join(self.tmp_dir, "spool"))
+        self.spool = InventorySpool()
+        self.spool.init(self.config)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_Fifo(self):
+        self.spool.put("dev1", "10.0.0.1", ["inv1", "text/xml"])
+        self.spool.put("dev2", "10.0.0.2", ["inv2", "text/xml"])
+        item = self.spool.take(0)
+        self.assertEqual(item[1:4], ("dev1", "10.0.0.1", ["inv1", "text/xml"]))
+        self.spool.done(item[0], item[1], True)
+        self.assertEqual(self.spool.take(0)[1], "dev2")
+
+    def test_NewestInventoryOfDevice(self):
+        self.spool.put("dev1", "10.0.0.1", ["inv1", "text/xml"])
+        self.spool.put("dev2", "10.0.0.2", ["inv2", "text/xml"])
+        self.spool.put("dev1", "10.0.0.1", ["inv1 bis", "text/xml"])
+        self.assertEqual(self.spool.getStatistics()["pending"], 2)
+        item = self.spool.take(0)
+        self.assertEqual(item[1:4], ("dev1", "10.0.0.1", ["inv1 bis", "text/xml"]))
+
+    def test_OneInventoryOfDeviceAtOnce(self):
+        self.spool.put("dev1", "10.0.0.1", ["inv1", "text/xml"])
+        item = self.spool.take(0)
+        self.spool.put("dev1", "10.0.0.1", ["inv1 bis", "text/xml"])
+        self.assertEqual(self.spool.take(0), None)
+        self.spool.done(item[0], item[1], True)
+        self.assertEqual(self.spool.take(0)[3], ["inv1 bis", "text/xml"])
+
+    def test_Persistence(self):
+        self.spool.put("dev1", "10.0.0.1", ["inv1", "text/xml"])
+        self.spool.put("dev2", "10.0.0.2", ["inv2", "text/xml"])
+        self.spool.take(0)
+        # restart while dev1 is being injected
+        self.assertEqual(self.spool.init(self.config), 2)
+        self.assertEqual(self.spool.take(0)[1], "dev1")
+        self.spool.put("dev3", "10.0.0.3", ["inv3", "text/xml"])
+        self.assertEqual(self.spool.take(0)[1], "dev2")
+        self.assertEqual(self.spool.take(0)[1], "dev3")
+
+    def test_RestartWithTwoInventoriesOfDevice(self):
+        self.spool.put("dev1", "10.0.0.1", ["inv1", "text/xml"])
+        self.spool.put("dev2", "10.0.0.2", ["inv2", "text/xml"])
+        # dev1 was being injected when its next inventory arrived
+        self.spool.take(0)
+        self.spool.put("dev1", "10.0.0.1", ["inv1 bis", "text/xml"])
+        self.assertEqual(len(os.listdir(self.config.inventory_spool_dir)), 3)
+        self.assertEqual(self.spool.init(self.config), 2)
+        self.assertEqual(len(os.listdir(self.config.inventory_spool_dir)), 2)
+        item = self.spool.take(0)
+        self.assertEqual(item[1:4], ("dev1", "10.0.0.1", ["inv1 bis", "text/xml"]))
+        self.assertEqual(self.spool.take(0)[1], "dev2")
+
+    def test_QueueFull(self):
+        for i in range(3):
+            self.assertTrue(self.spool.put("dev%d" % i, "10.0.0.1", ["inv", "text/xml"]))
+        self.assertFalse(self.spool.put("dev3", "10.0.0.1", ["inv", "text/xml"]))
+        # a pending inventory can still be replaced
+        self.assertTrue(self.spool.put("dev0", "10.0.0.1", ["inv", "text/xml"]))
+        self.assertEqual(self.spool.getStatistics()["refused"], 1)
+
+    def test_WaitingWorker(self):
+        items = []
+        worker = Thread(target = lambda: items.append(self.spool.take(5)))
+        worker.start()
+        self.spool.put("dev1", "10.0.0.1", ["inv1", "text/xml"])
+        worker.join()
+        self.assertEqual(items[0][1], "dev1")
+
+if __name__ == '__main__':
+    unittest.main()
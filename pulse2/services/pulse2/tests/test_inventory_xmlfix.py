@@ -0,0 +1,88 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# $Id$
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+
+
+
+
+"""
+Tests for pulse2.inventoryserver.xmlfix
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from pulse2.inventoryserver.xmlfix import XmlFixRegistry
+
+class Config(object):
+    """ Inventory server configuration """
+
+    def __init__(self, directory):
+        self.xmlfixplugindir = directory
+        self.xmlfix_check_interval = 0
+        self.xmlfix_stats_interval = 0
+
+class XmlFixRegistryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.write("01_upper.py", "def xml_fix(xml):\n    return xml.upper()\n")
+        self.write("02_suffix.py", "def xml_fix(xml):\n    return xml + '-fixed'\n")
+        self.write("README", "not a script")
+        self.registry = XmlFixRegistry()
+        self.registry.init(Config(self.tmp_dir))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, content, mtime = None):
+        path = os.path.join(self.tmp_dir, name)
+        f = open(path, "w")
+        f.write(content)
+        f.close()
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def test_Apply(self):
+        self.assertEqual(self.registry.apply("<xml/>"), "<XML/>-fixed")
+        stats = self.registry.getStatistics()
+        self.assertEqual(sorted(stats.keys()), ["01_upper.py", "02_suffix.py"])
+        self.assertEqual(stats["01_upper.py"]["calls"], 1)
+
+    def test_LoadedOnce(self):
+        fixers = self.registry.getFixers()
+        self.assertEqual([f[1] for f in self.registry.getFixers()], [f[1] for f in fixers])
+
+    def test_Reload(self):
+        self.write("02_suffix.py", "def xml_fix(xml):\n    return xml + '-changed'\n", time.time() + 10)
+        self.write("03_lower.py", "def xml_fix(xml):\n    return xml.lower()\n")
+        os.unlink(os.path.join(self.tmp_dir, "01_upper.py"))
+        self.assertEqual(self.registry.apply("<XML/>"), "<xml/>-changed")
+
+    def test_BrokenScript(self):
+        self.write("00_broken.py", "def xml_fix(xml):\n    raise ValueError()\n")
+        self.write("04_invalid.py", "xml_fix = 1\n")
+        self.assertEqual(self.registry.apply("<xml/>"), "<XML/>-fixed")
+        self.assertEqual(self.registry.getStatistics()["00_broken.py"]["errors"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# $Id$
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Pulse 2.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+
+"""
+Tests for the batched checks of pulse2.launcher.network
+"""
+
+import unittest
+
+from twisted.internet import defer
+
+from pulse2.launcher.config import LauncherConfig
+from pulse2.launcher.network import batchClients
+
+class BatchClientsTests(unittest.TestCase):
+
+    def setUp(self):
+        LauncherConfig.batch_concurrency = 2
+        self.pending = {}
+        self.running = 0
+        self.max_running = 0
+
+    def check(self, client, timeout):
+        """ A check ended by calling finish """
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        d = defer.Deferred()
+        self.pending[client] = d
+        return d
+
+    def finish(self, client, result):
+        self.running -= 1
+        self.pending.pop(client).callback(result)
+
+    def test_BoundedConcurrency(self):
+        results = []
+        d = batchClients(["a", "b", "c", "d"], self.check, False, 4)
+        d.addCallback(results.extend)
+        self.assertEqual(sorted(self.pending.keys()), ["a", "b"])
+
+        self.finish("b", True)
+        self.assertEqual(sorted(self.pending.keys()), ["a", "c"])
+        self.finish("a", False)
+        self.finish("c", True)
+        self.finish("d", True)
+
+        self.assertEqual(self.max_running, 2)
+        # results in the order of clients
+        self.assertEqual(results, [False, True, True, True])
+
+    def test_FailedCheck(self):
+        def check(client, timeout):
+            if client == "b":
+                raise Exception("no route")
+            return "GNU Linux"
+        results = []
+        batchClients(["a", "b"], check, "Not available", 20).addCallback(results.extend)
+        self.assertEqual(results, ["GNU Linux", "Not available"])
+
+    def test_Empty(self):
+        results = []
+        batchClients([], self.check, False, 4).addCallback(results.append)
+        self.assertEqual(results, [[]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# $Id$
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Pulse 2.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Tests for pulse2.launcher.output
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pulse2.launcher.output import OutputBuffer
+
+class OutputBufferTests(unittest.TestCase):
+
+    def test_NotBounded(self):
+        buffer = OutputBuffer()
+        for i in range(100):
+            buffer.write("line %d\n" % i)
+        self.assertEqual(buffer.getvalue(), "".join(["line %d\n" % i for i in range(100)]))
+        self.assertEqual(buffer.skipped, 0)
+
+    def test_HeadAndTail(self):
+        buffer = OutputBuffer(10, 10)
+        for i in range(1000):
+            buffer.write("0123456789")
+        self.assertEqual(buffer.received, 10000)
+        self.assertEqual(buffer.skipped, 9980)
+        self.assertEqual(buffer.getvalue(),
+                         "0123456789" + OutputBuffer.SKIP_MARKER % 9980 + "0123456789")
+        self.assertEqual(len(buffer.tail), 1)
+
+    def test_SplitChunks(self):
+        buffer = OutputBuffer(4, 3)
+        buffer.write("abcdefghij")
+        self.assertEqual(buffer.getvalue(), "abcd" + OutputBuffer.SKIP_MARKER % 3 + "hij")
+
+    def test_UTF8Boundaries(self):
+        buffer = OutputBuffer(3, 3)
+        buffer.write(u"ééééé".encode("utf-8"))
+        value = buffer.getvalue()
+        # cuts are moved on characters boundaries
+        unicode(value, "utf-8", "strict")
+        self.assertTrue(value.startswith(u"é".encode("utf-8")))
+        self.assertTrue(value.endswith(u"é".encode("utf-8")))
+
+    def test_Spill(self):
+        spill_dir = tempfile.mkdtemp()
+        try:
+            buffer = OutputBuffer(2, 2, spill_dir)
+            buffer.write("abc")
+            buffer.write("defgh")
+            self.assertEqual(buffer.getvalue(), "ab" + OutputBuffer.SKIP_MARKER % 4 + "gh")
+            buffer._spill_file.flush()
+            self.assertEqual(open(buffer.spill_path).read(), "abcdefgh")
+            path = buffer.spill_path
+            buffer.close()
+            self.assertFalse(os.path.exists(path))
+        finally:
+            shutil.rmtree(spill_dir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# $Id$
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Pulse 2.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Tests for pulse2.launcher.process_control
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import twisted.internet.reactor
+from twisted.internet.defer import Deferred
+from twisted.internet.error import ProcessDone
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+
+from pulse2.launcher.config import LauncherConfig
+from pulse2.launcher.process_control import ProcessList, commandProtocol
+
+class FakeProcess(object):
+    """ A command started by launcher """
+
+    def __init__(self, max_age=0):
+        self.done = False
+        self.killed = False
+        self.max_age = max_age
+
+    def getAge(self):
+        return 0
+
+    def sendSigKill(self):
+        self.killed = True
+        return True
+
+    def cleanUp(self):
+        pass
+
+class ProcessListTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.callLater = twisted.internet.reactor.callLater
+        twisted.internet.reactor.callLater = self.clock.callLater
+
+        ProcessList._processArr = dict()
+        ProcessList._running = set()
+        ProcessList._zombies = set()
+        ProcessList._timeouts = dict()
+        ProcessList.push_pending = True # no push to scheduler
+        self.processes = ProcessList()
+        self.processes.setup(10, 100)
+
+    def tearDown(self):
+        twisted.internet.reactor.callLater = self.callLater
+
+    def test_RunningAndZombies(self):
+        for id in range(5):
+            self.assertTrue(self.processes.addProcess(FakeProcess(), id))
+        self.assertFalse(self.processes.addProcess(FakeProcess(), 0))
+        self.assertEqual(self.processes.getRunningCount(), 5)
+
+        self.processes.processEnded(3)
+        self.assertEqual(self.processes.getRunningCount(), 4)
+        self.assertEqual(self.processes.getZombieIds(), [3])
+        self.assertTrue(self.processes.isZombie(3))
+
+        self.processes.removeProcess(3)
+        self.assertEqual(self.processes.getZombiesCount(), 0)
+        self.assertEqual(self.processes.getProcessCount(), 4)
+
+    def test_Timeouts(self):
+        default = FakeProcess()
+        own = FakeProcess(max_age=10)
+        ended = FakeProcess(max_age=10)
+        self.processes.addProcess(default, 1)
+        self.processes.addProcess(own, 2)
+        self.processes.addProcess(ended, 3)
+        self.processes.processEnded(3)
+
+        self.clock.advance(11)
+        self.assertTrue(own.killed)
+        self.assertFalse(default.killed)
+        self.assertFalse(ended.killed)
+
+        self.clock.advance(90)
+        self.assertTrue(default.killed)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 0)
+
+class CommandOutputTests(unittest.TestCase):
+    """ Files of whole output of commands """
+
+    def setUp(self):
+        self.spill_dir = tempfile.mkdtemp()
+        LauncherConfig().output_spill_dir = self.spill_dir
+        ProcessList._processArr = dict()
+        ProcessList._running = set()
+        ProcessList._zombies = set()
+        ProcessList._timeouts = dict()
+        ProcessList.push_pending = True # no push to scheduler
+        ProcessList().setup(10, 100)
+
+    def tearDown(self):
+        LauncherConfig().output_spill_dir = ""
+        shutil.rmtree(self.spill_dir)
+
+    def test_SyncCommand(self):
+        results = []
+        process = commandProtocol(["/bin/true"])
+        process.deferred = Deferred()
+        process.deferred.addCallback(lambda p: results.append(p.stdout))
+        process.outReceived("output")
+        self.assertEqual(len(os.listdir(self.spill_dir)), 1)
+        process.processEnded(Failure(ProcessDone(0)))
+        self.assertEqual(results, ["output"])
+        self.assertEqual(os.listdir(self.spill_dir), [])
+
+    def test_TrackedCommand(self):
+        process = commandProtocol(["/bin/true"])
+        process.id = 1
+        process.defer_results = True
+        ProcessList().addProcess(process, 1)
+        process.outReceived("output")
+        process.processEnded(Failure(ProcessDone(0)))
+        path = process.getState()['stdout_spill']
+        self.assertEqual(open(path).read(), "output")
+        ProcessList().removeProcess(1)
+        self.assertFalse(os.path.exists(path))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# $Id$
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Pulse 2.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+
+"""
+Tests for pulse2.launcher.ssh_master
+"""
+
+import shutil
+import tempfile
+import unittest
+
+from pulse2.launcher.config import LauncherConfig
+from pulse2.launcher.ssh_master import SSHMasterPool
+
+SSH_OPTIONS = ('ssh_multiplexing',
+               'ssh_control_dir',
+               'ssh_control_persist',
+               'ssh_max_masters')
+
+class SSHMasterPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.options = dict([(name, getattr(LauncherConfig, name)) for name in SSH_OPTIONS])
+        self.masters = SSHMasterPool.masters
+        self.tmp_dir = tempfile.mkdtemp()
+        LauncherConfig.ssh_multiplexing = True
+        LauncherConfig.ssh_control_dir = "%s/ssh" % self.tmp_dir
+        LauncherConfig.ssh_control_persist = 300
+        LauncherConfig.ssh_max_masters = 2
+        SSHMasterPool.masters = {}
+        self.pool = SSHMasterPool()
+        self.assertTrue(self.pool.setup())
+
+    def tearDown(self):
+        for name, value in self.options.items():
+            setattr(LauncherConfig, name, value)
+        SSHMasterPool.masters = self.masters
+        shutil.rmtree(self.tmp_dir)
+
+    def client(self, host):
+        return {'user': 'root', 'host': host, 'port': 22}
+
+    def test_MasterReused(self):
+        first = self.pool.getOptions(self.client("10.0.0.1"))
+        self.assertTrue("ControlMaster=auto" in first)
+        self.assertTrue("ControlPath=%s/ssh/root@10.0.0.1:22" % self.tmp_dir in first)
+        self.assertTrue("ControlPersist=300" in first)
+        self.assertEqual(self.pool.getOptions(self.client("10.0.0.1")), first)
+        self.assertEqual(len(self.pool.masters), 1)
+
+    def test_MastersCap(self):
+        self.pool.getOptions(self.client("10.0.0.1"))
+        self.pool.getOptions(self.client("10.0.0.2"))
+        options = self.pool.getOptions(self.client("10.0.0.3"))
+        self.assertTrue("ControlMaster=no" in options)
+        self.assertTrue("ControlPath=none" in options)
+        # already pooled hosts are still multiplexed
+        self.assertTrue("ControlMaster=auto" in self.pool.getOptions(self.client("10.0.0.2")))
+
+    def test_IdleMastersExpired(self):
+        self.pool.getOptions(self.client("10.0.0.1"))
+        self.pool.getOptions(self.client("10.0.0.2"))
+        key = ('root', '10.0.0.1', 22)
+        self.pool.masters[key] -= 400
+        self.assertTrue("ControlMaster=auto" in self.pool.getOptions(self.client("10.0.0.3")))
+        self.assertFalse(key in self.pool.masters)
+
+    def test_BusyMasterKept(self):
+        key = ('root', '10.0.0.1', 22)
+        self.pool.getOptions(self.client("10.0.0.1"))
+        self.pool.masters[key] -= 400
+        # socket of a master still serving a session
+        open(self.pool.controlPath(key), "w").close()
+        self.pool.expire()
+        self.assertTrue(key in self.pool.masters)
+
+    def test_Disabled(self):
+        LauncherConfig.ssh_multiplexing = False
+        self.assertFalse(self.pool.setup())
+        self.assertEqual(self.pool.getOptions(self.client("10.0.0.1")), [])
+
+if __name__ == '__main__':
+    unittest.main()
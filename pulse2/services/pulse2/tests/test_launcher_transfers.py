@@ -0,0 +1,112 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# $Id$
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Pulse 2.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+
+"""
+Tests for pulse2.launcher.transfers
+"""
+
+import unittest
+
+import twisted.internet.reactor
+from twisted.internet.task import Clock
+
+from pulse2.launcher.config import LauncherConfig
+from pulse2.launcher.transfers import TransferScheduler
+
+class TransferSchedulerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.callLater = twisted.internet.reactor.callLater
+        twisted.internet.reactor.callLater = self.clock.callLater
+
+        LauncherConfig.transfer_budget = 0
+        LauncherConfig.transfer_budgets = {"10.0.0.0": 1000000}
+        LauncherConfig.transfer_min_rate = 100000
+        LauncherConfig.transfer_admission_delay = 1
+        TransferScheduler.active = {}
+        TransferScheduler.queue = {}
+        TransferScheduler.admitted = {}
+        TransferScheduler.pending = set()
+        TransferScheduler.counters = {}
+        self.transfers = TransferScheduler()
+        # {id: bandwidth limit} of started transfers
+        self.started = {}
+
+    def tearDown(self):
+        twisted.internet.reactor.callLater = self.callLater
+
+    def request(self, id, group="10.0.0.0", maxbw=0):
+        def start(rate):
+            self.started[id] = rate
+            return True
+        return self.transfers.request(id, group, maxbw, start, "completed_push")
+
+    def test_NotLimited(self):
+        self.assertTrue(self.request(1, group="192.168.0.0", maxbw=5000))
+        self.assertEqual(self.started, {1: 5000})
+
+    def test_SharedBudget(self):
+        for id in range(4):
+            self.assertTrue(self.request(id))
+        self.assertFalse(self.request(0))
+        self.assertEqual(self.started, {})
+
+        self.clock.advance(1)
+        self.assertEqual(self.started, {0: 250000, 1: 250000, 2: 250000, 3: 250000})
+        stats = self.transfers.getStatistics()["10.0.0.0"]
+        self.assertEqual(stats["allocated"], 1000000)
+        self.assertEqual(stats["active"], 4)
+
+    def test_MaxBandwidth(self):
+        self.request(1, maxbw=100000)
+        self.request(2)
+        self.clock.advance(1)
+        self.assertEqual(self.started, {1: 100000, 2: 900000})
+
+    def test_AdmittedWhenFreed(self):
+        for id in range(12):
+            self.request(id)
+        self.clock.advance(1)
+        # min_rate bounds the number of transfers
+        self.assertEqual(len(self.started), 10)
+        self.assertEqual(self.transfers.getStatistics()["10.0.0.0"]["queued"], 2)
+
+        self.transfers.finished(0)
+        self.assertEqual(len(self.started), 11)
+        self.assertEqual(self.started[10], 100000)
+        stats = self.transfers.getStatistics()["10.0.0.0"]
+        self.assertEqual(stats["completed"], 1)
+        self.assertTrue(isinstance(stats["allocated_bandwidth_estimate"], float))
+        self.assertEqual(stats["queued"], 1)
+
+    def test_Cancel(self):
+        self.request(1)
+        self.assertTrue(self.transfers.cancel(1))
+        self.assertFalse(self.transfers.cancel(1))
+        self.clock.advance(1)
+        self.assertEqual(self.started, {})
+
+if __name__ == '__main__':
+    unittest.main()
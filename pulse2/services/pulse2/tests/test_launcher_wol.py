@@ -0,0 +1,73 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# $Id$
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Pulse 2.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+
+"""
+Tests for pulse2.launcher.wol
+"""
+
+import socket
+import unittest
+
+from pulse2.launcher.wol import magicPacket, WOLSender
+
+class WOLTests(unittest.TestCase):
+
+    def setUp(self):
+        self.receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.receiver.bind(("127.0.0.1", 0))
+        self.receiver.settimeout(1)
+        self.port = self.receiver.getsockname()[1]
+
+    def tearDown(self):
+        self.receiver.close()
+
+    def test_MagicPacket(self):
+        packet = magicPacket("00:1A:2b:3c:4d:5e")
+        self.assertEqual(len(packet), 102)
+        self.assertEqual(packet[:6], "\xff" * 6)
+        self.assertEqual(packet[6:12], "\x00\x1a\x2b\x3c\x4d\x5e")
+        self.assertEqual(packet[-6:], "\x00\x1a\x2b\x3c\x4d\x5e")
+        self.assertEqual(magicPacket("001a2b3c4d5e"), packet)
+        self.assertRaises(ValueError, magicPacket, "00:1a:2b:3c:4d")
+        self.assertRaises(ValueError, magicPacket, "00:1a:2b:3c:4d:5g")
+
+    def test_Send(self):
+        results = []
+        sender = WOLSender(self.port, repeat=2)
+        sender.send({"127.0.0.1": ["00:00:00:00:00:01", "00:00:00:00:00:02"]}).addCallback(results.append)
+        self.assertEqual(results, [{"127.0.0.1": True}])
+        received = [self.receiver.recv(1024)[-6:] for i in range(4)]
+        self.assertEqual(received, ["\x00\x00\x00\x00\x00\x01",
+                                    "\x00\x00\x00\x00\x00\x02"] * 2)
+
+    def test_InvalidAddress(self):
+        results = []
+        sender = WOLSender(self.port)
+        sender.send({"127.0.0.1": ["invalid", "00:00:00:00:00:01"]}).addCallback(results.append)
+        self.assertEqual(results, [{"127.0.0.1": False}])
+        # valid addresses are sent anyway
+        self.assertEqual(self.receiver.recv(1024)[-6:], "\x00\x00\x00\x00\x00\x01")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# $Id$
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Pulse 2.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+
+"""
+Tests for pulse2.package_server.common.hash_index
+"""
+
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+import unittest
+
+from pulse2.package_server.common.hash_index import FileHashIndex, hashFile
+
+class Config(object):
+    """ Package server configuration """
+
+    def __init__(self, filename):
+        self.package_hash_index_file = filename
+        self.package_hash_workers = 2
+
+class FileHashIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.config = Config(os.path.join(self.tmp_dir, "index"))
+        self.files = []
+        for i in range(5):
+            path = os.path.join(self.tmp_dir, "file%d" % i)
+            f = open(path, "wb")
+            f.write("content %d" % i * 1000)
+            f.close()
+            self.files.append(path)
+        self.index = FileHashIndex()
+        self.index.init(self.config)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_HashFile(self):
+        self.assertEqual(hashFile(self.files[0]),
+                         hashlib.md5("content 0" * 1000).hexdigest())
+
+    def test_Prefetch(self):
+        self.index.prefetch(self.files)
+        self.assertEqual(len(self.index.entries), 5)
+        self.assertEqual(self.index.get(self.files[1]),
+                         [9000, hashlib.md5("content 1" * 1000).hexdigest()])
+
+    def test_Persistence(self):
+        self.index.prefetch(self.files)
+        self.assertTrue(self.index.save())
+        self.assertFalse(self.index.save())
+
+        reloaded = FileHashIndex()
+        self.assertTrue(reloaded.init(self.config))
+        self.assertEqual(len(reloaded.entries), 5)
+        self.assertFalse(reloaded.changed)
+        reloaded.prefetch(self.files)
+        self.assertFalse(reloaded.changed)
+
+    def test_ChangedFile(self):
+        self.index.get(self.files[0])
+        f = open(self.files[0], "wb")
+        f.write("changed")
+        f.close()
+        os.utime(self.files[0], (time.time() + 10, time.time() + 10))
+        self.assertEqual(self.index.get(self.files[0]),
+                         [7, hashlib.md5("changed").hexdigest()])
+
+    def test_RemovedFile(self):
+        self.index.prefetch(self.files)
+        os.unlink(self.files[0])
+        self.index.save()
+        self.assertEqual(len(self.index.entries), 4)
+
+if __name__ == '__main__':
+    unittest.main()
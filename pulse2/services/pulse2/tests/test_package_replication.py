@@ -0,0 +1,108 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# $Id$
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+
+
+
+
+"""
+Tests for pulse2.package_server.common.replication
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pulse2.package_server.common.hash_index import FileHashIndex
+from pulse2.package_server.common.replication import MirrorReplication
+
+class Config(object):
+    """ Package server configuration """
+
+    def __init__(self, tmp_dir):
+        self.package_hash_index_file = os.path.join(tmp_dir, "index")
+        self.package_hash_workers = 1
+        self.package_mirror_manifest_file = os.path.join(tmp_dir, "manifests")
+        self.package_mirror_delta = True
+
+class MirrorReplicationTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp_dir, "pkg1")
+        os.makedirs(os.path.join(self.root, "bin"))
+        self.write("conf.xml", "<package/>")
+        self.write("bin/setup.exe", "setup")
+        self.config = Config(self.tmp_dir)
+        hash_index = FileHashIndex()
+        hash_index.init(self.config)
+        self.replication = MirrorReplication()
+        self.replication.init(self.config, hash_index)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, content):
+        f = open(os.path.join(self.root, name), "wb")
+        f.write(content)
+        f.close()
+
+    def test_FirstReplicationIsFull(self):
+        manifest = self.replication.manifest(self.root)
+        self.assertEqual(sorted(manifest.keys()), ["bin/setup.exe", "conf.xml"])
+        self.assertEqual(self.replication.delta("mirror1", "pkg1", manifest), None)
+
+    def test_Delta(self):
+        self.replication.start("pkg1", "mirror1", "full")
+        self.replication.finish("pkg1", "mirror1", True, self.replication.manifest(self.root))
+        self.assertEqual(self.replication.delta("mirror1", "pkg1", self.replication.manifest(self.root)), [])
+
+        self.write("bin/setup.exe", "setup v2")
+        self.write("readme.txt", "readme")
+        os.unlink(os.path.join(self.root, "conf.xml"))
+        self.assertEqual(self.replication.delta("mirror1", "pkg1", self.replication.manifest(self.root)),
+                         ["bin/setup.exe", "conf.xml", "readme.txt"])
+        # other mirrors are still to be fully replicated
+        self.assertEqual(self.replication.delta("mirror2", "pkg1", self.replication.manifest(self.root)), None)
+
+    def test_FailedReplication(self):
+        self.replication.start("pkg1", "mirror1", "full")
+        self.assertTrue(self.replication.isRunning("pkg1", "mirror1"))
+        self.replication.finish("pkg1", "mirror1", False, self.replication.manifest(self.root))
+        self.assertFalse(self.replication.isRunning("pkg1", "mirror1"))
+        self.assertEqual(self.replication.delta("mirror1", "pkg1", self.replication.manifest(self.root)), None)
+        self.assertEqual(self.replication.getStatistics()["mirror1"]["failed"], 1)
+
+    def test_ManifestsSaved(self):
+        self.replication.start("pkg1", "mirror1", "full")
+        self.replication.finish("pkg1", "mirror1", True, self.replication.manifest(self.root))
+        manifests = self.replication.manifests
+        self.replication.init(self.config, self.replication.hash_index)
+        self.assertEqual(self.replication.manifests, manifests)
+
+    def test_FileList(self):
+        filename = self.replication.writeFileList("pkg1", ["bin/setup.exe", "conf.xml"])
+        try:
+            self.assertEqual(open(filename).read(), "pkg1/bin/setup.exe\npkg1/conf.xml\n")
+        finally:
+            os.unlink(filename)
+
+if __name__ == '__main__':
+    unittest.main()
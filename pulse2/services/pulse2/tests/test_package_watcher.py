@@ -0,0 +1,95 @@
+# -*- coding: utf-8; -*-
+#
+# (c) 2014 Mandriva, http://www.mandriva.com/
+#
+# $Id$
+#
+# This file is part of Pulse 2, http://pulse2.mandriva.org
+#
+# Pulse 2 is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Pulse 2 is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+
+
+
+
+"""
+Tests for pulse2.package_server.common.watcher
+"""
+
+import unittest
+
+from twisted.internet import task
+
+from pulse2.package_server.common.watcher import PackageWatcher
+
+class Config(object):
+    """ Package server configuration """
+    package_detect_debounce = 10
+
+class PackageWatcherTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.detected = []
+        self.busy = False
+        self.watcher = PackageWatcher()
+        self.watcher.init(Config(), self.detect, self.clock)
+        self.watcher.sources = ["/var/lib/pulse2/packages/sub", "/var/lib/pulse2/packages"]
+
+    def detect(self, proot):
+        if self.busy:
+            return False
+        self.detected.append(proot)
+        return True
+
+    def test_PackageRoot(self):
+        self.assertEqual(self.watcher.packageRoot("/var/lib/pulse2/packages/pkg1/bin/setup.exe"),
+                         "/var/lib/pulse2/packages/pkg1")
+        self.assertEqual(self.watcher.packageRoot("/var/lib/pulse2/packages/sub/pkg2/conf.xml"),
+                         "/var/lib/pulse2/packages/sub/pkg2")
+        self.assertEqual(self.watcher.packageRoot("/var/lib/pulse2/packages"), None)
+        self.assertEqual(self.watcher.packageRoot("/tmp/pkg1"), None)
+
+    def test_Debounce(self):
+        self.watcher.notify("/var/lib/pulse2/packages/pkg1/conf.xml")
+        self.clock.advance(6)
+        self.watcher.notify("/var/lib/pulse2/packages/pkg1/data.bin")
+        self.clock.advance(6)
+        self.assertEqual(self.detected, [])
+        self.clock.advance(4)
+        self.assertEqual(self.detected, ["/var/lib/pulse2/packages/pkg1"])
+        self.assertEqual(self.watcher.pending, {})
+
+    def test_PackagesDetectedApart(self):
+        self.watcher.notify("/var/lib/pulse2/packages/pkg1/conf.xml")
+        self.watcher.notify("/var/lib/pulse2/packages/pkg2/conf.xml")
+        self.clock.advance(10)
+        self.detected.sort()
+        self.assertEqual(self.detected, ["/var/lib/pulse2/packages/pkg1",
+                                         "/var/lib/pulse2/packages/pkg2"])
+
+    def test_IgnoreMD5SUMS(self):
+        self.watcher.notify("/var/lib/pulse2/packages/pkg1/MD5SUMS")
+        self.clock.advance(10)
+        self.assertEqual(self.detected, [])
+
+    def test_RetryWhenBusy(self):
+        self.busy = True
+        self.watcher.notify("/var/lib/pulse2/packages/pkg1/conf.xml")
+        self.clock.advance(10)
+        self.assertEqual(self.detected, [])
+        self.busy = False
+        self.clock.advance(10)
+        self.assertEqual(self.detected, ["/var/lib/pulse2/packages/pkg1"])
+
+if __name__ == '__main__':
+    unittest.main()